@@ -0,0 +1,256 @@
+"""
+End-to-end training throughput of the agents on the Synthetic task, which needs neither isaacgym nor a GPU.
+Every algorithm runs its training config (with the task swapped for Synthetic) in a fresh process, a few warmup
+epochs are dropped and the rest are timed. Writes a JSON report, pass an older one with --baseline to diff them.
+
+    python -m isaacgymenvs.benchmarks.bench_agents --device cpu --num_envs 256 --out bench_agents.json
+    python -m isaacgymenvs.benchmarks.bench_agents --device cuda:0 --baseline bench_agents.json
+"""
+import argparse
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+
+# algorithm -> (train config, extra hydra overrides)
+ALGOS = {
+    'a2c_continuous': ('FrankaPushingPPO', []),
+    'gc_a2c_continuous': ('FrankaPushingPAWR', []),
+    'sac': ('FrankaPushingSAC', ['train.params.config.num_warmup_steps=1']),
+    'redq_original': ('FrankaPushingREDQO', ['train.params.config.num_warmup_steps=1']),
+    'amp': ('others/HumanoidAMPPPO', ['task.env.numAMPObs=64']),
+}
+
+
+def compose_config(algo, args):
+    import isaacgymenvs  # registers the config resolvers
+    from hydra import compose, initialize
+    from omegaconf import OmegaConf
+
+    train, overrides = ALGOS[algo]
+    overrides = overrides + [
+        'task=Synthetic', f'train={train}', f'num_envs={args.num_envs}', f'seed={args.seed}',
+        f'sim_device={args.device}', f'rl_device={args.device}', 'headless=True',
+        f'task.env.stepCost={args.step_cost}', f'task.env.resetPattern={args.reset_pattern}',
+    ]
+    if algo in ['sac', 'redq_original']:
+        overrides.append(f'train.params.config.replay_buffer_size={args.replay_buffer_size}')
+    if algo == 'amp':
+        # the AMP config is sized for 4096 humanoids
+        overrides.append(f'train.params.config.minibatch_size={args.num_envs * 16 // 4}')
+    with initialize(config_path='../cfg'):
+        cfg = compose(config_name='config', overrides=overrides)
+    OmegaConf.set_struct(cfg, False)
+    cfg.full_experiment_name = f'bench_{algo}'
+    OmegaConf.set_struct(cfg, True)
+    return cfg
+
+
+def build_runner(algo, cfg, train_dir):
+    from rl_games.common import env_configurations, vecenv
+    import isaacgymenvs
+    from isaacgymenvs.learning import amp_continuous, amp_models, amp_network_builder, amp_players
+    from isaacgymenvs.ppo import model_builder
+    from isaacgymenvs.ppo.torch_runner import Runner
+    from isaacgymenvs.train import preprocess_train_config
+    from isaacgymenvs.utils.reformat import omegaconf_to_dict
+    from isaacgymenvs.utils.rlgames_utils import RLGPUAlgoObserver, RLGPUEnv
+
+    class LegacyStepEnv(RLGPUEnv):
+        # the AMP agent is built on rl_games, which still expects (obs, rewards, dones, infos)
+        def step(self, actions):
+            obs, rewards, terminated, truncated, infos = self.env.step(actions)
+            return obs, rewards, terminated | truncated, infos
+
+    env_configurations.register('rlgpu', {
+        'vecenv_type': 'RLGPU',
+        'env_creator': lambda **kwargs: isaacgymenvs.make(cfg.seed, cfg.task_name, cfg.task.env.numEnvs, cfg.sim_device,
+                                                          cfg.rl_device, cfg.graphics_device_id, cfg.headless, cfg=cfg),
+    })
+    env_cls = LegacyStepEnv if algo == 'amp' else RLGPUEnv
+    vecenv.register('RLGPU', lambda config_name, num_actors, **kwargs: env_cls(config_name, num_actors, **kwargs))
+
+    rlg_config_dict = preprocess_train_config(cfg, omegaconf_to_dict(cfg.train))
+    rlg_config_dict['params']['config']['train_dir'] = train_dir
+
+    runner = Runner(RLGPUAlgoObserver(cfg.full_experiment_name))
+    runner.algo_factory.register_builder('amp_continuous', lambda **kwargs: amp_continuous.AMPAgent(**kwargs))
+    runner.player_factory.register_builder('amp_continuous', lambda **kwargs: amp_players.AMPPlayerContinuous(**kwargs))
+    model_builder.register_model('continuous_amp', lambda network, **kwargs: amp_models.ModelAMPContinuous(network))
+    model_builder.register_network('amp', lambda **kwargs: amp_network_builder.AMPBuilder())
+    runner.load(rlg_config_dict)
+    return runner
+
+
+def build_agent(algo, cfg, train_dir):
+    runner = build_runner(algo, cfg, train_dir)
+    return runner.algo_factory.create(runner.algo_name, base_name='run', params=runner.params)
+
+
+def build_player(algo, cfg, train_dir):
+    runner = build_runner(algo, cfg, train_dir)
+    # the players default to cuda
+    runner.params['config']['device_name'] = cfg.rl_device
+    return runner.create_player()
+
+
+# the steps of each agent's train() loop around train_epoch(), without the logging, checkpoints and tests
+
+def start_on_policy(agent):
+    agent.init_tensors()
+    agent.obs = agent.env_reset()
+    agent.curr_frames = agent.batch_size_envs
+
+
+def epoch_on_policy(agent):
+    agent.update_epoch()
+    step_time, play_time, update_time, total_time = agent.train_epoch()[:4]
+    agent.dataset.update_values_dict(None)
+    if agent.relabel:
+        agent.relabeled_dataset.update_values_dict(None)
+    agent.frame += agent.curr_frames
+    return agent.curr_frames, play_time, update_time, total_time
+
+
+def start_off_policy(agent):
+    agent.init_tensors()
+    agent.algo_observer.after_init(agent)
+    agent.obs = agent.env_reset()
+
+
+def epoch_off_policy(agent):
+    agent.epoch_num += 1
+    step_time, play_time, update_time, total_time = agent.train_epoch()[:4]
+    return agent.num_frames_per_epoch, play_time, update_time, total_time
+
+
+def start_amp(agent):
+    start_on_policy(agent)
+    agent._init_train()
+
+
+def epoch_amp(agent):
+    agent.update_epoch()
+    train_info = agent.train_epoch()
+    agent.frame += agent.curr_frames
+    return agent.curr_frames, train_info['play_time'], train_info['update_time'], train_info['total_time']
+
+
+LOOPS = {
+    'a2c_continuous': (start_on_policy, epoch_on_policy),
+    'gc_a2c_continuous': (start_on_policy, epoch_on_policy),
+    'sac': (start_off_policy, epoch_off_policy),
+    'redq_original': (start_off_policy, epoch_off_policy),
+    'amp': (start_amp, epoch_amp),
+}
+
+
+def run_single(algo, args):
+    try:
+        import isaacgym
+    except ImportError:
+        pass
+    import torch
+
+    cfg = compose_config(algo, args)
+    with tempfile.TemporaryDirectory() as train_dir:
+        agent = build_agent(algo, cfg, train_dir)
+        start, epoch = LOOPS[algo]
+        start(agent)
+        for _ in range(args.warmup):
+            epoch(agent)
+        if torch.cuda.is_available():
+            torch.cuda.synchronize()
+            torch.cuda.reset_peak_memory_stats()
+
+        frames, play_time, update_time = 0, [], []
+        wall_start = time.perf_counter()
+        for _ in range(args.epochs):
+            f, p, u, _ = epoch(agent)
+            frames += f
+            play_time.append(p)
+            update_time.append(u)
+        if torch.cuda.is_available():
+            torch.cuda.synchronize()
+        wall = time.perf_counter() - wall_start
+
+    result = {
+        'env_steps_per_sec': frames / wall,
+        'play_steps_per_sec': frames / sum(play_time),
+        'epoch_time': wall / args.epochs,
+        'play_time': sum(play_time) / args.epochs,
+        'update_time': sum(update_time) / args.epochs,
+        'frames_per_epoch': frames / args.epochs,
+        'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        'peak_device_mb': torch.cuda.max_memory_allocated() / 2 ** 20 if torch.cuda.is_available() else 0,
+    }
+    print(json.dumps(result))
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True,
+                              cwd=os.path.dirname(__file__)).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--algos', nargs='+', default=list(ALGOS.keys()), choices=list(ALGOS.keys()))
+    parser.add_argument('--device', default='cpu')
+    parser.add_argument('--num_envs', type=int, default=256)
+    parser.add_argument('--step_cost', type=int, default=1)
+    parser.add_argument('--reset_pattern', default='staggered', choices=['synchronized', 'staggered', 'random'])
+    parser.add_argument('--replay_buffer_size', type=int, default=1_000_000)
+    parser.add_argument('--warmup', type=int, default=3)
+    parser.add_argument('--epochs', type=int, default=10)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--out', default='bench_agents.json')
+    parser.add_argument('--baseline', default=None, help='earlier report to compare against')
+    parser.add_argument('--single', default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.single is not None:
+        run_single(args.single, args)
+        return
+
+    report = {
+        'commit': git_commit(),
+        'host': platform.node(),
+        'args': {k: v for k, v in vars(args).items() if k not in ['out', 'baseline', 'single']},
+        'results': {},
+    }
+    baseline = None
+    if args.baseline is not None:
+        with open(args.baseline) as f:
+            baseline = json.load(f)['results']
+
+    print(f'{"algo":<18} {"steps/s":>10} {"play/s":>10} {"update s":>9} {"rss MB":>8} {"dev MB":>8}' + (f' {"vs base":>8}' if baseline else ''))
+    for algo in args.algos:
+        cmd = [sys.executable, '-m', 'isaacgymenvs.benchmarks.bench_agents', '--single', algo] + sys.argv[1:]
+        proc = subprocess.run(cmd, capture_output=True, text=True)
+        if proc.returncode != 0:
+            print(f'{algo:<18} failed: {proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else proc.returncode}')
+            report['results'][algo] = None
+            continue
+        r = json.loads(proc.stdout.strip().splitlines()[-1])
+        report['results'][algo] = r
+        line = (f'{algo:<18} {r["env_steps_per_sec"]:>10.0f} {r["play_steps_per_sec"]:>10.0f} {r["update_time"]:>9.3f} '
+                f'{r["peak_rss_mb"]:>8.0f} {r["peak_device_mb"]:>8.0f}')
+        if baseline and baseline.get(algo):
+            line += f' {r["env_steps_per_sec"] / baseline[algo]["env_steps_per_sec"]:>7.2f}x'
+        print(line)
+
+    with open(args.out, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f'wrote {args.out}')
+
+
+if __name__ == '__main__':
+    main()
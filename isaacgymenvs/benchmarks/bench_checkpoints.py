@@ -0,0 +1,204 @@
+"""
+Training stall per checkpoint with the checkpoint and the replay buffer written inline (torch_ext.save_checkpoint and
+VectorizedReplayBuffer.save, as SACAgent did) or through CheckpointManager. A fake training loop of matmuls saves an
+actor-critic with Adam states and a full replay buffer every --save_every iterations, the stall is the time the loop
+loses against a run without saves. Checks first the round trip of checkpoints and a prioritized replay buffer with and
+without compression, retention, latest_checkpoint() and that the host buffers are reused between saves, then that the
+PPO and AMP players and the evaluation worker's checkpoint reload read a compressed checkpoint of the agent.
+
+    python -m isaacgymenvs.benchmarks.bench_checkpoints --device cuda:0 --capacity 32000000
+"""
+import argparse
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+import torch
+from torch import nn
+
+from isaacgymenvs.benchmarks.bench_agents import build_agent, build_player, compose_config
+from isaacgymenvs.ppo import torch_ext
+from isaacgymenvs.sac import experience
+from isaacgymenvs.utils.checkpoints import CheckpointManager, latest_checkpoint, load_index
+
+
+def make_state(args):
+    model = nn.Sequential(*[nn.Linear(args.width, args.width) for _ in range(args.layers)]).to(args.device)
+    optimizer = torch.optim.Adam(model.parameters())
+    model(torch.randn(8, args.width, device=args.device)).sum().backward()
+    optimizer.step()
+    return model, optimizer
+
+
+def make_buffer(args):
+    buffer = experience.VectorizedReplayBuffer((args.obs_dim,), (args.action_dim,), args.capacity, args.device, args.precision)
+    for t in [buffer.obses, buffer.next_obses, buffer.actions, buffer.rewards]:
+        t.normal_()
+    buffer.dones.fill_(False)
+    buffer.full = True
+    return buffer
+
+
+def full_state(model, optimizer, epoch):
+    return {'model': model.state_dict(), 'optimizer': optimizer.state_dict(), 'epoch': epoch, 'frame': epoch * 100}
+
+
+def check(args):
+    model, optimizer = make_state(args)
+    buffer = experience.PrioritizedVectorizedReplayBuffer((4,), (2,), 64, args.device)
+    dones = torch.zeros(10, 1, dtype=torch.bool, device=args.device)
+    buffer.add(*[torch.randn(10, d, device=args.device) for d in [4, 2, 1, 4]], dones, dones)
+    buffer.update_priorities(torch.arange(10, device=args.device), torch.rand(10, device=args.device))
+    with tempfile.TemporaryDirectory() as nn_dir:
+        for compression in [0, 1]:
+            manager = CheckpointManager(nn_dir, keep_last=2, keep_best=2, compression=compression)
+            for epoch in range(5):
+                state = full_state(model, optimizer, epoch)
+                manager.save(os.path.join(nn_dir, f'last_ep_{epoch}'), state, kind='last')
+                manager.save(os.path.join(nn_dir, f'best_ep_{epoch}'), state, kind='best', score=float(epoch % 3),
+                             link=os.path.join(nn_dir, 'run'))
+            manager.save_files(buffer.checkpoint_files(os.path.join(nn_dir, 'rb')))
+            manager.flush()
+            # the checkpoints of the same model share their host buffers, at most max_pending are kept
+            pools = manager.pools['checkpoint']
+            assert 0 < len(pools) <= manager.max_pending
+            ptrs = {t.data_ptr() for pool in pools for t in pool.values()}
+            manager.save(os.path.join(nn_dir, 'last_ep_4'), full_state(model, optimizer, 4), kind='last')
+            manager.flush()
+            assert ptrs == {t.data_ptr() for pool in manager.pools['checkpoint'] for t in pool.values()}
+            expected = {k: v.cpu().clone() for k, v in model.state_dict().items()}
+            # the snapshot is taken at save(), later changes to the weights do not leak into the file
+            with torch.no_grad():
+                for p in model.parameters():
+                    p.add_(1)
+            manager.close()
+
+            files = sorted(f for f in os.listdir(nn_dir) if f.endswith('.pth'))
+            assert files == ['best_ep_1.pth', 'best_ep_2.pth', 'last_ep_3.pth', 'last_ep_4.pth', 'run.pth'], files
+            assert not any(f.endswith('.tmp') for f in os.listdir(nn_dir))
+            assert [e['epoch'] for e in load_index(nn_dir) if e['kind'] == 'best'] == [1, 2]
+            # last_ep_4 was written again after run
+            assert latest_checkpoint(nn_dir) == os.path.join(nn_dir, 'last_ep_4.pth')
+
+            loaded = torch_ext.load_checkpoint(os.path.join(nn_dir, 'last_ep_4.pth'))
+            assert loaded['epoch'] == 4
+            for k, v in model.state_dict().items():
+                assert torch.equal(loaded['model'][k], expected[k]), k
+            assert torch.equal(loaded['optimizer']['state'][0]['exp_avg'], optimizer.state_dict()['state'][0]['exp_avg'].cpu())
+
+            with open(os.path.join(nn_dir, 'rb', 'buffer.pt'), 'rb') as f:
+                assert (f.read(2) == b'\x1f\x8b') == (compression > 0)
+            restored = experience.PrioritizedVectorizedReplayBuffer((4,), (2,), 64, args.device)
+            restored.load(os.path.join(nn_dir, 'rb'))
+            assert restored.idx == buffer.idx and torch.equal(restored.obses[:10], buffer.obses[:10])
+            assert torch.equal(restored.it_sum.value, buffer.it_sum.value)
+            assert torch.equal(restored.max_priority, buffer.max_priority)
+            shutil.rmtree(nn_dir)
+            os.makedirs(nn_dir)
+
+
+def check_players(args):
+    agent_args = argparse.Namespace(num_envs=16, seed=0, device=args.device, step_cost=1, reset_pattern='staggered')
+    for algo in ['a2c_continuous', 'amp']:
+        cfg = compose_config(algo, agent_args)
+        with tempfile.TemporaryDirectory() as train_dir:
+            agent = build_agent(algo, cfg, train_dir)
+            with torch.no_grad():
+                for p in agent.model.parameters():
+                    p.normal_()
+            fn = os.path.join(train_dir, 'compressed')
+            manager = CheckpointManager(train_dir, compression=1)
+            manager.save(fn, agent.get_full_state_weights(), kind='last')
+            manager.close()
+            with open(fn + '.pth', 'rb') as f:
+                assert f.read(2) == b'\x1f\x8b'
+
+            player = build_player(algo, cfg, train_dir)
+            player.restore(fn + '.pth')
+            expected = agent.model.state_dict()
+            for k, v in player.model.state_dict().items():
+                assert torch.equal(v.cpu(), expected[k].cpu()), (algo, k)
+
+            # the evaluation worker probes the file before restoring it, a compressed one is not taken for corrupted
+            with torch.no_grad():
+                for p in player.model.parameters():
+                    p.zero_()
+            player.checkpoint_mutex = threading.Lock()
+            player.checkpoint_to_load = fn + '.pth'
+            player.maybe_load_new_checkpoint()
+            for k, v in player.model.state_dict().items():
+                assert torch.equal(v.cpu(), expected[k].cpu()), (algo, k)
+
+
+def run(mode, args, save_dir, model, optimizer, buffer):
+    weights = torch.randn(args.mat, args.mat, device=args.device) / args.mat ** 0.5
+    x = torch.randn(args.mat, args.mat, device=args.device)
+    manager = CheckpointManager(save_dir, keep_last=2) if mode == 'background' else None
+    stalls = []
+    start = time.perf_counter()
+    for it in range(1, args.iterations + 1):
+        for _ in range(args.work):
+            x = torch.tanh(x @ weights)
+        if mode == 'none' or it % args.save_every != 0:
+            continue
+        state = full_state(model, optimizer, it)
+        fn = os.path.join(save_dir, f'last_ep_{it}')
+        rb_path = os.path.join(save_dir, 'last_replay_buffer')
+        save_start = time.perf_counter()
+        if mode == 'inline':
+            torch_ext.save_checkpoint(fn, state)
+            buffer.save(rb_path)
+        else:
+            manager.save(fn, state, kind='last')
+            manager.save_files(buffer.checkpoint_files(rb_path))
+        stalls.append(time.perf_counter() - save_start)
+    if args.device.startswith('cuda'):
+        torch.cuda.synchronize()
+    elapsed = time.perf_counter() - start
+    if manager is not None:
+        manager.close()
+    return elapsed, stalls
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--device', default='cuda:0' if torch.cuda.is_available() else 'cpu')
+    parser.add_argument('--capacity', type=int, default=32_000_000)
+    parser.add_argument('--obs_dim', type=int, default=16)
+    parser.add_argument('--action_dim', type=int, default=8)
+    parser.add_argument('--precision', default='float16')
+    parser.add_argument('--width', type=int, default=1024)
+    parser.add_argument('--layers', type=int, default=4)
+    parser.add_argument('--iterations', type=int, default=300)
+    parser.add_argument('--work', type=int, default=20, help='matmuls per training iteration')
+    parser.add_argument('--mat', type=int, default=2048)
+    parser.add_argument('--save_every', type=int, default=100)
+    parser.add_argument('--dir', default=None, help='where to write, defaults to a temporary directory')
+    args = parser.parse_args()
+
+    check(args)
+    print('checkpoints and replay buffers round trip with and without compression, retention keeps last 2 and best 2')
+    check_players(args)
+    print('the players and the evaluation worker load compressed checkpoints')
+
+    model, optimizer = make_state(args)
+    buffer = make_buffer(args)
+    rb_mb = sum(t.numel() * t.element_size() for t in [buffer.obses, buffer.next_obses, buffer.actions, buffer.rewards, buffer.dones]) / 2 ** 20
+    print(f'replay buffer of {args.capacity} transitions, {rb_mb:.0f} MB')
+
+    results = {}
+    for mode in ['none', 'inline', 'background']:
+        with tempfile.TemporaryDirectory(dir=args.dir) as save_dir:
+            results[mode] = run(mode, args, save_dir, model, optimizer, buffer)
+    base = results['none'][0]
+    print(f'{"saves":>11} {"loop s":>8} {"stall/save s":>13} {"in save() s":>12}')
+    for mode, (elapsed, stalls) in results.items():
+        stall = (elapsed - base) / len(stalls) if stalls else 0.0
+        call = sum(stalls) / len(stalls) if stalls else 0.0
+        print(f'{mode:>11} {elapsed:>8.2f} {stall:>13.3f} {call:>12.3f}')
+
+
+if __name__ == '__main__':
+    main()
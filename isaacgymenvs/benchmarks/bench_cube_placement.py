@@ -0,0 +1,85 @@
+"""
+Reset latency of the FrankaPushing cube placement: the old per-cube rejection loop against the batched
+sample_separated_positions. Also counts the envs that end up with overlapping cubes and checks that every env
+reported as valid really is collision-free.
+
+    python -m isaacgymenvs.benchmarks.bench_cube_placement --device cuda:0
+"""
+import argparse
+import time
+
+import numpy as np
+import torch
+
+from isaacgymenvs.tasks.utils.placement import grid_capacity, sample_separated_positions
+
+
+def rejection_sampling(num_envs, num_cubes, noise, min_dist, device):
+    # the loop FrankaPushing._reset_init_cube_state used to run for every cube
+    positions = torch.zeros(num_cubes, num_envs, 3, device=device)
+    positions[0] = 2.0 * noise * (torch.rand(num_envs, 3, device=device) - 0.5)
+    for cube in range(1, num_cubes):
+        sampled = torch.zeros(num_envs, 3, device=device)
+        active_idx = torch.arange(num_envs, device=device)
+        for i in range(100):
+            sampled[active_idx] = 2.0 * noise * (torch.rand_like(sampled[active_idx]) - 0.5)
+            cube_dist = torch.linalg.norm(sampled[None] - positions[:cube], dim=-1)
+            active_idx = torch.nonzero((cube_dist < min_dist).sum(0), as_tuple=True)[0]
+            if len(active_idx) == 0:
+                break
+        positions[cube] = sampled
+    return positions.transpose(0, 1)
+
+
+def batched_sampling(num_envs, num_cubes, noise, min_dist, device):
+    positions, valid = sample_separated_positions(num_envs, num_cubes, [noise] * 3, min_dist, device=device)
+    return positions, valid
+
+
+def collisions(positions, min_dist):
+    dists = torch.cdist(positions, positions)
+    dists = dists + torch.eye(positions.shape[1], device=positions.device) * 1e9
+    return (dists < min_dist - 1e-6).any(-1).any(-1)
+
+
+def time_fn(fn, args, repeats, device):
+    fn(*args)
+    if device.startswith('cuda'):
+        torch.cuda.synchronize()
+    start = time.perf_counter()
+    for _ in range(repeats):
+        fn(*args)
+    if device.startswith('cuda'):
+        torch.cuda.synchronize()
+    return (time.perf_counter() - start) / repeats
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--num_envs', type=int, default=4096)
+    parser.add_argument('--cubes', type=int, nargs='+', default=list(range(1, 9)))
+    parser.add_argument('--noise', type=float, default=0.12, help='startPositionNoise')
+    parser.add_argument('--cube_size', type=float, default=0.07)
+    parser.add_argument('--repeats', type=int, default=10)
+    parser.add_argument('--device', default='cpu')
+    args = parser.parse_args()
+
+    min_dist = 2 * args.cube_size * np.sqrt(2) / 2.0 * 2.0
+    print(f'min dist {min_dist:.3f}, grid capacity {grid_capacity([args.noise] * 3, min_dist)} cubes')
+    print(f'{"cubes":>6} {"loop ms":>9} {"batched ms":>11} {"speedup":>8} {"loop overlaps":>14} {"batched overlaps":>17} {"reported":>9}')
+    for num_cubes in args.cubes:
+        t_loop = time_fn(rejection_sampling, (args.num_envs, num_cubes, args.noise, min_dist, args.device), args.repeats, args.device)
+        t_batched = time_fn(batched_sampling, (args.num_envs, num_cubes, args.noise, min_dist, args.device), args.repeats, args.device)
+
+        loop_overlaps = collisions(rejection_sampling(args.num_envs, num_cubes, args.noise, min_dist, args.device), min_dist)
+        positions, valid = batched_sampling(args.num_envs, num_cubes, args.noise, min_dist, args.device)
+        batched_overlaps = collisions(positions, min_dist)
+        assert not (batched_overlaps & valid).any(), 'an env reported as valid has overlapping cubes'
+        assert (positions.abs() <= args.noise + 1e-6).all(), 'cubes placed outside of the sampling box'
+
+        print(f'{num_cubes:>6} {t_loop * 1e3:>9.2f} {t_batched * 1e3:>11.2f} {t_loop / t_batched:>7.1f}x '
+              f'{int(loop_overlaps.sum()):>14} {int(batched_overlaps.sum()):>17} {int((~valid).sum()):>9}')
+
+
+if __name__ == '__main__':
+    main()
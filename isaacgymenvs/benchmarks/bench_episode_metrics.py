@@ -0,0 +1,156 @@
+"""
+Rollout overhead of the episode metric aggregation in RLGPUAlgoObserver.process_infos: the old per-step host copies
+and per-done-env loops against the device-resident EpisodeMetrics, for 10, 50 and 200 metrics. With synchronized
+resets both give the same episodic statistics, which is checked before timing.
+
+    python -m isaacgymenvs.benchmarks.bench_episode_metrics --device cuda:0
+"""
+import argparse
+import time
+from collections import deque
+
+import numpy as np
+import torch
+
+from isaacgymenvs.utils.episode_metrics import EpisodeMetrics, register_episode_metric
+
+
+class OldAggregation:
+    # the aggregation RLGPUAlgoObserver.process_infos and after_print_stats used to do
+    def __init__(self, games_to_track=100):
+        self.games_to_track = games_to_track
+        self.episode_cumulative = dict()
+        self.episode_cumulative_avg = dict()
+        self.episodic = dict()
+        self.episodic_stats = dict()
+
+    def process_infos(self, infos, done_indices):
+        if 'episode_cumulative' in infos:
+            for key, value in infos['episode_cumulative'].items():
+                if key not in self.episode_cumulative:
+                    self.episode_cumulative[key] = torch.zeros_like(value)
+                self.episode_cumulative[key] += value
+            for done_idx in done_indices:
+                done_idx = done_idx.item()
+                for key, value in infos['episode_cumulative'].items():
+                    if key not in self.episode_cumulative_avg:
+                        self.episode_cumulative_avg[key] = deque([], maxlen=self.games_to_track)
+                    self.episode_cumulative_avg[key].append(self.episode_cumulative[key][done_idx].item())
+                    self.episode_cumulative[key][done_idx] = 0
+
+        if 'episodic' in infos:
+            for key, value in infos['episodic'].items():
+                if key not in self.episodic:
+                    self.episodic[key] = []
+                self.episodic[key].append(value.cpu().numpy())
+            if len(done_indices) > 0:
+                for key, value in infos['episodic'].items():
+                    if key not in self.episodic_stats:
+                        self.episodic_stats[key] = dict()
+                    data = np.stack(self.episodic[key])
+                    self.episodic_stats[key]['avg'] = data.mean(0)
+                    self.episodic_stats[key]['min'] = data.min(0)
+                    self.episodic_stats[key]['max'] = data.max(0)
+                    self.episodic_stats[key]['last'] = data[-1]
+                    if key == 'goal_dist' and data.shape[0] > 10:
+                        self.episodic_stats[key]['improvement'] = data[10] - data[-1]
+                        self.episodic_stats[key]['displacement'] = np.abs(data[-1] - data[10])
+                    self.episodic[key] = []
+
+    def summary(self):
+        stats = {k: {s: float(np.mean(v)) for s, v in d.items()} for k, d in self.episodic_stats.items()}
+        for key, values in self.episode_cumulative_avg.items():
+            stats[key] = {'sum': np.mean(values), 'sum_min': np.min(values), 'sum_max': np.max(values)}
+        self.episodic_stats = dict()
+        return stats
+
+
+class NewAggregation:
+    def __init__(self):
+        self.metrics = dict()
+
+    def process_infos(self, infos, done_indices):
+        for info_key in ['episode_cumulative', 'episodic']:
+            if info_key not in infos:
+                continue
+            values = infos[info_key]
+            if info_key not in self.metrics:
+                self.metrics[info_key] = EpisodeMetrics(values.keys(), len(next(iter(values.values()))), done_indices.device)
+            metrics = self.metrics[info_key]
+            done_mask = None
+            if len(done_indices) > 0:
+                done_mask = torch.zeros(metrics.num_envs, dtype=torch.bool, device=metrics.device)
+                done_mask[done_indices.view(-1)] = True
+            metrics.update(values, done_mask)
+
+    def summary(self):
+        stats = {}
+        for metrics in self.metrics.values():
+            stats.update(metrics.summary())
+        return stats
+
+
+def rollout(aggregation, num_envs, num_metrics, num_steps, episode_length, staggered, device, print_every=None):
+    keys = ['goal_dist'] + [f'metric_{i}' for i in range(num_metrics - 1)]
+    progress = torch.zeros(num_envs, dtype=torch.long, device=device)
+    if staggered:
+        progress = torch.randint(0, episode_length, (num_envs,), device=device)
+    summaries = []
+    for step in range(num_steps):
+        values = torch.rand(num_metrics, num_envs, device=device)
+        infos = {'episodic': dict(zip(keys, values)), 'episode_cumulative': {'reward': values[0]}}
+        progress += 1
+        dones = progress >= episode_length
+        progress.masked_fill_(dones, 0)
+        done_indices = dones.nonzero(as_tuple=False)
+        aggregation.process_infos(infos, done_indices)
+        if print_every is not None and (step + 1) % print_every == 0:
+            summaries.append(aggregation.summary())
+    return summaries
+
+
+def check(num_envs, episode_length, device):
+    # with synchronized resets and a summary after each episode the old and the new statistics are the same
+    register_episode_metric('goal_dist', improvement_step=10)
+    torch.manual_seed(0)
+    old = rollout(OldAggregation(games_to_track=num_envs), num_envs, 4, 3 * episode_length, episode_length, False, device, episode_length)
+    torch.manual_seed(0)
+    new = rollout(NewAggregation(), num_envs, 4, 3 * episode_length, episode_length, False, device, episode_length)
+    for old_summary, new_summary in zip(old, new):
+        for key, stats in old_summary.items():
+            for stat, value in stats.items():
+                assert np.isclose(value, new_summary[key][stat], rtol=1e-4), (key, stat, value, new_summary[key][stat])
+
+
+def time_rollout(aggregation, args, num_metrics):
+    rollout(aggregation, args.num_envs, num_metrics, args.warmup, args.episode_length, True, args.device)
+    if args.device.startswith('cuda'):
+        torch.cuda.synchronize()
+    start = time.perf_counter()
+    rollout(aggregation, args.num_envs, num_metrics, args.steps, args.episode_length, True, args.device, args.print_every)
+    if args.device.startswith('cuda'):
+        torch.cuda.synchronize()
+    return args.steps / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--num_envs', type=int, default=4096)
+    parser.add_argument('--metrics', type=int, nargs='+', default=[10, 50, 200])
+    parser.add_argument('--episode_length', type=int, default=100)
+    parser.add_argument('--steps', type=int, default=500)
+    parser.add_argument('--warmup', type=int, default=20)
+    parser.add_argument('--print_every', type=int, default=100, help='steps between summaries, like an epoch')
+    parser.add_argument('--device', default='cpu')
+    args = parser.parse_args()
+
+    check(64, 20, args.device)
+    print(f'{"metrics":>8} {"old steps/s":>12} {"new steps/s":>12} {"speedup":>8}')
+    for num_metrics in args.metrics:
+        old = time_rollout(OldAggregation(), args, num_metrics)
+        new = time_rollout(NewAggregation(), args, num_metrics)
+        print(f'{num_metrics:>8} {old:>12.0f} {new:>12.0f} {new / old:>7.1f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,96 @@
+"""
+Per step overhead of the episode statistics in A2CBase.play_steps: the old nonzero() of the dones and AverageMeter
+updates with the indexed rewards and lengths, against RollingMeter updates with the done mask. Also counts the host
+syncs per step with the cuda sync debug mode, and checks the rolling mean and quantiles against a deque of the last
+games_to_track episodes, including steps where more episodes finish than the window holds.
+
+    python -m isaacgymenvs.benchmarks.bench_episode_stats --device cuda:0
+"""
+import argparse
+import time
+import warnings
+from collections import deque
+
+import numpy as np
+import torch
+
+from isaacgymenvs.ppo.torch_ext import AverageMeter, RollingMeter
+
+
+def check(device, max_size=100, steps=200):
+    meter = RollingMeter(2, max_size).to(device)
+    window = deque(maxlen=max_size)
+    for step in range(steps):
+        num_envs = 300 if step % 50 == 0 else 64
+        values = torch.randn(num_envs, 2, device=device)
+        mask = torch.rand(num_envs, device=device) < (0.9 if step % 50 == 0 else 0.1)
+        meter.update(values, mask)
+        window.extend(values[mask].cpu().numpy())
+        if step % 10 == 0 or step == steps - 1:
+            assert meter.current_size == len(window)
+            expected = np.stack(window)
+            assert np.allclose(meter.get_mean(), expected.mean(0), atol=1e-5)
+            assert np.allclose(meter.get_quantiles([0.1, 0.5, 0.9]), np.quantile(expected, [0.1, 0.5, 0.9], axis=0), atol=1e-5)
+    meter.clear()
+    assert meter.current_size == 0 and np.allclose(meter.get_mean(), 0)
+
+
+def old_step(meters, current_rewards, current_lengths, dones, num_agents=1):
+    all_done_indices = dones.nonzero(as_tuple=False)
+    env_done_indices = all_done_indices[::num_agents]
+    meters[0].update(current_rewards[env_done_indices])
+    meters[1].update(current_rewards[env_done_indices])
+    meters[2].update(current_lengths[env_done_indices])
+
+
+def new_step(meters, current_rewards, current_lengths, dones):
+    done_mask = dones.bool()
+    meters[0].update(current_rewards, done_mask)
+    meters[1].update(current_rewards, done_mask)
+    meters[2].update(current_lengths, done_mask)
+
+
+def measure(step_fn, meters, num_envs, args):
+    current_rewards = torch.randn(num_envs, 1, device=args.device)
+    current_lengths = torch.randint(1, 500, (num_envs,), device=args.device).float()
+    dones = [(torch.rand(num_envs, device=args.device) < 1 / args.episode_length).to(torch.uint8) for _ in range(args.steps)]
+    cuda = args.device.startswith('cuda')
+    for d in dones[:10]:
+        step_fn(meters, current_rewards, current_lengths, d)
+    if cuda:
+        torch.cuda.synchronize()
+        torch.cuda.set_sync_debug_mode('warn')
+    with warnings.catch_warnings(record=True) as caught:
+        warnings.simplefilter('always')
+        start = time.perf_counter()
+        for d in dones:
+            step_fn(meters, current_rewards, current_lengths, d)
+        if cuda:
+            torch.cuda.set_sync_debug_mode('default')
+            torch.cuda.synchronize()
+        elapsed = (time.perf_counter() - start) / args.steps
+    syncs = sum('synchroniz' in str(w.message) for w in caught) / args.steps
+    return elapsed, syncs
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--device', default='cpu')
+    parser.add_argument('--num_envs', type=int, nargs='+', default=[4096, 16384])
+    parser.add_argument('--games_to_track', type=int, default=100)
+    parser.add_argument('--episode_length', type=int, default=200)
+    parser.add_argument('--steps', type=int, default=500)
+    args = parser.parse_args()
+
+    check(args.device)
+    print('the rolling mean and quantiles match the last games_to_track episodes')
+
+    print(f'{"envs":>6} {"AverageMeter us":>16} {"syncs/step":>11} {"RollingMeter us":>16} {"syncs/step":>11} {"speedup":>8}')
+    for num_envs in args.num_envs:
+        old = measure(old_step, [AverageMeter(1, args.games_to_track).to(args.device) for _ in range(3)], num_envs, args)
+        new = measure(new_step, [RollingMeter(1, args.games_to_track).to(args.device) for _ in range(3)], num_envs, args)
+        print(f'{num_envs:>6} {old[0] * 1e6:>16.1f} {old[1]:>11.1f} {new[0] * 1e6:>16.1f} {new[1]:>11.1f} {old[0] / new[0]:>7.2f}x')
+
+
+if __name__ == '__main__':
+    main()
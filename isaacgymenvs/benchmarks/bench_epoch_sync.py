@@ -0,0 +1,136 @@
+"""
+Update time of one PPO epoch with the adaptive lr schedule read back on the host after every minibatch (legacy) or
+mini epoch (standard), as with host_lr_schedule True, against the device lr tensor with one readback per epoch.
+Runs the PPO agent on the Synthetic task and counts the host syncs of each epoch with the cuda sync debug mode.
+Also checks that the device schedule follows the host one, and that after a max_kl stop the device path ends the
+epoch with the lr, weights, kl metric, Adam state and EMA weights of the host path over two epochs, since both skip
+the remaining mini epochs.
+
+    python -m isaacgymenvs.benchmarks.bench_epoch_sync --device cuda:0 --num_envs 4096
+"""
+import argparse
+import tempfile
+import time
+import warnings
+
+import torch
+from omegaconf import open_dict
+
+from isaacgymenvs.benchmarks.bench_agents import build_agent, compose_config, epoch_on_policy, start_on_policy
+from isaacgymenvs.ppo import torch_ext
+from isaacgymenvs.ppo.schedulers import AdaptiveScheduler
+
+
+def check_schedule(steps=200):
+    scheduler = AdaptiveScheduler(0.008, 1.5)
+    lr, lr_tensor = 5e-4, torch.tensor(5e-4, dtype=torch.float64)
+    for kl in torch.rand(steps, dtype=torch.float64) * 0.03:
+        lr, _ = scheduler.update(lr, 0.0, 0, 0, kl.item())
+        lr_tensor = scheduler.update_tensor(lr_tensor, kl)
+        assert abs(lr_tensor.item() - lr) <= 1e-12 * lr, (lr_tensor.item(), lr)
+
+
+def max_kl_epochs(schedule_type, host, args, epochs=2):
+    cfg = compose_config('a2c_continuous', args)
+    with open_dict(cfg):
+        cfg.train.params.config.schedule_type = schedule_type
+        cfg.train.params.config.host_lr_schedule = host
+        # every mini epoch has a positive kl, so every epoch stops after the first one
+        cfg.train.params.config.max_kl = 0.0
+        cfg.train.params.config.ema_decay = 0.99
+    with tempfile.TemporaryDirectory() as train_dir:
+        torch.manual_seed(args.seed)
+        agent = build_agent('a2c_continuous', cfg, train_dir)
+        start_on_policy(agent)
+        kls = []
+        for _ in range(epochs):
+            agent.update_epoch()
+            kls.append(torch_ext.mean_list(agent.train_epoch()[4]['info/kl']).item())
+            agent.dataset.update_values_dict(None)
+            if agent.relabel:
+                agent.relabeled_dataset.update_values_dict(None)
+            agent.frame += agent.curr_frames
+        weights = [p.detach().clone() for p in agent.model.parameters()]
+        # the lr of the param groups is a tensor on the device path, it is compared through last_lr
+        optimizer_state = [{k: torch.as_tensor(v).detach().cpu().clone() for k, v in state.items()}
+                           for state in agent.optimizer.state_dict()['state'].values()]
+        ema = {k: v.detach().clone() for k, v in agent.model_ema.state_dict().items()}
+    return agent.last_lr, weights, kls, optimizer_state, ema
+
+
+def check_max_kl(args):
+    for schedule_type in args.schedule_types:
+        host_lr, host_weights, host_kls, host_optimizer, host_ema = max_kl_epochs(schedule_type, True, args)
+        lr, weights, kls, optimizer_state, ema = max_kl_epochs(schedule_type, False, args)
+        assert abs(lr - host_lr) <= 1e-6 * host_lr, (schedule_type, lr, host_lr)
+        for kl, host_kl in zip(kls, host_kls):
+            assert abs(kl - host_kl) <= 1e-4 * max(host_kl, 1e-8), (schedule_type, kls, host_kls)
+        for p, host_p in zip(weights, host_weights):
+            assert torch.allclose(p, host_p, atol=1e-5), schedule_type
+        # Adam takes exactly as many steps on both paths, the skipped mini epochs never reach it
+        assert len(optimizer_state) == len(host_optimizer), schedule_type
+        for state, host_state in zip(optimizer_state, host_optimizer):
+            assert state.keys() == host_state.keys(), schedule_type
+            for k in state:
+                assert torch.allclose(state[k].double(), host_state[k].double(), atol=1e-6), (schedule_type, k)
+        for k in host_ema:
+            assert torch.allclose(ema[k].float(), host_ema[k].float(), atol=1e-5), (schedule_type, k)
+
+
+def epoch_stats(agent, epochs, cuda):
+    update_times, syncs = [], 0
+    for _ in range(epochs):
+        if cuda:
+            torch.cuda.synchronize()
+            torch.cuda.set_sync_debug_mode('warn')
+        with warnings.catch_warnings(record=True) as caught:
+            warnings.simplefilter('always')
+            update_times.append(epoch_on_policy(agent)[2])
+        if cuda:
+            torch.cuda.set_sync_debug_mode('default')
+        syncs += sum('synchroniz' in str(w.message) for w in caught)
+    return sum(update_times) / epochs, syncs / epochs
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--device', default='cpu')
+    parser.add_argument('--num_envs', type=int, default=1024)
+    parser.add_argument('--step_cost', type=int, default=1)
+    parser.add_argument('--reset_pattern', default='staggered')
+    parser.add_argument('--schedule_types', nargs='+', default=['legacy', 'standard'])
+    parser.add_argument('--warmup', type=int, default=2)
+    parser.add_argument('--epochs', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    check_schedule()
+    print('the device schedule matches the host one')
+
+    check_max_kl(args)
+    print('after a max_kl stop the device path ends the epoch like the host path')
+
+    cuda = args.device.startswith('cuda')
+    if not cuda:
+        print('the lr stays on the host on the cpu, both rows run the same code')
+    print(f'{"schedule":>9} {"lr":>7} {"update ms":>10} {"syncs/epoch":>12} {"last lr":>9}')
+    for schedule_type in args.schedule_types:
+        results = {}
+        for host in [True, False]:
+            cfg = compose_config('a2c_continuous', args)
+            cfg.train.params.config.schedule_type = schedule_type
+            cfg.train.params.config.host_lr_schedule = host
+            with tempfile.TemporaryDirectory() as train_dir:
+                agent = build_agent('a2c_continuous', cfg, train_dir)
+                start_on_policy(agent)
+                for _ in range(args.warmup):
+                    epoch_on_policy(agent)
+                results[host] = epoch_stats(agent, args.epochs, cuda) + (agent.last_lr,)
+        for host, (update_time, syncs, last_lr) in results.items():
+            name = 'host' if host else 'device'
+            print(f'{schedule_type:>9} {name:>7} {update_time * 1e3:>10.1f} {syncs:>12.1f} {last_lr:>9.2e}')
+        print(f'{"":>9} {"speedup":>7} {results[True][0] / results[False][0]:>9.2f}x')
+
+
+if __name__ == '__main__':
+    main()
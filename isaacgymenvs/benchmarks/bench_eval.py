@@ -0,0 +1,101 @@
+"""
+Wall time of PPO training with the test episodes run inline by A2CBase.test() against the Evaluator process, on the
+Synthetic task with a test every --test_every epochs. Checks first that a deterministic evaluation of the same weights
+gives the same numbers twice, and that a worker killed mid evaluation is reported instead of hanging the trainer.
+
+    python -m isaacgymenvs.benchmarks.bench_eval --device cuda:0 --num_envs 4096
+"""
+import argparse
+import tempfile
+import time
+
+import torch
+
+from isaacgymenvs.benchmarks.bench_agents import build_agent, compose_config, epoch_on_policy, start_on_policy
+from isaacgymenvs.utils.evaluator import Evaluator
+
+
+def make_evaluator(agent, args, deterministic, check_interval=5.0):
+    env_spec = dict(agent.eval_env_spec, num_envs=agent.eval_num_envs)
+    return Evaluator(env_spec, agent.model_spec, max_staleness=args.max_staleness, deterministic=deterministic,
+                     seed=args.seed, check_interval=check_interval)
+
+
+def check_deterministic(agent, args):
+    evaluator = make_evaluator(agent, args, deterministic=True)
+    summaries = []
+    for epoch_num in range(2):
+        evaluator.submit(agent.model, epoch_num, 0)
+        result = evaluator.poll(epoch_num, block=True)[0]
+        assert result['error'] is None, result['error']
+        summaries.append(result['metrics'])
+    evaluator.close()
+    assert summaries[0] == summaries[1], 'deterministic evaluations of the same weights differ'
+    return summaries[0]
+
+
+def check_worker_death(agent, args):
+    # a SIGKILL leaves no Python exception behind, as a segfault in the sim or the OOM killer would
+    evaluator = make_evaluator(agent, args, deterministic=True, check_interval=0.5)
+    evaluator.submit(agent.model, 0, 0)
+    evaluator.process.kill()
+    start = time.perf_counter()
+    results = evaluator.poll(args.max_staleness + 1)
+    results += evaluator.poll(args.max_staleness + 1, block=True)
+    assert time.perf_counter() - start < 10.0, 'waited too long for a dead worker'
+    assert len(results) == 1 and results[0]['error'] is not None, results
+    assert not evaluator.alive and not evaluator.submit(agent.model, 1, 0)
+    assert evaluator.close() == []
+
+
+def run(agent, args, evaluator):
+    staleness = []
+    start = time.perf_counter()
+    for epoch_num in range(1, args.epochs + 1):
+        epoch_on_policy(agent)
+        if epoch_num % args.test_every == 0:
+            if evaluator is None:
+                agent.test(render=False)
+            else:
+                evaluator.submit(agent.model, epoch_num, agent.frame)
+        if evaluator is not None:
+            staleness += [epoch_num - r['epoch_num'] for r in evaluator.poll(epoch_num)]
+    if args.device.startswith('cuda'):
+        torch.cuda.synchronize()
+    elapsed = time.perf_counter() - start
+    if evaluator is not None:
+        staleness += [args.epochs - r['epoch_num'] for r in evaluator.close()]
+    return elapsed / args.epochs, staleness
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--device', default='cpu')
+    parser.add_argument('--num_envs', type=int, default=1024)
+    parser.add_argument('--step_cost', type=int, default=1)
+    parser.add_argument('--reset_pattern', default='staggered')
+    parser.add_argument('--epochs', type=int, default=20)
+    parser.add_argument('--test_every', type=int, default=4)
+    parser.add_argument('--max_staleness', type=int, default=2)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    cfg = compose_config('a2c_continuous', args)
+    with tempfile.TemporaryDirectory() as train_dir:
+        agent = build_agent('a2c_continuous', cfg, train_dir)
+        start_on_policy(agent)
+        metrics = check_deterministic(agent, args)
+        print(f'deterministic evaluation is reproducible, {sum(len(m) for m in metrics.values())} metrics')
+        check_worker_death(agent, args)
+        print('a killed evaluation worker is reported as a failed evaluation')
+
+        print(f'{"test":>7} {"ms/epoch":>9} {"evaluations":>12} {"max staleness":>14}')
+        for mode in ['inline', 'async']:
+            evaluator = make_evaluator(agent, args, deterministic=False) if mode == 'async' else None
+            t, staleness = run(agent, args, evaluator)
+            evaluations = len(staleness) if mode == 'async' else args.epochs // args.test_every
+            print(f'{mode:>7} {t * 1e3:>9.1f} {evaluations:>12} {max(staleness, default=0):>14}')
+
+
+if __name__ == '__main__':
+    main()
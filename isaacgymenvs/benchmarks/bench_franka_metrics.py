@@ -0,0 +1,116 @@
+"""
+Per step cost of the FrankaPushing episodic metrics: the old block of post_physics_step, which recomputed the goal
+distance for every metric and for every rendered env in test runs, against StepMetrics with the default metrics, all
+of them and none. Checks first that StepMetrics reports the same values, with the metrics of the rendered envs as one
+tensor per metric, and that EpisodeMetrics turns them into the same episode statistics as the old per env keys.
+
+    python -m isaacgymenvs.benchmarks.bench_franka_metrics --device cuda:0
+"""
+import argparse
+import time
+
+import torch
+
+from isaacgymenvs.tasks.utils.metrics import DEFAULT_METRICS, EPISODIC_METRICS, StepMetrics
+from isaacgymenvs.utils.episode_metrics import EpisodeMetrics, per_env_key
+
+
+def old_metrics(states, target_name, test, max_pix):
+    metrics = dict()
+    metrics["goal_dist"] = torch.norm(states["goal_pos"] - states[target_name], dim=-1)
+    metrics["success_4"] = torch.norm(states["goal_pos"] - states[target_name], dim=-1) < 0.04
+    metrics["success_2"] = torch.norm(states["goal_pos"] - states[target_name], dim=-1) < 0.02
+    metrics["failure_2"] = torch.norm(states["goal_pos"] - states[target_name], dim=-1) > 0.02
+    if test:
+        for i in range(min(max_pix, states['goal_pos'].shape[0])):
+            metrics[f"goal_dist_{i}"] = torch.norm(states["goal_pos"] - states[target_name], dim=-1)[i]
+            metrics[f"success_4_{i}"] = torch.norm(states["goal_pos"] - states[target_name], dim=-1)[i] < 0.04
+            metrics[f"success_2_{i}"] = torch.norm(states["goal_pos"] - states[target_name], dim=-1)[i] < 0.02
+            metrics[f"failure_2_{i}"] = torch.norm(states["goal_pos"] - states[target_name], dim=-1)[i] > 0.02
+    return metrics
+
+
+def make_states(num_envs, device):
+    # goals within a few cm of the cube, so the success thresholds are crossed
+    cube = torch.randn(num_envs, 3, device=device) * 0.1
+    return {"cube0_pos": cube, "goal_pos": cube + torch.randn(num_envs, 3, device=device) * 0.03,
+            "eef_pos": torch.randn(num_envs, 3, device=device) * 0.1}
+
+
+def new_metrics(step_metrics, states, target_name, test, max_pix):
+    step_metrics.start_step(states, target_name)
+    return step_metrics.compute(min(max_pix, states['goal_pos'].shape[0]) if test else 0)
+
+
+def check(device, max_pix=16, num_envs=256, steps=30):
+    states = make_states(num_envs, device)
+    for test in [False, True]:
+        expected = old_metrics(states, "cube0_pos", test, max_pix)
+        metrics = new_metrics(StepMetrics(DEFAULT_METRICS), states, "cube0_pos", test, max_pix)
+        keys = set(DEFAULT_METRICS) | ({per_env_key(name) for name in DEFAULT_METRICS} if test else set())
+        assert set(metrics) == keys, sorted(set(metrics) ^ keys)
+        for k, v in expected.items():
+            name, _, i = k.rpartition('_')
+            if name in DEFAULT_METRICS and test:
+                assert metrics[per_env_key(name)].shape == (max_pix,), k
+                assert torch.equal(metrics[per_env_key(name)][int(i)].float(), v.float()), k
+            else:
+                assert torch.allclose(metrics[k].float(), v.float()), k
+    assert new_metrics(StepMetrics([]), states, "cube0_pos", True, max_pix) == {}
+
+    # a test run of a few steps, the per env metrics are only expanded in the summary
+    step_metrics = StepMetrics(DEFAULT_METRICS)
+    old_episodes, new_episodes = None, None
+    for step in range(steps):
+        states = make_states(num_envs, device)
+        done_mask = torch.rand(num_envs, device=device) < 0.1 if step > 0 else None
+        old = old_metrics(states, "cube0_pos", True, max_pix)
+        new = new_metrics(step_metrics, states, "cube0_pos", True, max_pix)
+        if old_episodes is None:
+            old_episodes = EpisodeMetrics.for_values(old, device)
+            new_episodes = EpisodeMetrics.for_values(new, device)
+        old_episodes.update(old, done_mask)
+        new_episodes.update(new, done_mask)
+    old_summary, new_summary = old_episodes.summary(), new_episodes.summary()
+    assert sorted(old_summary) == sorted(new_summary), sorted(set(old_summary) ^ set(new_summary))
+    for key, stats in old_summary.items():
+        for stat, value in stats.items():
+            assert abs(new_summary[key][stat] - value) <= 1e-5 * max(1.0, abs(value)), (key, stat)
+
+
+def measure(fn, fn_args, repeats, device):
+    fn(*fn_args)
+    if device.startswith('cuda'):
+        torch.cuda.synchronize()
+    start = time.perf_counter()
+    for _ in range(repeats):
+        fn(*fn_args)
+    if device.startswith('cuda'):
+        torch.cuda.synchronize()
+    return (time.perf_counter() - start) / repeats
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--device', default='cuda:0' if torch.cuda.is_available() else 'cpu')
+    parser.add_argument('--num_envs', type=int, nargs='+', default=[1024, 4096, 16384])
+    parser.add_argument('--max_pix', type=int, default=16)
+    parser.add_argument('--repeats', type=int, default=200)
+    args = parser.parse_args()
+
+    check(args.device, args.max_pix)
+    print('StepMetrics matches the old metrics in train and test runs, also in the episode statistics')
+
+    variants = {'default': DEFAULT_METRICS, 'all': list(EPISODIC_METRICS), 'off': []}
+    print(f'{"envs":>6} {"test":>5} {"old us":>8} ' + ' '.join(f'{name + " us":>11}' for name in variants))
+    for num_envs in args.num_envs:
+        states = make_states(num_envs, args.device)
+        for test in [False, True]:
+            old = measure(old_metrics, (states, "cube0_pos", test, args.max_pix), args.repeats, args.device)
+            times = [measure(new_metrics, (StepMetrics(names), states, "cube0_pos", test, args.max_pix), args.repeats,
+                             args.device) for names in variants.values()]
+            print(f'{num_envs:>6} {str(test):>5} {old * 1e6:>8.1f} ' + ' '.join(f'{t * 1e6:>11.1f}' for t in times))
+
+
+if __name__ == '__main__':
+    main()
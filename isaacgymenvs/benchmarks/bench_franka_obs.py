@@ -0,0 +1,122 @@
+"""
+Per step cost of the FrankaPushing observation and gripper code: the old torch.cat into a new obs_buf, the per key
+max().item() and the .item() of the finger limits in pre_physics_step, against ObsLayout.fill into the persistent
+obs_buf and a torch.where on the limit tensors. The states are views of fake root, rigid body and dof state tensors as
+the task gets them from the simulator. Counts the host syncs per step with the cuda sync debug mode and checks that both
+produce the same observations and gripper targets.
+
+    python -m isaacgymenvs.benchmarks.bench_franka_obs --device cuda:0
+"""
+import argparse
+import time
+import warnings
+
+import torch
+
+from isaacgymenvs.tasks.utils.obs_layout import ObsLayout
+
+
+def make_states(num_envs, num_cubes, device):
+    root = torch.randn(num_envs, 8 + num_cubes, 13, device=device)
+    eef = torch.randn(num_envs, 13, device=device)
+    q = torch.randn(num_envs, 9, device=device)
+    states = {"q": q, "q_gripper": q[:, -2:], "eef_pos": eef[:, :3], "eef_quat": eef[:, 3:7], "eef_vel": eef[:, 7:],
+              "goal_pos": root[:, -1, :3]}
+    for j in range(num_cubes):
+        cube = root[:, 2 + j]
+        states.update({f"cube{j}_angvel": cube[:, 10:], f"cube{j}_vel": cube[:, 7:10], f"cube{j}_quat": cube[:, 3:7],
+                       f"cube{j}_pos": cube[:, :3]})
+    return states
+
+
+def observed_states(num_cubes, observe_velocities):
+    # FrankaPushing._observed_states with osc control
+    obs = ["eef_pos", "eef_quat", "goal_pos"] + (["eef_vel"] if observe_velocities else [])
+    for j in range(num_cubes):
+        obs += [f"cube{j}_quat", f"cube{j}_pos", f"cube{j}_vel"] + ([f"cube{j}_angvel"] if observe_velocities else [])
+    return obs + ["q_gripper"]
+
+
+def old_step(task, u_gripper):
+    task.obs_buf = torch.cat([task.states[ob] for ob in task.obs], dim=-1)
+    maxs = {ob: torch.max(task.states[ob]).item() for ob in task.obs}
+    u_fingers = torch.zeros_like(task.gripper_control)
+    u_fingers[:, 0] = torch.where(u_gripper >= 0.0, task.upper[-2].item(), task.lower[-2].item())
+    u_fingers[:, 1] = torch.where(u_gripper >= 0.0, task.upper[-1].item(), task.lower[-1].item())
+    task.gripper_control[:, :] = u_fingers
+
+
+def new_step(task, u_gripper):
+    task.layout.fill(task.obs_buf, task.states)
+    task.gripper_control[:, :] = torch.where(u_gripper.unsqueeze(-1) >= 0.0, task.upper[-2:], task.lower[-2:])
+
+
+class Task:
+    def __init__(self, num_envs, args, debug=False):
+        self.states = make_states(num_envs, args.cubes, args.device)
+        self.obs = observed_states(args.cubes, args.observe_velocities)
+        self.layout = ObsLayout(self.obs, self.states, debug=debug)
+        self.obs_buf = torch.zeros(num_envs, self.layout.num_obs, device=args.device)
+        self.gripper_control = torch.zeros(num_envs, 2, device=args.device)
+        self.upper = torch.tensor([2.9, 1.8, 2.9, 0.0, 2.9, 3.8, 2.9, 0.04, 0.04], device=args.device)
+        self.lower = torch.tensor([-2.9, -1.8, -2.9, -3.1, -2.9, 0.0, -2.9, 0.0, 0.0], device=args.device)
+
+
+def check(args, num_envs=256):
+    old, new = Task(num_envs, args), Task(num_envs, args, debug=True)
+    new.states = old.states
+    u_gripper = torch.randn(num_envs, device=args.device)
+    old_step(old, u_gripper)
+    new_step(new, u_gripper)
+    assert torch.equal(old.obs_buf, new.obs_buf) and torch.equal(old.gripper_control, new.gripper_control)
+    stats = new.layout.fill(new.obs_buf, new.states)
+    for name, s in new.layout.spec.items():
+        assert abs(stats[name]["max"] - old.states[name].max().item()) < 1e-6, name
+        assert torch.equal(new.obs_buf[:, s], old.states[name])
+
+
+def measure(step_fn, task, args):
+    num_envs = task.obs_buf.shape[0]
+    actions = [torch.randn(num_envs, device=args.device) for _ in range(args.steps)]
+    cuda = args.device.startswith('cuda')
+    for a in actions[:10]:
+        step_fn(task, a)
+    if cuda:
+        torch.cuda.synchronize()
+        torch.cuda.set_sync_debug_mode('warn')
+    with warnings.catch_warnings(record=True) as caught:
+        warnings.simplefilter('always')
+        start = time.perf_counter()
+        for a in actions:
+            step_fn(task, a)
+        if cuda:
+            torch.cuda.set_sync_debug_mode('default')
+            torch.cuda.synchronize()
+        elapsed = (time.perf_counter() - start) / args.steps
+    syncs = sum('synchroniz' in str(w.message) for w in caught) / args.steps
+    return elapsed, syncs
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--device', default='cuda:0' if torch.cuda.is_available() else 'cpu')
+    parser.add_argument('--num_envs', type=int, nargs='+', default=[1024, 4096, 16384])
+    parser.add_argument('--cubes', type=int, default=6, help='nObservedCubes')
+    parser.add_argument('--observe_velocities', action='store_true')
+    parser.add_argument('--steps', type=int, default=500)
+    args = parser.parse_args()
+
+    check(args)
+    print('ObsLayout.fill and the gripper targets match the old observations, debug stats match the per key max')
+
+    print(f'{"envs":>6} {"old us":>8} {"syncs/step":>11} {"layout us":>10} {"syncs/step":>11} {"debug us":>9} {"syncs/step":>11} {"speedup":>8}')
+    for num_envs in args.num_envs:
+        old = measure(old_step, Task(num_envs, args), args)
+        new = measure(new_step, Task(num_envs, args), args)
+        debug = measure(new_step, Task(num_envs, args, debug=True), args)
+        print(f'{num_envs:>6} {old[0] * 1e6:>8.1f} {old[1]:>11.1f} {new[0] * 1e6:>10.1f} {new[1]:>11.1f} '
+              f'{debug[0] * 1e6:>9.1f} {debug[1]:>11.1f} {old[0] / new[0]:>7.2f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,165 @@
+"""
+Reset wall time of FrankaPushing when switching between train and test runs, which freezes the cubes of the rigid test
+tasks: the old per actor loop that scaled the cube masses through the rigid body property getters and setters, against
+freeze_cubes() with the cubes pinned through the root state tensor. Also times env steps with and without pinned
+cubes, and checks first that pinned cubes stay at their initial state while the arm moves, that they are free again
+after the test run and that the cubes of a reset are written once, deferred to the pinning only while cubes are
+frozen. Needs isaacgym.
+
+    python -m isaacgymenvs.benchmarks.bench_freeze_cubes --num_envs 1024 4096 16384
+"""
+import argparse
+import time
+
+import isaacgym  # noqa: F401, has to be imported before torch
+import torch
+
+
+def make_env(num_envs, args):
+    import isaacgymenvs
+    from hydra import compose, initialize
+
+    overrides = ['task=FrankaPushing', f'num_envs={num_envs}', f'sim_device={args.device}', f'rl_device={args.device}',
+                 'headless=True', f'task.env.testTask={args.test_task}']
+    with initialize(config_path='../cfg'):
+        cfg = compose(config_name='config', overrides=overrides)
+    return isaacgymenvs.make(cfg.seed, cfg.task_name, num_envs, cfg.sim_device, cfg.rl_device, cfg.graphics_device_id,
+                             cfg.headless, cfg=cfg)
+
+
+def old_freeze_cubes(env):
+    # FrankaPushing.freeze_cubes before the cubes were pinned
+    from isaacgym import gymapi
+    if env.test:
+        cube_colors = [gymapi.Vec3(0.5, 0.5, 0.5) for _ in range(len(env._cube_ids) - 1)]
+        mass_multiplier = 100
+    else:
+        cube_colors = env.cube_colors[1:]
+        mass_multiplier = 1
+    if not hasattr(env, 'cube_masses'):
+        env.cube_masses = [None] * len(env.tasks)
+    for t, task in enumerate(env.tasks):
+        if task.get('rigid', False):
+            for i, id in enumerate(env._cube_ids[1:]):
+                properties = env.gym.get_actor_rigid_body_properties(env.envs[t], id)[0]
+                if env.cube_masses[t] is None:
+                    env.cube_masses[t] = properties.mass
+                properties.mass = env.cube_masses[t] * mass_multiplier
+                env.gym.set_actor_rigid_body_properties(env.envs[t], id, [properties], True)
+                for n in range(env.gym.get_actor_rigid_body_count(env.envs[t], id)):
+                    env.gym.set_rigid_body_color(env.envs[t], id, n, gymapi.MESH_VISUAL, cube_colors[i])
+
+
+def random_actions(env):
+    return 2 * torch.rand(env.num_envs, env.num_actions, device=env.device) - 1
+
+
+class RootStateWrites:
+    """ forwards to the gym, counting the indexed root state writes """
+
+    def __init__(self, gym):
+        self.gym = gym
+        self.count = 0
+
+    def set_actor_root_state_tensor_indexed(self, *args):
+        self.count += 1
+        return self.gym.set_actor_root_state_tensor_indexed(*args)
+
+    def __getattr__(self, name):
+        return getattr(self.gym, name)
+
+
+def check_root_state_writes(env):
+    gym, env.gym = env.gym, RootStateWrites(env.gym)
+    try:
+        env_ids = torch.arange(env.num_envs, device=env.device)
+        for test in [True, False]:
+            env.test = test
+            env.reset()
+            env.gym.count = 0
+            env.reset_idx(env_ids)
+            env.step(random_actions(env))
+            # a single write either way, with frozen cubes it carries the reset cubes along
+            assert env.gym.count == 1, (test, env.gym.count)
+            assert env._reset_actor_ids is None
+            env.gym.count = 0
+            env.step(random_actions(env))
+            assert env.gym.count == (1 if test else 0), (test, env.gym.count)
+    finally:
+        env.gym = gym
+
+
+def check(env, steps=50):
+    env.test = True
+    env.reset()
+    frozen = env._frozen_cubes.clone()
+    assert frozen.any(), 'the test task has no rigid cubes'
+    init = torch.stack([s[:, :3] for s in env._init_cube_states], 1).clone()
+    for _ in range(steps):
+        env.step(random_actions(env))
+    # the cubes are put back before every control step, within a step they can settle or be nudged by the arm.
+    # Envs that finished an episode were reset to the same initial state
+    pos = torch.stack([s[:, :3] for s in env._cube_states], 1)
+    drift = (pos - init).norm(dim=-1)[frozen].max().item()
+    assert drift < 0.01, f'pinned cubes moved by {drift:.4f}'
+    env.test = False
+    env.reset()
+    assert not env._frozen_cubes.any() and len(env._frozen_actor_ids) == 0
+    check_root_state_writes(env)
+
+
+def synchronize(env):
+    if env.device.startswith('cuda'):
+        torch.cuda.synchronize()
+
+
+def time_resets(env, freeze, repeats):
+    # alternates between test and train runs, as A2CBase.test() does
+    start = time.perf_counter()
+    for i in range(repeats):
+        env.test = i % 2 == 0
+        freeze(env)
+        synchronize(env)
+    elapsed = (time.perf_counter() - start) / repeats
+    env.test = False
+    freeze(env)
+    return elapsed
+
+
+def time_steps(env, test, steps):
+    env.test = test
+    env.reset()
+    start = time.perf_counter()
+    for _ in range(steps):
+        env.step(random_actions(env))
+    synchronize(env)
+    env.test = False
+    return (time.perf_counter() - start) / steps
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--device', default='cuda:0')
+    parser.add_argument('--num_envs', type=int, nargs='+', default=[1024, 4096, 16384])
+    parser.add_argument('--test_task', type=int, default=1, help='a rigid task, so that every env has pinned cubes')
+    parser.add_argument('--repeats', type=int, default=10)
+    parser.add_argument('--steps', type=int, default=100)
+    args = parser.parse_args()
+
+    print(f'{"envs":>6} {"old freeze ms":>14} {"freeze ms":>10} {"reset ms":>9} {"step ms":>8} {"pinned step ms":>15}')
+    for i, num_envs in enumerate(args.num_envs):
+        env = make_env(num_envs, args)
+        if i == 0:
+            check(env)
+            print('pinned cubes stay at their initial state, are free again after the test run, resets are written once')
+        old = time_resets(env, old_freeze_cubes, args.repeats)
+        new = time_resets(env, lambda e: e.freeze_cubes(), args.repeats)
+        reset = time_resets(env, lambda e: e.reset(), args.repeats)
+        step = time_steps(env, False, args.steps)
+        pinned = time_steps(env, True, args.steps)
+        print(f'{num_envs:>6} {old * 1e3:>14.2f} {new * 1e3:>10.2f} {reset * 1e3:>9.2f} {step * 1e3:>8.2f} {pinned * 1e3:>15.2f}')
+        env.gym.destroy_sim(env.sim)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+"""
+CPU microbenchmark for the GAE backends in isaacgymenvs.ppo.advantages.
+Every backend is first checked against the reference loop, then timed over a grid of horizons and env counts.
+
+    python -m isaacgymenvs.benchmarks.bench_gae
+"""
+import argparse
+import time
+
+import torch
+
+from isaacgymenvs.ppo import advantages
+
+
+def make_rollout(horizon_length, num_envs, value_size=1, done_prob=0.05, timeout_prob=0.02, gamma=0.99):
+    mb_values = torch.randn(horizon_length, num_envs, value_size)
+    mb_rewards = torch.randn(horizon_length, num_envs, value_size)
+    mb_fdones = (torch.rand(horizon_length, num_envs) < done_prob).float()
+    last_values = torch.randn(num_envs, value_size)
+    # time-out bootstrapping is folded into the rewards, same as in play_steps
+    time_outs = (torch.rand(horizon_length, num_envs) < timeout_prob).float()
+    mb_rewards += gamma * mb_values * time_outs.unsqueeze(2)
+    return last_values, mb_fdones, mb_values, mb_rewards
+
+
+def check_backends(gamma, tau):
+    for horizon_length in [1, 2, 7, 32, 33]:
+        for value_size in [1, 2]:
+            rollout = make_rollout(horizon_length, 64, value_size, done_prob=0.2)
+            ref = advantages.gae_loop(gamma, tau, *rollout)
+            for name, fn in advantages.gae_backends.items():
+                res = fn(gamma, tau, *rollout)
+                assert torch.allclose(res, ref, atol=1e-5, rtol=1e-5), \
+                    f'{name} mismatch at horizon {horizon_length}: {(res - ref).abs().max()}'
+    print('all backends match the reference loop')
+
+
+def time_fn(fn, args, repeats):
+    fn(*args)
+    start = time.perf_counter()
+    for _ in range(repeats):
+        fn(*args)
+    return (time.perf_counter() - start) / repeats
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--horizons', type=int, nargs='+', default=[16, 32, 64, 128])
+    parser.add_argument('--num_envs', type=int, nargs='+', default=[1024, 4096, 16384])
+    parser.add_argument('--repeats', type=int, default=20)
+    parser.add_argument('--threads', type=int, default=1)
+    args = parser.parse_args()
+
+    torch.set_num_threads(args.threads)
+    gamma, tau = 0.99, 0.95
+    check_backends(gamma, tau)
+
+    names = list(advantages.gae_backends.keys())
+    print(f'{"horizon":>8} {"envs":>8} ' + ' '.join(f'{n + " ms":>10}' for n in names) + f' {"speedup":>8}')
+    for horizon_length in args.horizons:
+        for num_envs in args.num_envs:
+            rollout = make_rollout(horizon_length, num_envs)
+            times = [time_fn(advantages.gae_backends[n], (gamma, tau) + rollout, args.repeats) for n in names]
+            speedup = times[0] / min(times[1:])
+            print(f'{horizon_length:>8} {num_envs:>8} ' + ' '.join(f'{t * 1e3:>10.3f}' for t in times) + f' {speedup:>7.1f}x')
+
+
+if __name__ == '__main__':
+    main()
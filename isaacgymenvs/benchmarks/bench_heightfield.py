@@ -0,0 +1,156 @@
+"""
+Latency of the AnymalTerrain height measurements: the old get_heights, which repeated the base quaternions for every
+height point, rotated them with quat_apply_yaw and took the min of two integer gathers, against HeightField with min,
+nearest and bilinear sampling, with normals, and for a subset of the envs. Runs on CPU without isaacgym. Checks first,
+on synthetic height maps, that 'min' reproduces the old heights, that bilinear sampling and the normals are exact on a
+sloped plane, that nearest sampling picks the closest sample and that a subset query matches the full one.
+
+    python -m isaacgymenvs.benchmarks.bench_heightfield --device cuda:0 --num_envs 4096 16384
+"""
+import argparse
+import time
+
+import torch
+
+from isaacgymenvs.tasks.utils.heightfield import HeightField, grid_coordinates
+
+HORIZONTAL_SCALE = 0.1
+VERTICAL_SCALE = 0.005
+BORDER_SIZE = 20.
+
+
+def height_pattern(device):
+    # AnymalTerrain.init_height_points, 1mx1.6m rectangle without the center line
+    y = 0.1 * torch.tensor([-5, -4, -3, -2, -1, 1, 2, 3, 4, 5], device=device)
+    x = 0.1 * torch.tensor([-8, -7, -6, -5, -4, -3, -2, 2, 3, 4, 5, 6, 7, 8], device=device)
+    grid_x, grid_y = torch.meshgrid(x, y, indexing='ij')
+    return torch.stack([grid_x.flatten(), grid_y.flatten(), torch.zeros_like(grid_x.flatten())], -1)
+
+
+def quat_apply(a, b):
+    shape = b.shape
+    a = a.reshape(-1, 4)
+    b = b.reshape(-1, 3)
+    xyz = a[:, :3]
+    t = xyz.cross(b, dim=-1) * 2
+    return (b + a[:, 3:] * t + xyz.cross(t, dim=-1)).view(shape)
+
+
+def quat_apply_yaw(quat, vec):
+    quat_yaw = quat.clone().view(-1, 4)
+    quat_yaw[:, :2] = 0.
+    quat_yaw = quat_yaw / quat_yaw.norm(p=2, dim=-1).clamp(min=1e-9).unsqueeze(-1)
+    return quat_apply(quat_yaw, vec)
+
+
+def old_get_heights(height_samples, height_points, base_pos, base_quat):
+    num_envs, num_points = height_points.shape[:2]
+    points = quat_apply_yaw(base_quat.repeat(1, num_points), height_points) + base_pos.unsqueeze(1)
+    points += BORDER_SIZE
+    points = (points / HORIZONTAL_SCALE).long()
+    px = points[:, :, 0].view(-1)
+    py = points[:, :, 1].view(-1)
+    px = torch.clip(px, 0, height_samples.shape[0] - 2)
+    py = torch.clip(py, 0, height_samples.shape[1] - 2)
+    heights1 = height_samples[px, py]
+    heights2 = height_samples[px + 1, py + 1]
+    heights = torch.min(heights1, heights2)
+    return heights.view(num_envs, -1) * VERTICAL_SCALE
+
+
+def make_terrain(size, device, plane=False):
+    i = torch.arange(size, device=device)[:, None]
+    j = torch.arange(size, device=device)[None]
+    if plane:
+        return (3 * i + 2 * j).to(torch.int16)
+    # stairs and random roughness
+    return ((i // 8) * 20 + torch.randint(-15, 15, (size, size), device=device)).to(torch.int16)
+
+
+def make_bases(num_envs, size, device, margin=1.):
+    extent = size * HORIZONTAL_SCALE - 2 * BORDER_SIZE
+    base_pos = torch.rand(num_envs, 3, device=device) * (extent + 2 * BORDER_SIZE - 2 * margin) - BORDER_SIZE + margin
+    base_quat = torch.randn(num_envs, 4, device=device)
+    return base_pos, base_quat / base_quat.norm(dim=-1, keepdim=True)
+
+
+def check(device, num_envs=512, size=800):
+    pattern = height_pattern(device)
+    height_points = pattern.unsqueeze(0).repeat(num_envs, 1, 1)
+
+    # min sampling is the old measurement, up to points that fall on a cell boundary in one of the two roundings
+    samples = make_terrain(size, device)
+    base_pos, base_quat = make_bases(num_envs, size, device, margin=-5.)
+    expected = old_get_heights(samples, height_points, base_pos, base_quat)
+    heights = HeightField(samples, HORIZONTAL_SCALE, VERTICAL_SCALE, BORDER_SIZE, pattern).query(base_pos, base_quat)
+    x, y = grid_coordinates(pattern[:, :2], base_pos, base_quat, BORDER_SIZE, HORIZONTAL_SCALE)
+    on_boundary = ((x - x.round()).abs() < 1e-3) | ((y - y.round()).abs() < 1e-3)
+    assert torch.equal(heights[~on_boundary], expected[~on_boundary])
+
+    # bilinear sampling and normals are exact on a plane, nearest sampling picks the closest sample
+    samples = make_terrain(size, device, plane=True)
+    base_pos, base_quat = make_bases(num_envs, size, device)
+    x, y = grid_coordinates(pattern[:, :2], base_pos, base_quat, BORDER_SIZE, HORIZONTAL_SCALE)
+    field = HeightField(samples, HORIZONTAL_SCALE, VERTICAL_SCALE, BORDER_SIZE, pattern, mode='bilinear')
+    heights, normals = field.query(base_pos, base_quat, normals=True)
+    assert torch.allclose(heights, (3 * x + 2 * y) * VERTICAL_SCALE, atol=1e-3)
+    slope = torch.tensor([-3 * VERTICAL_SCALE / HORIZONTAL_SCALE, -2 * VERTICAL_SCALE / HORIZONTAL_SCALE, 1.], device=device)
+    assert torch.allclose(normals, (slope / slope.norm()).expand_as(normals), atol=1e-5)
+    field.mode = 'nearest'
+    assert torch.allclose(field.query(base_pos, base_quat), (3 * x.round() + 2 * y.round()) * VERTICAL_SCALE, atol=1e-3)
+
+    # the pattern is turned like quat_apply_yaw turns it, and subsets match the full query
+    points = quat_apply_yaw(base_quat.repeat(1, pattern.shape[0]), height_points)[..., :2] + base_pos[:, None, :2]
+    assert torch.allclose(field.points(base_pos, base_quat), points, atol=1e-4)
+    env_ids = torch.randperm(num_envs, device=device)[:num_envs // 4]
+    assert torch.equal(field.query(base_pos, base_quat, env_ids=env_ids), field.query(base_pos, base_quat)[env_ids])
+
+
+def measure(fn, repeats, device):
+    fn()
+    if device.startswith('cuda'):
+        torch.cuda.synchronize()
+    start = time.perf_counter()
+    for _ in range(repeats):
+        fn()
+    if device.startswith('cuda'):
+        torch.cuda.synchronize()
+    return (time.perf_counter() - start) / repeats
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--device', default='cpu')
+    parser.add_argument('--num_envs', type=int, nargs='+', default=[4096, 16384])
+    parser.add_argument('--size', type=int, default=1200, help='height map samples per side')
+    parser.add_argument('--subset', type=float, default=0.1, help='fraction of envs of the subset query')
+    parser.add_argument('--repeats', type=int, default=50)
+    args = parser.parse_args()
+
+    check(args.device)
+    print('min sampling matches the old get_heights, bilinear sampling and normals are exact on a plane')
+
+    pattern = height_pattern(args.device)
+    samples = make_terrain(args.size, args.device)
+    fields = {mode: HeightField(samples, HORIZONTAL_SCALE, VERTICAL_SCALE, BORDER_SIZE, pattern, mode=mode)
+              for mode in ['min', 'nearest', 'bilinear']}
+    names = ['old', 'min', 'nearest', 'bilinear', '+normals', 'subset']
+    print(f'{"envs":>6} ' + ' '.join(f'{name + " us":>12}' for name in names))
+    for num_envs in args.num_envs:
+        base_pos, base_quat = make_bases(num_envs, args.size, args.device)
+        height_points = pattern.unsqueeze(0).repeat(num_envs, 1, 1)
+        env_ids = torch.randperm(num_envs, device=args.device)[:int(num_envs * args.subset)]
+        fns = [
+            lambda: old_get_heights(samples, height_points, base_pos, base_quat),
+            lambda: fields['min'].query(base_pos, base_quat),
+            lambda: fields['nearest'].query(base_pos, base_quat),
+            lambda: fields['bilinear'].query(base_pos, base_quat),
+            lambda: fields['bilinear'].query(base_pos, base_quat, normals=True),
+            lambda: fields['min'].query(base_pos, base_quat, env_ids=env_ids),
+        ]
+        times = [measure(fn, args.repeats, args.device) for fn in fns]
+        print(f'{num_envs:>6} ' + ' '.join(f'{t * 1e6:>12.1f}' for t in times))
+
+
+if __name__ == '__main__':
+    main()
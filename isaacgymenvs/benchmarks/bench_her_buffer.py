@@ -0,0 +1,117 @@
+"""
+Insertion latency of ValidationHERReplayBuffer.add against buffer size, together with the old add() that
+rewrote a dense steps_to_go mask over the whole buffer on every insertion.
+Before timing, the episode table lookup is checked against the dense steps_to_go bookkeeping, and the
+future goals sampled from both are checked to be identical.
+
+    python -m isaacgymenvs.benchmarks.bench_her_buffer --device cuda:0
+"""
+import argparse
+import time
+
+import torch
+
+from isaacgymenvs.sac.validation_replay_buffer import ValidationHERReplayBuffer, randint
+
+
+class DenseStepsToGo:
+    """ the previous bookkeeping, kept here as the reference """
+    def __init__(self, n_steps, n_envs, device):
+        self.n_steps = n_steps
+        self.steps_to_go = torch.zeros((n_steps, n_envs), dtype=torch.int64, device=device)
+        self.current_ep_start = torch.zeros((n_envs,), dtype=torch.long, device=device)
+
+    def add(self, idx, done):
+        self.steps_to_go[idx] = 0
+        mask = torch.zeros_like(self.steps_to_go)
+        ids = torch.arange(self.n_steps, device=self.steps_to_go.device)[:, None]
+        mask[(ids >= self.current_ep_start[None]) * (ids < idx)] = 1
+        # overflow
+        mask[(self.current_ep_start[None] > idx) * (ids < idx)] = 1
+        mask[(self.current_ep_start[None] > idx) * (ids >= self.current_ep_start[None])] = 1
+        self.steps_to_go += mask
+        self.current_ep_start = torch.where(done[:, 0] == 1, (idx + 1) % self.n_steps, self.current_ep_start)
+
+
+def make_buffer(capacity, n_envs, device, validation_ratio=0.0):
+    return ValidationHERReplayBuffer((3,), (1,), capacity, n_envs, device, env=None, validation_ratio=validation_ratio)
+
+
+def make_step(n_envs, device, done_prob):
+    return (torch.rand(n_envs, 3, device=device), torch.rand(n_envs, 1, device=device), torch.rand(n_envs, 1, device=device),
+            torch.rand(n_envs, 3, device=device), torch.zeros(n_envs, 1, dtype=torch.bool, device=device),
+            torch.rand(n_envs, 1, device=device) < done_prob)
+
+
+def check(device):
+    n_steps, n_envs = 50, 8
+    buffer = make_buffer(n_steps * n_envs, n_envs, device, validation_ratio=0.25)
+    reference = DenseStepsToGo(n_steps, n_envs, device)
+    # episodes stay shorter than the buffer, longer ones were never handled by the dense version either
+    since_done = torch.zeros(n_envs, 1, dtype=torch.long, device=device)
+    for i in range(3 * n_steps + 7):
+        step = make_step(n_envs, device, 0.1)
+        done = step[-1] | (since_done >= n_steps // 2)
+        since_done = (since_done + 1) * (~done)
+        reference.add(buffer.idx, done)
+        buffer.add(*step[:-1], done)
+
+        size = n_steps if buffer.full else buffer.idx
+        for validation in [False, True]:
+            env_offset = buffer.train_envs if validation else 0
+            n = buffer.val_envs if validation else buffer.train_envs
+            idxs = torch.arange(size * n, device=device)
+            episode_ids = buffer.episode_ids[:size, env_offset:env_offset + n].flatten()
+            lazy = buffer.steps_to_go(idxs, episode_ids, n, env_offset)
+            dense = reference.steps_to_go[:size, env_offset:env_offset + n].flatten()
+            assert torch.equal(lazy, dense), f'steps_to_go mismatch after {i + 1} insertions'
+
+            # same random draws on top of the same ranges give the same future goals
+            state = torch.random.get_rng_state()
+            lazy_goals = (idxs + randint(lazy + 1) * n) % (n_steps * n)
+            torch.random.set_rng_state(state)
+            dense_goals = (idxs + randint(dense + 1) * n) % (n_steps * n)
+            assert torch.equal(lazy_goals, dense_goals)
+    print('episode table matches the dense steps_to_go bookkeeping')
+
+
+def time_add(add, steps, device):
+    for step in steps[:10]:
+        add(step)
+    if device.startswith('cuda'):
+        torch.cuda.synchronize()
+    start = time.perf_counter()
+    for step in steps:
+        add(step)
+    if device.startswith('cuda'):
+        torch.cuda.synchronize()
+    return (time.perf_counter() - start) / len(steps)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--device', default='cuda:0' if torch.cuda.is_available() else 'cpu')
+    parser.add_argument('--n_envs', type=int, default=256)
+    parser.add_argument('--capacities', type=int, nargs='+', default=[25_600, 256_000, 1_024_000, 4_096_000])
+    parser.add_argument('--inserts', type=int, default=200)
+    args = parser.parse_args()
+
+    check(args.device)
+    steps = [make_step(args.n_envs, args.device, 0.01) for _ in range(args.inserts)]
+
+    print(f'{"capacity":>10} {"dense add ms":>13} {"table add ms":>13} {"speedup":>8}')
+    for capacity in args.capacities:
+        buffer = make_buffer(capacity, args.n_envs, args.device)
+        table_time = time_add(lambda step: buffer.add(*step), steps, args.device)
+        dense = DenseStepsToGo(buffer.n_steps, args.n_envs, args.device)
+
+        def dense_add(step):
+            dense.add(buffer.idx, step[-1])
+            buffer.add(*step)
+        dense_time = time_add(dense_add, steps, args.device)
+        del buffer, dense
+        print(f'{capacity:>10} {dense_time * 1e3:>13.3f} {table_time * 1e3:>13.3f} {dense_time / table_time:>7.1f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,105 @@
+"""
+Training throughput while eval videos are written, with the encoding done inline (old observer) or by MediaWriter.
+A fake training loop of matmuls produces a video every --video_every iterations. The async writer has to stay within
+--tolerance of the throughput without videos. Checks first that submit(), poll() and close() return within a few
+check intervals when the worker was killed, in both backpressure modes.
+
+    python -m isaacgymenvs.benchmarks.bench_media_writer
+"""
+import argparse
+import tempfile
+import time
+
+import torch
+
+from isaacgymenvs.utils.media_writer import MediaWriter, _encode
+
+
+def check_dead_worker(save_dir, check_interval=0.5):
+    video = torch.zeros(4, 2, 3, 8, 8, dtype=torch.uint8)
+    for backpressure in ['drop', 'block']:
+        writer = MediaWriter(1, backpressure, check_interval)
+        writer.process.kill()
+        writer.process.join()
+        start = time.perf_counter()
+        # the first video fills the queue, the second finds it full and nobody left to empty it
+        assert writer.submit(save_dir, '', 0, video)
+        assert not writer.submit(save_dir, '', 1, video) and writer.dropped == 1
+        results = writer.poll(block=True)
+        assert len(results) == 1 and results[0]['epoch_num'] is None and results[0]['error'] is not None, results
+        assert not writer.alive and writer.queue_depth() == 0
+        assert not writer.submit(save_dir, '', 2, video) and writer.close() == []
+        elapsed = time.perf_counter() - start
+        assert elapsed < 4 * check_interval + 1.0, (backpressure, elapsed)
+
+
+def run(mode, args, save_dir):
+    device = 'cuda' if torch.cuda.is_available() else 'cpu'
+    weights = torch.randn(args.width, args.width, device=device) / args.width ** 0.5
+    x = torch.randn(args.batch, args.width, device=device)
+    images = torch.rand(args.num_envs, 3, args.im_size, args.im_size, device=device)
+    writer = MediaWriter(args.queue_size, args.backpressure) if mode == 'async' else None
+
+    encode_time = 0
+    frames = []
+    start = time.perf_counter()
+    for it in range(args.iterations):
+        for _ in range(args.work):
+            x = torch.tanh(x @ weights)
+        if mode != 'none' and len(frames) < args.video_len:
+            frames.append((images * 255).to(torch.uint8).cpu())
+        if mode != 'none' and (it + 1) % args.video_every == 0:
+            video = torch.stack(frames, 1)
+            frames = []
+            if mode == 'sync':
+                encode_start = time.perf_counter()
+                _encode(save_dir, '', it, video)
+                encode_time += time.perf_counter() - encode_start
+            else:
+                writer.submit(save_dir, '', it, video)
+                encode_time += sum(r['encode_time'] for r in writer.poll())
+    if device == 'cuda':
+        torch.cuda.synchronize()
+    elapsed = time.perf_counter() - start
+
+    dropped = 0
+    if writer is not None:
+        encode_time += sum(r['encode_time'] for r in writer.close())
+        dropped = writer.dropped
+    return args.iterations / elapsed, encode_time, dropped
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--iterations', type=int, default=400)
+    parser.add_argument('--work', type=int, default=20, help='matmuls per training iteration')
+    parser.add_argument('--width', type=int, default=1024)
+    parser.add_argument('--batch', type=int, default=1024)
+    parser.add_argument('--video_every', type=int, default=100)
+    parser.add_argument('--video_len', type=int, default=50)
+    parser.add_argument('--num_envs', type=int, default=16)
+    parser.add_argument('--im_size', type=int, default=128)
+    parser.add_argument('--queue_size', type=int, default=2)
+    parser.add_argument('--backpressure', default='drop', choices=['drop', 'block'])
+    parser.add_argument('--tolerance', type=float, default=0.1)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as save_dir:
+        check_dead_worker(save_dir)
+    print('a dead worker is reported instead of waited for')
+
+    results = {}
+    with tempfile.TemporaryDirectory() as save_dir:
+        print(f'{"mode":>6} {"it/s":>8} {"encode s":>9} {"dropped":>8}')
+        for mode in ['none', 'sync', 'async']:
+            results[mode] = run(mode, args, save_dir)
+            its, encode_time, dropped = results[mode]
+            print(f'{mode:>6} {its:>8.1f} {encode_time:>9.2f} {dropped:>8}')
+
+    slowdown = 1 - results['async'][0] / results['none'][0]
+    print(f'async writer slowdown {slowdown * 100:.1f}%, inline encoding slowdown {(1 - results["sync"][0] / results["none"][0]) * 100:.1f}%')
+    assert slowdown < args.tolerance, f'training throughput dropped by {slowdown * 100:.1f}% while writing videos'
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,51 @@
+"""
+Steps/sec of the vectorized gymnasium Mujoco task as the number of worker processes grows.
+Every worker owns --envs_per_worker envs, the in-process backend (numWorkers=0) is timed as the baseline.
+
+    python -m isaacgymenvs.benchmarks.bench_mujoco_vec --task Hopper-v4
+"""
+import argparse
+import time
+
+import numpy as np
+
+from isaacgymenvs.tasks.mujoco import Mujoco
+
+
+def make_env(task, num_envs, num_workers):
+    cfg = {'task_name': task, 'env': {'numEnvs': num_envs, 'numWorkers': num_workers, 'seed': 0}}
+    return Mujoco(cfg, 'cpu', 'cpu', 0, True, False, False)
+
+
+def time_env(env, steps):
+    env.reset()
+    actions = np.random.uniform(-1, 1, (steps, env.num_envs, env.num_actions)).astype(np.float32)
+    env.step(actions[0])
+    start = time.perf_counter()
+    for i in range(steps):
+        env.step(actions[i])
+    return env.num_envs * steps / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--task', default='Hopper-v4')
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, 8, 16, 32, 64])
+    parser.add_argument('--envs_per_worker', type=int, default=4)
+    parser.add_argument('--steps', type=int, default=500)
+    args = parser.parse_args()
+
+    print(f'{"workers":>8} {"envs":>6} {"in-process sps":>15} {"workers sps":>12} {"speedup":>8}')
+    for num_workers in args.workers:
+        num_envs = num_workers * args.envs_per_worker
+        env = make_env(args.task, num_envs, 0)
+        local_sps = time_env(env, args.steps)
+        env.close()
+        env = make_env(args.task, num_envs, num_workers)
+        worker_sps = time_env(env, args.steps)
+        env.close()
+        print(f'{num_workers:>8} {num_envs:>6} {local_sps:>15.0f} {worker_sps:>12.0f} {worker_sps / local_sps:>7.1f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,119 @@
+"""
+Latency per control step of the franka OSC torques: the explicit inverses the tasks used before against OSCController
+with Cholesky solves, eager and scripted, and with the factorization reused over --refactor_every steps. Runs on CPU
+tensors of the tasks' shapes (7 dof mass matrix, 6x7 end effector Jacobian). Checks first that the Cholesky torques
+match the inverse ones on random well conditioned arms.
+
+    python -m isaacgymenvs.benchmarks.bench_osc --num_envs 1024 4096 16384
+"""
+import argparse
+import time
+
+import torch
+
+from isaacgymenvs.tasks.utils.osc import OSCController, osc_torques_inverse
+
+EFFORT_LIMITS = [87., 87., 87., 87., 12., 12., 12.]
+DEFAULT_Q = [0, 0.1963, 0, -2.6180, 0, 2.9416, 0.7854]
+
+
+def make_gains(device, dtype, effort_limits=EFFORT_LIMITS):
+    kp = torch.full((6,), 150., device=device, dtype=dtype)
+    kp_null = torch.full((7,), 10., device=device, dtype=dtype)
+    return dict(kp=kp, kd=2 * torch.sqrt(kp), kp_null=kp_null, kd_null=2 * torch.sqrt(kp_null),
+                default_q=torch.tensor(DEFAULT_Q, device=device, dtype=dtype),
+                effort_limit=torch.tensor(effort_limits, device=device, dtype=dtype))
+
+
+def make_state(num_envs, device, dtype, generator=None):
+    # mass matrices with the franka's spread of inertias, Jacobians of arms away from singularities
+    a = torch.randn(num_envs, 7, 7, generator=generator, dtype=dtype) * 0.3
+    mm = a @ a.transpose(1, 2) + torch.diag(torch.tensor([2.5, 2.5, 1.5, 1.5, 0.3, 0.3, 0.1], dtype=dtype))
+    j_eef = torch.randn(num_envs, 6, 7, generator=generator, dtype=dtype) * 0.4
+    j_eef[:, :, :6] += torch.eye(6, dtype=dtype) * 0.5
+    state = dict(mm=mm, j_eef=j_eef,
+                 dpose=torch.randn(num_envs, 6, generator=generator, dtype=dtype) * 0.05,
+                 eef_vel=torch.randn(num_envs, 6, generator=generator, dtype=dtype) * 0.3,
+                 q=torch.randn(num_envs, 7, generator=generator, dtype=dtype),
+                 qd=torch.randn(num_envs, 7, generator=generator, dtype=dtype) * 0.5)
+    return {k: v.to(device) for k, v in state.items()}
+
+
+def controller(gains, **kwargs):
+    return OSCController(gains['kp'], gains['kd'], gains['kp_null'], gains['kd_null'], gains['default_q'],
+                         gains['effort_limit'], **kwargs)
+
+
+def reference(state, gains):
+    return osc_torques_inverse(state['mm'], state['j_eef'], state['dpose'], state['eef_vel'], state['q'], state['qd'],
+                               gains['default_q'], gains['kp'], gains['kd'], gains['kp_null'], gains['kd_null'],
+                               gains['effort_limit'])
+
+
+def run(osc, state):
+    return osc(state['mm'], state['j_eef'], state['dpose'], state['eef_vel'], state['q'], state['qd'])
+
+
+def check(device, num_envs=2048):
+    generator = torch.Generator().manual_seed(0)
+    for dtype, rtol in [(torch.float64, 1e-9), (torch.float32, 1e-3)]:
+        # without clipping, so the differences are not hidden by the effort limits
+        gains = make_gains(device, dtype, [1e9] * 7)
+        state = make_state(num_envs, device, dtype, generator)
+        expected = reference(state, gains)
+        scale = expected.abs().max()
+        for backend in ['eager', 'jit']:
+            u = run(controller(gains, backend=backend), state)
+            err = ((u - expected).abs().max() / scale).item()
+            assert err < rtol, f'{backend} {dtype}: relative error {err:.2e}'
+        # a reused factorization is exact while the arm does not move
+        osc = controller(gains, refactor_every=4)
+        for _ in range(4):
+            u = run(osc, state)
+        assert ((u - expected).abs().max() / scale).item() < rtol
+    gains = make_gains(device, torch.float32)
+    state = make_state(num_envs, device, torch.float32, generator)
+    assert torch.allclose(run(controller(gains), state), reference(state, gains), rtol=1e-3, atol=1e-3)
+
+
+def measure(fn, repeats):
+    fn()
+    start = time.perf_counter()
+    for _ in range(repeats):
+        fn()
+    return (time.perf_counter() - start) / repeats
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--num_envs', type=int, nargs='+', default=[1024, 4096, 16384])
+    parser.add_argument('--refactor_every', type=int, default=2)
+    parser.add_argument('--repeats', type=int, default=50)
+    parser.add_argument('--threads', type=int, default=None)
+    parser.add_argument('--compile', action='store_true', help='also time the torch.compile backend')
+    args = parser.parse_args()
+    if args.threads is not None:
+        torch.set_num_threads(args.threads)
+
+    check('cpu')
+    print('Cholesky OSC torques match the explicit inverses in float64 and float32')
+
+    gains = make_gains('cpu', torch.float32)
+    variants = {
+        'eager': controller(gains),
+        'jit': controller(gains, backend='jit'),
+        f'reuse x{args.refactor_every}': controller(gains, refactor_every=args.refactor_every),
+    }
+    if args.compile:
+        variants['compile'] = controller(gains, backend='compile')
+    print(f'{"envs":>6} {"inverse ms":>11} ' + ' '.join(f'{name + " ms":>14}' for name in variants) + f' {"best speedup":>13}')
+    for num_envs in args.num_envs:
+        state = make_state(num_envs, 'cpu', torch.float32)
+        base = measure(lambda: reference(state, gains), args.repeats)
+        times = [measure(lambda: run(osc, state), args.repeats) for osc in variants.values()]
+        print(f'{num_envs:>6} {base * 1e3:>11.2f} ' + ' '.join(f'{t * 1e3:>14.2f}' for t in times)
+              + f' {base / min(times):>12.2f}x')
+
+
+if __name__ == '__main__':
+    main()
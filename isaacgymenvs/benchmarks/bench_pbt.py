@@ -0,0 +1,117 @@
+"""
+PBT end to end on one CPU machine: launches a small population of PPO policies on the Synthetic task through
+pbt.launch_local and checks from the workspace and the logs that a worst policy was replaced, restarted from its copy of
+the best policy's checkpoint, and came back with mutated hyperparameters. The replacement thresholds are 0, so the worst
+policy is replaced at every PBT iteration. Also checks that the rotation keeps every policy's workspace bounded, copies
+included. Reports the wall time of the population and the restarts of every policy.
+
+    python -m isaacgymenvs.benchmarks.bench_pbt --num_policies 4 --epochs 60
+"""
+import argparse
+import os
+import re
+import subprocess
+import sys
+import tempfile
+import time
+from os.path import join
+
+import yaml
+
+from isaacgymenvs.pbt.pbt import NUM_CHECKPOINTS_TO_KEEP
+
+# the initial values of the mutated params in FrankaPushingPPO.yaml, every policy starts from them
+INITIAL_PARAMS = {
+    'train.params.config.learning_rate': 5e-4,
+    'train.params.config.gamma': 0.99,
+    'train.params.config.e_clip': 0.2,
+}
+
+
+def launch(args, train_dir, workspace):
+    horizon_length = 32
+    interval = args.num_envs * horizon_length * args.interval_epochs
+    overrides = [
+        'task=Synthetic', 'train=FrankaPushingPPO', 'sim_device=cpu', 'rl_device=cpu', 'headless=True',
+        f'num_envs={args.num_envs}', f'max_iterations={args.epochs}', f'task.env.episodeLength={args.episode_length}',
+        f'+train.params.config.train_dir={train_dir}', 'train.params.config.test_every_episodes=1000000',
+        f'pbt.interval_steps={interval}', 'pbt.start_after=0', 'pbt.initial_delay=0',
+        'pbt.replace_threshold_frac_std=0', 'pbt.replace_threshold_frac_absolute=0', 'pbt.mutation_rate=1.0',
+    ]
+    cmd = [sys.executable, '-m', 'isaacgymenvs.pbt.launch_local', f'--num_policies={args.num_policies}',
+           f'--workspace={workspace}', f'--train_dir={train_dir}', f'--threads_per_policy={args.threads_per_policy}',
+           '--'] + overrides
+    start = time.perf_counter()
+    output = subprocess.run(cmd, check=True, capture_output=True, text=True).stdout
+    return time.perf_counter() - start, output
+
+
+def latest_yaml(policy_dir):
+    checkpoints = sorted(f for f in os.listdir(policy_dir) if f.endswith('.yaml'))
+    with open(join(policy_dir, checkpoints[-1])) as f:
+        return yaml.safe_load(f)
+
+
+def check(args, train_dir, workspace, output):
+    codes = re.findall(r'policy (\d+) exited with (-?\d+)', output)
+    assert len(codes) == args.num_policies and all(code == '0' for _, code in codes), output
+
+    restarts = {}
+    for policy_idx in range(args.num_policies):
+        policy_dir = join(train_dir, workspace, f'{policy_idx:03d}')
+        with open(join(train_dir, workspace, 'logs', f'policy_{policy_idx:03d}.log')) as f:
+            log = f.read()
+        restarts[policy_idx] = log.count('restarting with')
+        # own checkpoints with their yaml and the copies restarted from, the rotation keeps the newest of each
+        files = os.listdir(policy_dir)
+        own = [f for f in files if '_from_' not in f]
+        copied = [f for f in files if '_from_' in f]
+        assert len(own) <= 2 * NUM_CHECKPOINTS_TO_KEEP and len(copied) <= NUM_CHECKPOINTS_TO_KEEP, (policy_idx, files)
+        assert len(copied) == min(restarts[policy_idx], NUM_CHECKPOINTS_TO_KEEP), (policy_idx, files)
+        if restarts[policy_idx] == 0:
+            continue
+        # the newest copy is never rotated away, it is what the policy restarted from last
+        copies = re.findall(r'replacing weights with policy (\d+)', log)
+        assert len(copies) == restarts[policy_idx], (policy_idx, copies)
+        restarted = log[log.rindex('restarting with'):]
+        loaded = re.search(r"=> loading checkpoint '(.*_from_(\d+)\.pth)'", restarted)
+        assert loaded is not None, f'policy {policy_idx} did not restart from a copied checkpoint'
+        assert os.path.isfile(loaded.group(1)) and os.path.dirname(loaded.group(1)) == os.path.abspath(policy_dir)
+        assert int(loaded.group(2)) == int(copies[-1]) and int(copies[-1]) != policy_idx
+        assert 'starting at iteration' in restarted
+        # with mutation_rate 1 every mutable param moved away from the value all policies started with
+        params = latest_yaml(policy_dir)['params']
+        assert 'train.params.config.gamma' in params, params
+        for param, value in INITIAL_PARAMS.items():
+            if param in params:
+                assert params[param] != value, (policy_idx, param, params[param])
+    assert sum(restarts.values()) > 0, 'no policy was replaced'
+    return restarts
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--num_policies', type=int, default=4)
+    parser.add_argument('--num_envs', type=int, default=64)
+    parser.add_argument('--epochs', type=int, default=60)
+    parser.add_argument('--interval_epochs', type=int, default=10, help='epochs between PBT iterations')
+    parser.add_argument('--episode_length', type=int, default=20)
+    parser.add_argument('--threads_per_policy', type=int, default=1)
+    parser.add_argument('--dir', default=None, help='where to write, defaults to a temporary directory')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(dir=args.dir) as train_dir:
+        workspace = 'bench_pbt'
+        elapsed, output = launch(args, train_dir, workspace)
+        restarts = check(args, train_dir, workspace, output)
+        print('the worst policies were replaced and restarted from their copies of the best checkpoints, mutated')
+
+        print(f'{args.num_policies} policies, {args.epochs} epochs, population wall time {elapsed:.1f} s')
+        print(f'{"policy":>6} {"restarts":>9} {"objective":>10}')
+        for policy_idx, count in restarts.items():
+            objective = latest_yaml(join(train_dir, workspace, f'{policy_idx:03d}'))['true_objective']
+            print(f'{policy_idx:>6} {count:>9} {objective:>10.3f}')
+
+
+if __name__ == '__main__':
+    main()
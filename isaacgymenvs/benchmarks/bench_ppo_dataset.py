@@ -0,0 +1,146 @@
+"""
+Time per epoch of the PPO minibatch data path, from update_values_dict through every mini epoch of shuffle, __getitem__
+and update_mu_sigma: the old PPODataset (per-key gathers into a fresh dict for every minibatch, fixed order or with a
+randperm index) against the staged PPODataset (one gather per dtype per mini epoch, minibatches are views). Checks
+that every mini epoch is a permutation, that the mu/sigma writeback carries over, and the sequence-aware RNN path.
+
+    python -m isaacgymenvs.benchmarks.bench_ppo_dataset --device cuda:0
+"""
+import argparse
+import time
+
+import torch
+
+from isaacgymenvs.ppo.datasets import PPODataset
+
+
+class OldPPODataset:
+    # PPODataset before the staging buffers, with the index writeback that shuffling would need in update_mu_sigma
+    def __init__(self, batch_size, minibatch_size, device, shuffle):
+        self.batch_size, self.minibatch_size, self.device, self.do_shuffle = batch_size, minibatch_size, device, shuffle
+        self.length = batch_size // minibatch_size
+        self.idx = torch.arange(batch_size, dtype=torch.long, device=device)
+
+    def shuffle(self):
+        if self.do_shuffle:
+            self.idx = torch.randperm(self.batch_size, device=self.device)
+
+    def update_values_dict(self, values_dict):
+        self.values_dict = values_dict
+
+    def update_mu_sigma(self, mu, sigma):
+        idx = self.idx[self.last_range[0]:self.last_range[1]]
+        self.values_dict['mu'][idx] = mu
+        self.values_dict['sigma'][idx] = sigma
+
+    def __len__(self):
+        return self.length
+
+    def __getitem__(self, idx):
+        start, end = idx * self.minibatch_size, (idx + 1) * self.minibatch_size
+        self.last_range = (start, end)
+        return {k: v[self.idx[start:end]] for k, v in self.values_dict.items() if v is not None and k != 'rnn_states'}
+
+
+def make_values(batch_size, obs_dim, actions_dim, device, num_games=None, rnn_units=8):
+    ids = torch.arange(batch_size, dtype=torch.float32, device=device)
+    values = {
+        'old_values': ids[:, None].clone(),
+        'old_logp_actions': torch.randn(batch_size, device=device),
+        'advantages': torch.randn(batch_size, device=device),
+        'returns': torch.randn(batch_size, 1, device=device),
+        'actions': torch.randn(batch_size, actions_dim, device=device),
+        'obs': torch.randn(batch_size, obs_dim, device=device),
+        'dones': torch.randint(0, 2, (batch_size,), dtype=torch.uint8, device=device),
+        'rnn_states': None,
+        'rnn_masks': None,
+        'mu': torch.randn(batch_size, actions_dim, device=device),
+        'sigma': torch.rand(batch_size, actions_dim, device=device),
+    }
+    if num_games is not None:
+        values['rnn_masks'] = torch.ones(batch_size, device=device)
+        # the game id in every hidden unit, to check that the states follow their sequences
+        values['rnn_states'] = [torch.arange(num_games, dtype=torch.float32, device=device)[None, :, None].repeat(1, 1, rnn_units)]
+    return values
+
+
+def run_epoch(dataset, values, mini_epochs):
+    dataset.update_values_dict(values)
+    for _ in range(mini_epochs):
+        dataset.shuffle()
+        for i in range(len(dataset)):
+            mb = dataset[i]
+            dataset.update_mu_sigma(mb['mu'] + 1, mb['sigma'])
+    return mb
+
+
+def check(device, mini_epochs=3):
+    batch_size, minibatch_size, seq_length = 512, 64, 8
+    for is_rnn in [False, True]:
+        num_games = batch_size // seq_length if is_rnn else None
+        values = make_values(batch_size, 5, 3, device, num_games)
+        source = {k: v.clone() for k, v in values.items() if torch.is_tensor(v)}
+        dataset = PPODataset(batch_size, minibatch_size, False, is_rnn, device, seq_length)
+        dataset.update_values_dict(values)
+        for _ in range(mini_epochs):
+            dataset.shuffle()
+            seen = []
+            for i in range(len(dataset)):
+                mb = dataset[i]
+                ids = mb['old_values'].view(-1).long()
+                seen.append(ids)
+                assert torch.equal(mb['obs'], source['obs'][ids]) and torch.equal(mb['dones'], source['dones'][ids])
+                if is_rnn:
+                    games = ids.view(-1, seq_length)
+                    assert (games[:, 0] % seq_length == 0).all() and (games.diff(dim=1) == 1).all(), 'a sequence was split'
+                    assert torch.equal(mb['rnn_states'][0][0, :, 0].long(), games[:, 0] // seq_length)
+                dataset.update_mu_sigma(mb['mu'] + 1, mb['sigma'])
+            seen = torch.cat(seen)
+            assert torch.equal(seen.sort().values, torch.arange(batch_size, device=device)), 'not a permutation'
+            assert torch.equal(seen, dataset.idx)
+        # every sample got one writeback per mini epoch, whichever minibatch it landed in
+        mu = torch.cat([dataset[i]['mu'] for i in range(len(dataset))])
+        assert torch.allclose(mu, source['mu'][dataset.idx] + mini_epochs)
+        # the staging buffers are reused for the next epoch
+        staging = [b.data_ptr() for buffers in dataset.staging.values() for b in buffers]
+        dataset.update_values_dict(make_values(batch_size, 5, 3, device, num_games))
+        assert staging == [b.data_ptr() for buffers in dataset.staging.values() for b in buffers]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--batch_sizes', type=int, nargs='+', default=[16384, 65536, 262144])
+    parser.add_argument('--num_minibatches', type=int, default=32)
+    parser.add_argument('--mini_epochs', type=int, default=5)
+    parser.add_argument('--obs_dim', type=int, default=64)
+    parser.add_argument('--actions_dim', type=int, default=8)
+    parser.add_argument('--repeats', type=int, default=5)
+    parser.add_argument('--device', default='cpu')
+    args = parser.parse_args()
+
+    check(args.device)
+    print('every mini epoch is a permutation, sequences stay whole and mu/sigma writebacks persist')
+
+    def epoch_time(dataset, values):
+        run_epoch(dataset, values, args.mini_epochs)
+        if args.device.startswith('cuda'):
+            torch.cuda.synchronize()
+        start = time.perf_counter()
+        for _ in range(args.repeats):
+            run_epoch(dataset, values, args.mini_epochs)
+        if args.device.startswith('cuda'):
+            torch.cuda.synchronize()
+        return (time.perf_counter() - start) / args.repeats
+
+    print(f'{"samples":>8} {"old fixed ms":>13} {"old shuffled ms":>16} {"staged ms":>10} {"vs shuffled":>12}')
+    for batch_size in args.batch_sizes:
+        minibatch_size = batch_size // args.num_minibatches
+        values = make_values(batch_size, args.obs_dim, args.actions_dim, args.device)
+        fixed = epoch_time(OldPPODataset(batch_size, minibatch_size, args.device, shuffle=False), values)
+        shuffled = epoch_time(OldPPODataset(batch_size, minibatch_size, args.device, shuffle=True), values)
+        staged = epoch_time(PPODataset(batch_size, minibatch_size, False, False, args.device, 1), values)
+        print(f'{batch_size:>8} {fixed * 1e3:>13.2f} {shuffled * 1e3:>16.2f} {staged * 1e3:>10.2f} {shuffled / staged:>11.1f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,134 @@
+"""
+Prioritized replay: checks the tensor segment trees against the rl_games ones, then compares the sampling and priority
+update throughput of the per-index rl_games trees (what PrioritizedReplayBuffer does) with
+PrioritizedVectorizedReplayBuffer, for one SAC epoch of gradient_steps batches.
+
+    python -m isaacgymenvs.benchmarks.bench_prioritized_replay --device cuda:0
+"""
+import argparse
+import random
+import time
+
+import numpy as np
+import torch
+from rl_games.common.segment_tree import SumSegmentTree, MinSegmentTree
+
+from isaacgymenvs.sac.experience import PrioritizedVectorizedReplayBuffer
+from isaacgymenvs.sac.segment_tree import TensorSumSegmentTree, TensorMinSegmentTree
+
+
+def check_trees(capacity, device):
+    ref_sum, ref_min = SumSegmentTree(capacity), MinSegmentTree(capacity)
+    tree_sum, tree_min = TensorSumSegmentTree(capacity, device), TensorMinSegmentTree(capacity, device)
+    for _ in range(5):
+        # repeated indices included, the last value has to win as with the loop
+        idxs = np.random.randint(0, capacity, capacity // 2)
+        values = np.random.rand(len(idxs)) + 1e-3
+        for i, v in zip(idxs, values):
+            ref_sum[int(i)] = float(v)
+            ref_min[int(i)] = float(v)
+        tree_sum.update(torch.from_numpy(idxs), torch.from_numpy(values))
+        tree_min.update(torch.from_numpy(idxs), torch.from_numpy(values))
+
+        assert np.isclose(tree_sum.sum().item(), ref_sum.sum()), (tree_sum.sum().item(), ref_sum.sum())
+        assert tree_min.min().item() == ref_min.min(), (tree_min.min().item(), ref_min.min())
+        leaves = np.arange(capacity)
+        assert np.allclose(tree_sum[torch.from_numpy(leaves)].cpu().numpy(), [ref_sum[int(i)] for i in leaves])
+
+        masses = np.random.rand(1000) * ref_sum.sum()
+        found = tree_sum.find_prefixsum_idx(torch.from_numpy(masses)).cpu().numpy()
+        expected = np.array([ref_sum.find_prefixsum_idx(float(m)) for m in masses])
+        assert (found == expected).all(), f'{(found != expected).sum()} prefix sum lookups differ'
+
+
+def check_sampling(device):
+    # with alpha = 1 transitions are sampled in proportion to their priorities
+    buffer = PrioritizedVectorizedReplayBuffer((4,), (2,), 8, device, alpha=1.0, eps=0.0)
+    buffer.add(torch.zeros(8, 4), torch.zeros(8, 2), torch.zeros(8, 1), torch.zeros(8, 4),
+               torch.zeros(8, 1, dtype=torch.bool), torch.zeros(8, 1, dtype=torch.bool))
+    priorities = torch.arange(1, 9, dtype=torch.float32, device=device)
+    buffer.update_priorities(torch.arange(8, device=device), priorities)
+    idxs = torch.cat([buffer.sample(4096, beta=1.0)[-1] for _ in range(50)])
+    freq = torch.bincount(idxs, minlength=8).float().cpu() / len(idxs)
+    assert torch.allclose(freq, priorities.cpu() / priorities.sum().cpu(), atol=0.01), freq
+    weights = buffer.sample(16, beta=1.0)[-2]
+    assert weights.max() <= 1.0 + 1e-6
+
+
+class TreeLoops:
+    # the sampling and priority updates of PrioritizedReplayBuffer, one index at a time
+    def __init__(self, capacity, size, alpha):
+        self.it_sum, self.it_min = SumSegmentTree(capacity), MinSegmentTree(capacity)
+        self.size, self.alpha, self.max_priority = size, alpha, 1.0
+        for idx in range(size):
+            self.it_sum[idx] = 1.0
+            self.it_min[idx] = 1.0
+
+    def sample(self, batch_size, beta):
+        every_range_len = self.it_sum.sum(0, self.size - 1) / batch_size
+        idxes = [self.it_sum.find_prefixsum_idx(random.random() * every_range_len + i * every_range_len) for i in range(batch_size)]
+        max_weight = (self.it_min.min() / self.it_sum.sum() * self.size) ** (-beta)
+        weights = np.array([(self.it_sum[idx] / self.it_sum.sum() * self.size) ** (-beta) / max_weight for idx in idxes])
+        return idxes, weights
+
+    def update_priorities(self, idxes, priorities):
+        for idx, priority in zip(idxes, priorities):
+            self.it_sum[idx] = priority ** self.alpha
+            self.it_min[idx] = priority ** self.alpha
+            self.max_priority = max(self.max_priority, priority)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--size', type=int, default=1_000_000, help='transitions in the buffer')
+    parser.add_argument('--batch_sizes', type=int, nargs='+', default=[256, 4096])
+    parser.add_argument('--gradient_steps', type=int, default=8)
+    parser.add_argument('--obs_dim', type=int, default=32)
+    parser.add_argument('--precision', default='float32', choices=['float32', 'float16'])
+    parser.add_argument('--repeats', type=int, default=5)
+    parser.add_argument('--skip_loops', action='store_true', help='only time the tensor buffer')
+    parser.add_argument('--device', default='cpu')
+    args = parser.parse_args()
+
+    check_trees(1024, args.device)
+    check_sampling(args.device)
+    print('tensor trees match the rl_games trees')
+
+    buffer = PrioritizedVectorizedReplayBuffer((args.obs_dim,), (8,), args.size, args.device, args.precision)
+    for start in range(0, args.size, 65536):
+        n = min(65536, args.size - start)
+        buffer.add(torch.randn(n, args.obs_dim, device=args.device), torch.randn(n, 8, device=args.device),
+                   torch.randn(n, 1, device=args.device), torch.randn(n, args.obs_dim, device=args.device),
+                   torch.zeros(n, 1, dtype=torch.bool, device=args.device), torch.zeros(n, 1, dtype=torch.bool, device=args.device))
+    loops = None if args.skip_loops else TreeLoops(buffer.it_sum.capacity, args.size, buffer.alpha)
+
+    def tensor_epoch(batch_size):
+        for _ in range(args.gradient_steps):
+            *_, weights, idxs = buffer.sample(batch_size)
+            buffer.update_priorities(idxs, torch.rand(batch_size, device=args.device))
+
+    def loop_epoch(batch_size):
+        for _ in range(args.gradient_steps):
+            idxes, weights = loops.sample(batch_size, 0.4)
+            loops.update_priorities(idxes, np.random.rand(batch_size) + 1e-6)
+
+    def samples_per_sec(fn, batch_size):
+        fn(batch_size)
+        if args.device.startswith('cuda'):
+            torch.cuda.synchronize()
+        start = time.perf_counter()
+        for _ in range(args.repeats):
+            fn(batch_size)
+        if args.device.startswith('cuda'):
+            torch.cuda.synchronize()
+        return args.repeats * args.gradient_steps * batch_size / (time.perf_counter() - start)
+
+    print(f'{"batch":>6} {"loops samples/s":>16} {"tensor samples/s":>17} {"speedup":>8}')
+    for batch_size in args.batch_sizes:
+        new = samples_per_sec(tensor_epoch, batch_size)
+        old = samples_per_sec(loop_epoch, batch_size) if loops is not None else float('nan')
+        print(f'{batch_size:>6} {old:>16.0f} {new:>17.0f} {new / old:>7.1f}x')
+
+
+if __name__ == '__main__':
+    main()
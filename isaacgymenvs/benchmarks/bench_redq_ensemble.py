@@ -0,0 +1,137 @@
+"""
+REDQ critic updates/sec, list of per-net Mlps with one Adam each (the old REDQAgent) vs the fused EnsembleMlp.
+Both versions start from the same weights and are first checked to stay in sync over a few updates.
+
+    python -m isaacgymenvs.benchmarks.bench_redq_ensemble --device cuda:0
+"""
+import argparse
+import time
+
+import numpy as np
+import torch
+from torch import nn, optim
+
+from isaacgymenvs.redq_original.core import Mlp, EnsembleMlp, soft_update_model1_with_model2
+
+
+class ListCritic:
+    def __init__(self, q_nets, q_target_nets, lr):
+        self.q_nets, self.q_target_nets = q_nets, q_target_nets
+        self.optimizers = [optim.Adam(q.parameters(), lr=lr) for q in q_nets]
+
+    def target(self, x, heads):
+        return torch.cat([self.q_target_nets[i](x) for i in heads], 1)
+
+    def predict(self, x):
+        return torch.cat([q(x) for q in self.q_nets], 1)
+
+    def step(self, loss, polyak):
+        for opt in self.optimizers:
+            opt.zero_grad()
+        loss.backward()
+        for opt in self.optimizers:
+            opt.step()
+        for q, q_target in zip(self.q_nets, self.q_target_nets):
+            soft_update_model1_with_model2(q_target, q, polyak)
+
+
+class EnsembleCritic:
+    def __init__(self, q_nets, q_target_nets, lr):
+        self.q_net = EnsembleMlp.from_mlps(q_nets)
+        self.q_target_net = EnsembleMlp.from_mlps(q_target_nets)
+        self.optimizer = optim.Adam(self.q_net.parameters(), lr=lr)
+
+    def target(self, x, heads):
+        return self.q_target_net(x, torch.as_tensor(heads, device=x.device)).squeeze(-1).t()
+
+    def predict(self, x):
+        return self.q_net(x).squeeze(-1).t()
+
+    def step(self, loss, polyak):
+        self.optimizer.zero_grad()
+        loss.backward()
+        self.optimizer.step()
+        soft_update_model1_with_model2(self.q_target_net, self.q_net, polyak)
+
+
+def make_nets(num_q, input_size, hidden_sizes, device):
+    q_nets, q_target_nets = [], []
+    for _ in range(num_q):
+        q_nets.append(Mlp(input_size, 1, hidden_sizes).to(device))
+        q_target_nets.append(Mlp(input_size, 1, hidden_sizes).to(device))
+        q_target_nets[-1].load_state_dict(q_nets[-1].state_dict())
+    return q_nets, q_target_nets
+
+
+def update(critic, batch, num_q, num_min, gamma=0.99, polyak=0.995):
+    x, x_next, rews, dones = batch
+    heads = np.random.choice(num_q, num_min, replace=False)
+    with torch.no_grad():
+        min_q = critic.target(x_next, heads).min(dim=1, keepdim=True)[0]
+        y_q = (rews + gamma * (1 - dones) * min_q).expand(-1, num_q)
+    q_prediction = critic.predict(x)
+    loss = nn.functional.mse_loss(q_prediction, y_q) * num_q
+    critic.step(loss, polyak)
+    return loss.detach()
+
+
+def make_batch(batch_size, input_size, device):
+    return (torch.randn(batch_size, input_size, device=device), torch.randn(batch_size, input_size, device=device),
+            torch.randn(batch_size, 1, device=device), (torch.rand(batch_size, 1, device=device) < 0.05).float())
+
+
+def check(args, device):
+    q_nets, q_target_nets = make_nets(10, args.input_size, args.hidden_sizes, device)
+    ensemble = EnsembleCritic(q_nets, q_target_nets, args.lr)
+    reference = ListCritic(q_nets, q_target_nets, args.lr)
+    for _ in range(5):
+        batch = make_batch(args.batch_size, args.input_size, device)
+        state = np.random.get_state()
+        ref_loss = update(reference, batch, 10, 2)
+        np.random.set_state(state)
+        loss = update(ensemble, batch, 10, 2)
+        assert torch.allclose(loss, ref_loss, rtol=1e-4, atol=1e-5), f'loss mismatch {loss} vs {ref_loss}'
+    stacked = EnsembleMlp.from_mlps(q_target_nets)
+    for p, ref in zip(ensemble.q_target_net.parameters(), stacked.parameters()):
+        assert torch.allclose(p, ref, rtol=1e-4, atol=1e-5), f'target mismatch {(p - ref).abs().max()}'
+    print('ensemble critic matches the per-net critics')
+
+
+def time_critic(critic, num_q, args, device):
+    batches = [make_batch(args.batch_size, args.input_size, device) for _ in range(8)]
+    for i in range(5):
+        update(critic, batches[i % 8], num_q, 2)
+    if device.startswith('cuda'):
+        torch.cuda.synchronize()
+    start = time.perf_counter()
+    for i in range(args.updates):
+        loss = update(critic, batches[i % 8], num_q, 2)
+    loss.item()
+    return args.updates / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--device', default='cuda:0' if torch.cuda.is_available() else 'cpu')
+    parser.add_argument('--num_q', type=int, nargs='+', default=[2, 10, 20])
+    parser.add_argument('--input_size', type=int, default=14)
+    parser.add_argument('--hidden_sizes', type=int, nargs='+', default=[256, 256])
+    parser.add_argument('--batch_size', type=int, default=256)
+    parser.add_argument('--updates', type=int, default=200)
+    parser.add_argument('--lr', type=float, default=3e-4)
+    args = parser.parse_args()
+
+    torch.manual_seed(0)
+    np.random.seed(0)
+    check(args, args.device)
+
+    print(f'{"N":>4} {"list upd/s":>11} {"ensemble upd/s":>15} {"speedup":>8}')
+    for num_q in args.num_q:
+        q_nets, q_target_nets = make_nets(num_q, args.input_size, args.hidden_sizes, args.device)
+        ensemble_ups = time_critic(EnsembleCritic(q_nets, q_target_nets, args.lr), num_q, args, args.device)
+        list_ups = time_critic(ListCritic(q_nets, q_target_nets, args.lr), num_q, args, args.device)
+        print(f'{num_q:>4} {list_ups:>11.1f} {ensemble_ups:>15.1f} {ensemble_ups / list_ups:>7.1f}x')
+
+
+if __name__ == '__main__':
+    main()
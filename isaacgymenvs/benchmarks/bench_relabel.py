@@ -0,0 +1,124 @@
+"""
+Time and memory per epoch of the hindsight relabeling in ContinuousA2CBase.relabel_batch: the old path, which deep
+copies the experience buffer, against relabeling in place into the preallocated relabel tensors. Runs the PAWR agent
+on the Synthetic task, checks that both give the same batch with relabel_ratio 1, then times relabel_ratio 1 and 0.25.
+
+    python -m isaacgymenvs.benchmarks.bench_relabel --device cuda:0 --num_envs 4096
+"""
+import argparse
+import copy
+import tempfile
+import time
+
+import torch
+
+from isaacgymenvs.benchmarks.bench_agents import build_agent, compose_config, start_on_policy
+from isaacgymenvs.ppo.a2c_common import swap_and_flatten01
+
+
+def deepcopy_relabel(agent, buffer):
+    # relabel_batch before the in-place version, with the goal at the hard-coded obs[7:10]
+    env = agent.vec_env.env
+    relabeled_buffer = copy.deepcopy(buffer)
+    obs = relabeled_buffer.tensor_dict['obses']
+    idx = relabeled_buffer.tensor_dict['dones']
+    present, first_idx = idx.max(0)
+    first_idx[present == 0] = agent.horizon_length - 1
+    idx = idx.flip(0).cumsum(0).flip(0)
+    idx = idx[[0]] - idx
+    ep_len = env.max_episode_length
+    idx = idx * ep_len + first_idx[None, :]
+    idx = torch.minimum(idx, (obs.shape[0] - 1) * torch.ones([1], dtype=torch.int32, device=idx.device))[:, :, None]
+    goal = obs[:, :, env.target_idx]
+    idx = idx.repeat(1, 1, goal.shape[2])
+    goal = torch.gather(goal, 0, idx)
+    relabeled_buffer.tensor_dict['obses'][:, :, 7:10] = goal
+    target_pos = relabeled_buffer.tensor_dict['obses'][..., env.target_idx]
+
+    last_obs = dict(obs=agent.obs['obs'].clone())
+    last_obs['obs'][:, 7:10] = relabeled_buffer.tensor_dict['obses'][-1, :, 7:10]
+    goal = torch.cat([goal[1:], last_obs['obs'][None, :, 7:10]], 0)
+    target_pos = torch.cat([target_pos[1:], last_obs['obs'][None, :, env.target_idx]], 0)
+
+    n_slices = min(16, obs.shape[0])
+    obs = relabeled_buffer.tensor_dict['obses'].reshape([n_slices, -1] + list(obs.shape[1:]))
+    res_dicts = [agent.run_model(dict(obs=obs[i].flatten(0, 1))) for i in range(n_slices)]
+    res_dict = {}
+    for k in res_dicts[0]:
+        if k in relabeled_buffer.tensor_dict:
+            res_dict[k] = torch.stack([d[k] for d in res_dicts], 0).reshape(agent.horizon_length, agent.num_actors, -1)
+    res_dict.pop('actions')
+    res_dict['neglogpacs'] = agent.model.neglogp(relabeled_buffer.tensor_dict['actions'], res_dict['mus'], res_dict['sigmas'], torch.log(res_dict['sigmas']))
+    relabeled_buffer.tensor_dict.update(res_dict)
+
+    rewards = env.compute_franka_reward({'goal_pos': goal, env.target_name: target_pos})[:, :, None]
+    if agent.value_bootstrap:
+        rewards += agent.gamma * relabeled_buffer.tensor_dict['values'] * relabeled_buffer.tensor_dict['dones'].unsqueeze(2).float()
+    relabeled_buffer.tensor_dict['rewards'] = rewards
+
+    last_values = agent.get_values(last_obs)
+    fdones = agent.dones.float()
+    mb_fdones = relabeled_buffer.tensor_dict['dones'].float()
+    mb_values = relabeled_buffer.tensor_dict['values']
+    mb_advs = agent.discount_values(fdones, last_values, mb_fdones, mb_values, rewards)
+    relabeled_batch = relabeled_buffer.get_transformed_list(swap_and_flatten01, agent.tensor_list)
+    relabeled_batch['returns'] = swap_and_flatten01(mb_advs + mb_values)
+    return relabeled_buffer, relabeled_batch
+
+
+def measure(fn, agent, repeats, device):
+    fn(agent, agent.experience_buffer)
+    cuda = device.startswith('cuda')
+    if cuda:
+        torch.cuda.synchronize()
+        torch.cuda.reset_peak_memory_stats()
+        base = torch.cuda.memory_allocated()
+    start = time.perf_counter()
+    for _ in range(repeats):
+        fn(agent, agent.experience_buffer)
+    if cuda:
+        torch.cuda.synchronize()
+    elapsed = (time.perf_counter() - start) / repeats
+    peak = (torch.cuda.max_memory_allocated() - base) / 2 ** 20 if cuda else float('nan')
+    return elapsed, peak
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--device', default='cpu')
+    parser.add_argument('--num_envs', type=int, default=1024)
+    parser.add_argument('--step_cost', type=int, default=1)
+    parser.add_argument('--reset_pattern', default='staggered')
+    parser.add_argument('--ratios', type=float, nargs='+', default=[1.0, 0.25])
+    parser.add_argument('--repeats', type=int, default=10)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    buffer_mb = None
+    print(f'{"path":>22} {"ms/epoch":>9} {"peak extra MB":>14} {"persistent MB":>14}')
+    for ratio in args.ratios:
+        cfg = compose_config('gc_a2c_continuous', args)
+        cfg.train.params.config.relabel_ratio = ratio
+        with tempfile.TemporaryDirectory() as train_dir:
+            agent = build_agent('gc_a2c_continuous', cfg, train_dir)
+            start_on_policy(agent)
+            agent.set_eval()
+            with torch.no_grad():
+                agent.play_steps()
+                if buffer_mb is None:
+                    tensors = agent.experience_buffer.tensor_dict.values()
+                    buffer_mb = sum(t.numel() * t.element_size() for t in tensors if torch.is_tensor(t)) / 2 ** 20
+                    _, old_batch = deepcopy_relabel(agent, agent.experience_buffer)
+                    _, new_batch = agent.relabel_batch(agent.experience_buffer)
+                    for k in ['obses', 'values', 'mus', 'sigmas', 'neglogpacs', 'returns']:
+                        assert torch.allclose(old_batch[k], new_batch[k], atol=1e-5), f'{k} differs from the deepcopy path'
+                    t, peak = measure(deepcopy_relabel, agent, args.repeats, args.device)
+                    print(f'{"deepcopy":>22} {t * 1e3:>9.1f} {peak:>14.1f} {0.0:>14.1f}')
+                t, peak = measure(type(agent).relabel_batch, agent, args.repeats, args.device)
+                persistent = sum(x.numel() * x.element_size() for x in agent.relabel_tensors.values()) / 2 ** 20
+                print(f'{f"in place, ratio {ratio}":>22} {t * 1e3:>9.1f} {peak:>14.1f} {persistent:>14.1f}')
+    print(f'experience buffer {buffer_mb:.1f} MB')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,109 @@
+"""
+Sample latency of sac/experience.ReplayBuffer: the old per-index Python loop of _encode_sample against the
+vectorized gathers from the structured storage, for batch sizes from 256 to 16k. Also checks the n-step returns
+against a per-sample reference and that save/load round trips without pickle.
+
+    python -m isaacgymenvs.benchmarks.bench_replay_sampling --n_step 3
+"""
+import argparse
+import tempfile
+import time
+
+import gym
+import numpy as np
+
+from isaacgymenvs.sac.experience import ReplayBuffer
+
+
+def loop_encode_sample(buffer, idxes):
+    # the old _encode_sample, one transition at a time
+    batch_size = len(idxes)
+    obses_t, actions, rewards, obses_tp1, dones = [None] * batch_size, [None] * batch_size, [None] * batch_size, [None] * batch_size, [None] * batch_size
+    it = 0
+    for i in idxes:
+        obs_t, action, reward, obs_tp1, done = buffer._get(i)
+        obses_t[it] = np.array(obs_t, copy=False)
+        actions[it] = np.array(action, copy=False)
+        rewards[it] = reward
+        obses_tp1[it] = np.array(obs_tp1, copy=False)
+        dones[it] = done
+        it = it + 1
+    return np.array(obses_t), np.array(actions), np.array(rewards), np.array(obses_tp1), np.array(dones)
+
+
+def reference_n_step(buffer, idx, n_step, gamma):
+    ret, steps = 0.0, 0
+    for k in range(n_step):
+        j = (idx + k) % buffer._maxsize
+        if k > 0 and (done or k > (buffer._next_idx - 1 - idx) % buffer._maxsize):
+            break
+        obs, action, reward, next_obs, done = buffer._get(j)
+        ret += gamma ** k * reward
+        steps += 1
+    return ret, next_obs, bool(done), gamma ** steps
+
+
+def fill(buffer, num, obs_dim, done_prob):
+    for _ in range(num):
+        buffer.add(np.random.randn(obs_dim), np.random.randint(8), np.random.randn(), np.random.randn(obs_dim),
+                   np.random.rand() < done_prob)
+
+
+def check(obs_dim, n_step, gamma):
+    ob_space = gym.spaces.Box(-np.inf, np.inf, (obs_dim,), np.float32)
+    buffer = ReplayBuffer(500, ob_space, n_step=n_step, gamma=gamma)
+    # wraps around so that the newest transition is in the middle of the storage
+    fill(buffer, 700, obs_dim, 0.1)
+    idxes = np.arange(len(buffer))
+    batch = buffer._encode_sample(idxes)
+    if n_step == 1:
+        for new, old in zip(batch, loop_encode_sample(buffer, idxes)):
+            assert np.array_equal(new, old)
+    else:
+        obses, actions, rewards, next_obses, dones, discounts = batch
+        for i in idxes:
+            ret, next_obs, done, discount = reference_n_step(buffer, i, n_step, gamma)
+            assert np.isclose(rewards[i], ret) and np.array_equal(next_obses[i], next_obs)
+            assert dones[i] == done and np.isclose(discounts[i], discount)
+
+    with tempfile.TemporaryDirectory() as path:
+        buffer.save(path)
+        restored = ReplayBuffer(500, ob_space, n_step=n_step, gamma=gamma)
+        restored.load(path)
+        assert np.array_equal(restored._storage, buffer._storage) and restored._next_idx == buffer._next_idx
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--size', type=int, default=100_000)
+    parser.add_argument('--obs_dim', type=int, default=32)
+    parser.add_argument('--batch_sizes', type=int, nargs='+', default=[256, 1024, 4096, 16384])
+    parser.add_argument('--n_step', type=int, default=1)
+    parser.add_argument('--gamma', type=float, default=0.99)
+    parser.add_argument('--repeats', type=int, default=10)
+    args = parser.parse_args()
+
+    check(args.obs_dim, 1, args.gamma)
+    check(args.obs_dim, max(args.n_step, 3), args.gamma)
+    print('vectorized sampling matches the loop and the n-step reference')
+
+    ob_space = gym.spaces.Box(-np.inf, np.inf, (args.obs_dim,), np.float32)
+    buffer = ReplayBuffer(args.size, ob_space, n_step=args.n_step, gamma=args.gamma)
+    fill(buffer, args.size, args.obs_dim, 0.01)
+
+    def latency(fn, batch_size):
+        idxes = np.random.randint(0, len(buffer), batch_size)
+        start = time.perf_counter()
+        for _ in range(args.repeats):
+            fn(buffer, idxes)
+        return (time.perf_counter() - start) / args.repeats
+
+    print(f'{"batch":>6} {"loop ms":>9} {"vectorized ms":>14} {"speedup":>8}')
+    for batch_size in args.batch_sizes:
+        old = latency(loop_encode_sample, batch_size)
+        new = latency(ReplayBuffer._encode_sample, batch_size)
+        print(f'{batch_size:>6} {old * 1e3:>9.2f} {new * 1e3:>14.3f} {old / new:>7.1f}x')
+
+
+if __name__ == '__main__':
+    main()
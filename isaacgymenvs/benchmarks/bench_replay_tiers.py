@@ -0,0 +1,162 @@
+"""
+Sample latency and peak memory of the all-in-memory VectorizedReplayBuffer against the tiered
+(device ring + memory-mapped files) TieredReplayBuffer. Every configuration runs in a fresh process so
+that peak RSS is not shared between them. Also checks that save()/load() round-trips the tiered buffer and that it is
+full, as fill_buffer_first waits for, only once both tiers are, like the in-memory buffer of the same capacity, and that
+the cold rows are gathered into the same few host buffers for every sample without mixing up transitions.
+
+    python -m isaacgymenvs.benchmarks.bench_replay_tiers --capacity 8000000 --device cuda:0
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+import torch
+
+from isaacgymenvs.sac import experience
+
+
+def make_buffer(mode, args, cold_dir):
+    if mode == 'memory':
+        return experience.VectorizedReplayBuffer((args.obs_dim,), (args.action_dim,), args.capacity, args.device, args.precision)
+    return experience.TieredReplayBuffer((args.obs_dim,), (args.action_dim,), args.hot_capacity, args.capacity - args.hot_capacity,
+                                         cold_dir, args.device, args.precision, prefetch=args.prefetch)
+
+
+def fill(buffer, args):
+    n = args.num_envs
+    obs = torch.randn(n, args.obs_dim, device=args.device)
+    action = torch.rand(n, args.action_dim, device=args.device)
+    reward = torch.randn(n, 1, device=args.device)
+    done = torch.zeros(n, 1, dtype=torch.bool, device=args.device)
+    for _ in range(args.capacity // n):
+        buffer.add(obs, action, reward, obs, done, done)
+
+
+def run_single(mode, args):
+    with tempfile.TemporaryDirectory() as cold_dir:
+        buffer = make_buffer(mode, args, cold_dir)
+        start = time.perf_counter()
+        fill(buffer, args)
+        fill_time = time.perf_counter() - start
+
+        for _ in range(10):
+            buffer.sample(args.batch_size)
+        latencies = []
+        for _ in range(args.samples):
+            start = time.perf_counter()
+            batch = buffer.sample(args.batch_size)
+            if args.device.startswith('cuda'):
+                torch.cuda.synchronize()
+            latencies.append(time.perf_counter() - start)
+        if mode == 'tiered':
+            buffer.close()
+        latencies = torch.tensor(latencies) * 1e3
+        result = {
+            'mode': mode,
+            'fill_s': fill_time,
+            'sample_ms_mean': latencies.mean().item(),
+            'sample_ms_p99': latencies.quantile(0.99).item(),
+            'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+            'peak_device_mb': torch.cuda.max_memory_allocated() / 2 ** 20 if args.device.startswith('cuda') else 0.0,
+        }
+    print(json.dumps(result))
+
+
+def check_save_load(args):
+    small = argparse.Namespace(**vars(args))
+    small.capacity, small.hot_capacity, small.num_envs = 4096, 1024, 256
+    with tempfile.TemporaryDirectory() as tmp:
+        buffer = make_buffer('tiered', small, os.path.join(tmp, 'cold'))
+        fill(buffer, small)
+        buffer.add(*[torch.randn(small.num_envs, d, device=args.device) for d in [args.obs_dim, args.action_dim, 1, args.obs_dim]],
+                   torch.ones(small.num_envs, 1, dtype=torch.bool, device=args.device), None)
+        buffer.save(os.path.join(tmp, 'saved'))
+        restored = make_buffer('tiered', small, os.path.join(tmp, 'cold_restored'))
+        restored.load(os.path.join(tmp, 'saved'))
+        assert (restored.idx, restored.hot_full, restored.cold_idx, restored.cold_full) == \
+            (buffer.idx, buffer.hot_full, buffer.cold_idx, buffer.cold_full)
+        for a, b in zip(buffer._hot_data(), restored._hot_data()):
+            assert torch.equal(a, b)
+        for a, b in zip(buffer.cold, restored.cold):
+            assert (a == b).all()
+    print('tiered buffer save/load round-trips')
+
+
+def check_full(args):
+    small = argparse.Namespace(**vars(args))
+    small.capacity, small.hot_capacity, small.num_envs = 4096, 1024, 256
+    batch = [torch.randn(small.num_envs, d, device=args.device) for d in [args.obs_dim, args.action_dim, 1, args.obs_dim]]
+    done = torch.zeros(small.num_envs, 1, dtype=torch.bool, device=args.device)
+    with tempfile.TemporaryDirectory() as tmp:
+        tiered = make_buffer('tiered', small, os.path.join(tmp, 'cold'))
+        memory = make_buffer('memory', small, None)
+        for _ in range(small.capacity // small.num_envs + 2):
+            tiered.add(*batch, done, done)
+            memory.add(*batch, done, done)
+            assert tiered.full == memory.full and tiered.size == memory.size, (tiered.size, memory.size)
+        assert tiered.full and tiered.hot_full and tiered.cold_full
+        tiered.close()
+    print('the tiered buffer is full when both tiers are, as the in-memory buffer of the same capacity')
+
+
+def check_cold_pool(args, samples=50):
+    small = argparse.Namespace(**vars(args))
+    small.capacity, small.hot_capacity, small.num_envs, small.precision = 4096, 1024, 256, 'float32'
+    with tempfile.TemporaryDirectory() as tmp:
+        buffer = make_buffer('tiered', small, os.path.join(tmp, 'cold'))
+        done = torch.zeros(small.num_envs, 1, dtype=torch.bool, device=args.device)
+        # every transition carries its number in all fields, so a row of one batch never pairs with a row of another
+        for step in range(small.capacity // small.num_envs):
+            value = torch.arange(step * small.num_envs, (step + 1) * small.num_envs, device=args.device, dtype=torch.float32)
+            obs = value[:, None].expand(-1, args.obs_dim).contiguous()
+            buffer.add(obs, value[:, None].expand(-1, args.action_dim), value[:, None], obs, done, done)
+        ptrs = set()
+        for _ in range(samples):
+            obses, actions, rewards, next_obses, dones = buffer.sample(small.batch_size)
+            for t in [obses, actions, next_obses]:
+                assert torch.equal(t, rewards.expand_as(t))
+            ptrs |= {row.data_ptr() for slot in buffer._pool for row in slot}
+        assert len(ptrs) == (max(small.prefetch, 0) + 2) * len(buffer.cold), len(ptrs)
+        buffer.close()
+    print('the cold rows are gathered into a fixed pool of host buffers')
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--device', default='cuda:0' if torch.cuda.is_available() else 'cpu')
+    parser.add_argument('--capacity', type=int, default=4_194_304)
+    parser.add_argument('--hot_capacity', type=int, default=524_288)
+    parser.add_argument('--num_envs', type=int, default=4096)
+    parser.add_argument('--obs_dim', type=int, default=60)
+    parser.add_argument('--action_dim', type=int, default=7)
+    parser.add_argument('--batch_size', type=int, default=4096)
+    parser.add_argument('--samples', type=int, default=200)
+    parser.add_argument('--prefetch', type=int, default=2)
+    parser.add_argument('--precision', default='float32')
+    parser.add_argument('--single', default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.single is not None:
+        run_single(args.single, args)
+        return
+
+    check_save_load(args)
+    check_full(args)
+    check_cold_pool(args)
+    print(f'{"mode":>8} {"fill s":>8} {"sample ms":>10} {"p99 ms":>8} {"peak RSS MB":>12} {"peak dev MB":>12}')
+    for mode in ['memory', 'tiered']:
+        cmd = [sys.executable, '-m', 'isaacgymenvs.benchmarks.bench_replay_tiers', '--single', mode] + sys.argv[1:]
+        out = subprocess.run(cmd, capture_output=True, text=True, check=True).stdout
+        r = json.loads(out.strip().splitlines()[-1])
+        print(f'{mode:>8} {r["fill_s"]:>8.1f} {r["sample_ms_mean"]:>10.3f} {r["sample_ms_p99"]:>8.3f} '
+              f'{r["peak_rss_mb"]:>12.0f} {r["peak_device_mb"]:>12.0f}')
+
+
+if __name__ == '__main__':
+    main()
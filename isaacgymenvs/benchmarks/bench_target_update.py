@@ -0,0 +1,111 @@
+"""
+Per-update cost of the soft target update: the old per-parameter Polyak loop of SACAgent.soft_update_params against
+TargetNetwork, flattened (one lerp_) and unflattened (foreach), on a SAC-sized pair of layer-norm critics. Checks that
+all three give the same target weights.
+
+    python -m isaacgymenvs.benchmarks.bench_target_update --device cuda:0
+"""
+import argparse
+import copy
+import time
+
+import torch
+from torch import nn
+
+from isaacgymenvs.ppo.torch_ext import TargetNetwork
+
+
+def make_critic(in_dim, units, num_q):
+    def mlp():
+        layers, last = [], in_dim
+        for u in units:
+            layers += [nn.Linear(last, u), nn.LayerNorm(u), nn.ELU()]
+            last = u
+        return nn.Sequential(*layers, nn.Linear(last, 1))
+    return nn.ModuleList([mlp() for _ in range(num_q)])
+
+
+def loop_update(net, target_net, tau):
+    # SACAgent.soft_update_params before TargetNetwork
+    for param, target_param in zip(net.parameters(), target_net.parameters()):
+        target_param.data.copy_(tau * param.data + (1.0 - tau) * target_param.data)
+
+
+def perturb(net):
+    with torch.no_grad():
+        for p in net.parameters():
+            p.add_(0.01 * torch.randn_like(p))
+
+
+def check(args):
+    net = make_critic(args.in_dim, args.units, args.num_q).to(args.device)
+    targets = [copy.deepcopy(net) for _ in range(3)]
+    flat = TargetNetwork(net, targets[1], args.tau)
+    foreach = TargetNetwork(net, targets[2], args.tau)
+    foreach.flat = None
+    for _ in range(5):
+        perturb(net)
+        loop_update(net, targets[0], args.tau)
+        flat.update()
+        foreach.update()
+    for target in targets[1:]:
+        for p, q in zip(targets[0].parameters(), target.parameters()):
+            assert torch.allclose(p, q, atol=1e-6), 'target weights differ from the loop'
+
+    # the interval skips updates and EMA mode copies the model
+    ema = TargetNetwork(net, tau=args.tau, update_interval=2)
+    before = [p.clone() for p in ema.target_net.parameters()]
+    perturb(net)
+    ema.update()
+    assert all(torch.equal(p, q) for p, q in zip(before, ema.target_net.parameters()))
+    ema.update()
+    assert not all(torch.equal(p, q) for p, q in zip(before, ema.target_net.parameters()))
+
+
+def time_update(fn, args):
+    for _ in range(10):
+        fn()
+    if args.device.startswith('cuda'):
+        torch.cuda.synchronize()
+    start = time.perf_counter()
+    for _ in range(args.repeats):
+        fn()
+    if args.device.startswith('cuda'):
+        torch.cuda.synchronize()
+    return (time.perf_counter() - start) / args.repeats
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--in_dim', type=int, default=40, help='obs + action dim')
+    parser.add_argument('--units', type=int, nargs='+', default=[512, 256, 128])
+    parser.add_argument('--num_q', type=int, default=2)
+    parser.add_argument('--tau', type=float, default=0.005)
+    parser.add_argument('--gradient_steps', type=int, default=8)
+    parser.add_argument('--repeats', type=int, default=200)
+    parser.add_argument('--device', default='cpu')
+    args = parser.parse_args()
+
+    check(args)
+    print('flattened and foreach updates match the per-parameter loop')
+
+    net = make_critic(args.in_dim, args.units, args.num_q).to(args.device)
+    num_params = len(list(net.parameters()))
+    loop_target = copy.deepcopy(net)
+    foreach = TargetNetwork(net, copy.deepcopy(net), args.tau)
+    foreach.flat = None
+    flat = TargetNetwork(net, copy.deepcopy(net), args.tau)
+
+    results = {
+        'loop': time_update(lambda: loop_update(net, loop_target, args.tau), args),
+        'foreach': time_update(foreach.update, args),
+        'flat lerp_': time_update(flat.update, args),
+    }
+    print(f'{num_params} parameter tensors, {sum(p.numel() for p in net.parameters())} weights')
+    print(f'{"update":>12} {"us/update":>10} {"ms/epoch":>9} {"speedup":>8}')
+    for name, t in results.items():
+        print(f'{name:>12} {t * 1e6:>10.1f} {t * args.gradient_steps * 1e3:>9.3f} {results["loop"] / t:>7.1f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,62 @@
+"""
+Startup cost of the task registry, measured with `python -X importtime` in fresh interpreters.
+
+    python -m isaacgymenvs.benchmarks.bench_task_import
+"""
+import argparse
+import re
+import subprocess
+import sys
+import time
+
+
+SCENARIOS = {
+    # what every tooling script / Mujoco run pays now
+    'registry only': 'from isaacgymenvs.tasks import isaacgym_task_map',
+    'lookup Mujoco': 'from isaacgymenvs.tasks import isaacgym_task_map; isaacgym_task_map["Mujoco"]',
+    'lookup FrankaPushing': 'from isaacgymenvs.tasks import isaacgym_task_map; isaacgym_task_map["FrankaPushing"]',
+    # equivalent of the old eager __init__ that imported every task module
+    'resolve all tasks': 'from isaacgymenvs.tasks import isaacgym_task_map; [isaacgym_task_map[k] for k in isaacgym_task_map]',
+}
+
+_IMPORTTIME_RE = re.compile(r'import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)')
+
+
+def run_scenario(code):
+    # isaacgym has to be imported before torch, same as in train.py
+    code = 'try:\n    import isaacgym\nexcept ImportError:\n    pass\n' + code
+    start = time.perf_counter()
+    proc = subprocess.run([sys.executable, '-X', 'importtime', '-c', code], capture_output=True, text=True)
+    wall = time.perf_counter() - start
+    if proc.returncode != 0:
+        raise RuntimeError(proc.stderr.strip().splitlines()[-1])
+
+    total_us = 0
+    modules = 0
+    for line in proc.stderr.splitlines():
+        match = _IMPORTTIME_RE.match(line)
+        if match is None:
+            continue
+        modules += 1
+        # top level imports only, their cumulative time already includes their children
+        if len(match.group(3)) == 1:
+            total_us += int(match.group(2))
+    return wall, total_us / 1e6, modules
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--repeats', type=int, default=3)
+    args = parser.parse_args()
+
+    baseline = run_scenario('pass')
+    print(f'{"scenario":<22} {"wall s":>8} {"import s":>9} {"modules":>8}')
+    print(f'{"interpreter only":<22} {baseline[0]:>8.2f} {baseline[1]:>9.2f} {baseline[2]:>8}')
+    for name, code in SCENARIOS.items():
+        runs = [run_scenario(code) for _ in range(args.repeats)]
+        wall, import_time, modules = min(runs)
+        print(f'{name:<22} {wall:>8.2f} {import_time:>9.2f} {modules:>8}')
+
+
+if __name__ == '__main__':
+    main()
@@ -28,11 +28,11 @@
 
 import torch 
 
-from rl_games.algos_torch import torch_ext
 from rl_games.algos_torch.running_mean_std import RunningMeanStd
 from rl_games.common.player import BasePlayer
 
 import isaacgymenvs.learning.common_player as common_player
+from isaacgymenvs.ppo import torch_ext
 
 
 class AMPPlayerContinuous(common_player.CommonPlayer):
@@ -48,9 +48,17 @@ class AMPPlayerContinuous(common_player.CommonPlayer):
         return
 
     def restore(self, fn):
-        super().restore(fn)
+        # the rl_games restore cannot read compressed checkpoints, load them once here instead
+        checkpoint = torch_ext.load_checkpoint(fn)
+        self.model.load_state_dict(checkpoint['model'])
+        if self.normalize_input and 'running_mean_std' in checkpoint:
+            self.model.running_mean_std.load_state_dict(checkpoint['running_mean_std'])
+
+        env_state = checkpoint.get('env_state', None)
+        if self.env is not None and env_state is not None:
+            self.env.set_env_state(env_state)
+
         if self._normalize_amp_input:
-            checkpoint = torch_ext.load_checkpoint(fn)
             self._amp_input_mean_std.load_state_dict(checkpoint['amp_input_mean_std'])
         return
     
@@ -33,6 +33,8 @@ from rl_games.algos_torch import torch_ext
 from rl_games.algos_torch.running_mean_std import RunningMeanStd
 from rl_games.common.player import BasePlayer
 
+from isaacgymenvs.ppo import player as ppo_player
+
 
 class CommonPlayer(players.PpoPlayerContinuous):
 
@@ -51,6 +53,9 @@ class CommonPlayer(players.PpoPlayerContinuous):
         
         return
 
+    # the rl_games version probes a new checkpoint with a raw torch.load, which cannot read compressed ones
+    maybe_load_new_checkpoint = ppo_player.BasePlayer.maybe_load_new_checkpoint
+
     def run(self):
         n_games = self.games_num
         render = self.render_env
@@ -0,0 +1,61 @@
+"""
+Runs a whole PBT population as local processes, e.g. 8 policies on one CPU machine:
+
+    cd isaacgymenvs
+    python -m isaacgymenvs.pbt.launch_local --num_policies 8 --workspace pbt_hopper -- \
+        task=Mujoco train=MujocoHopperSAC sim_device=cpu rl_device=cpu pbt.interval_steps=100000
+
+Every policy is a regular train.py run with pbt=pbt_default and its own pbt.policy_idx and seed. Policies that get
+replaced restart themselves in place (os.execv), so the launcher only has to wait for the processes to finish.
+Output of every policy goes to <train_dir>/<workspace>/logs/.
+"""
+import argparse
+import os
+import subprocess
+import sys
+import time
+from os.path import join
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--num_policies', type=int, default=8)
+    parser.add_argument('--workspace', default='pbt_workspace')
+    parser.add_argument('--train_dir', default='runs')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--threads_per_policy', type=int, default=None,
+                        help='torch/OMP threads per policy, defaults to splitting the cores evenly')
+    parser.add_argument('overrides', nargs='*', help='hydra overrides passed to every policy')
+    args = parser.parse_args()
+
+    script_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    log_dir = join(script_dir, args.train_dir, args.workspace, 'logs')
+    os.makedirs(log_dir, exist_ok=True)
+    threads = args.threads_per_policy or max(1, os.cpu_count() // args.num_policies)
+
+    processes = []
+    for policy_idx in range(args.num_policies):
+        cmd = [sys.executable, 'train.py', 'pbt=pbt_default', f'pbt.policy_idx={policy_idx}',
+               f'pbt.num_policies={args.num_policies}', f'pbt.workspace={args.workspace}',
+               f'seed={args.seed + policy_idx}', f'experiment=pbt_{args.workspace}_{policy_idx:03d}'] + args.overrides
+        env = dict(os.environ, OMP_NUM_THREADS=str(threads), MKL_NUM_THREADS=str(threads))
+        log = open(join(log_dir, f'policy_{policy_idx:03d}.log'), 'a')
+        print(' '.join(cmd))
+        processes.append((subprocess.Popen(cmd, cwd=script_dir, env=env, stdout=log, stderr=subprocess.STDOUT), log))
+
+    try:
+        while any(p.poll() is None for p, _ in processes):
+            time.sleep(5)
+    except KeyboardInterrupt:
+        print('Stopping the population')
+        for p, _ in processes:
+            p.terminate()
+        for p, _ in processes:
+            p.wait()
+    for policy_idx, (p, log) in enumerate(processes):
+        log.close()
+        print(f'policy {policy_idx} exited with {p.returncode}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+import copy
+import random
+
+
+def mutate_float(x, change_min=1.1, change_max=1.5):
+    perturb_amount = random.uniform(change_min, change_max)
+
+    # mutation direction
+    new_value = x / perturb_amount if random.random() < 0.5 else x * perturb_amount
+    return new_value
+
+
+def mutate_float_min_1(x, **kwargs):
+    new_value = mutate_float(x, **kwargs)
+    new_value = max(1.0, new_value)
+    return new_value
+
+
+def mutate_eps_clip(x, **kwargs):
+    new_value = mutate_float(x, **kwargs)
+    new_value = max(min(new_value, 0.3), 0.01)
+    return new_value
+
+
+def mutate_mini_epochs(x, **kwargs):
+    change_amount = 1
+    new_value = x + change_amount if random.random() < 0.5 else x - change_amount
+    new_value = max(1, min(new_value, 8))
+    return new_value
+
+
+def mutate_discount(x, **kwargs):
+    """Special mutation func for parameters such as gamma (discount factor)."""
+    inv_x = 1.0 - x
+    # very conservative, large changes in gamma can lead to very different critic estimates
+    new_inv_x = mutate_float(inv_x, change_min=1.1, change_max=1.2)
+    new_value = 1.0 - new_inv_x
+    return new_value
+
+
+mutation_funcs = {
+    'mutate_float': mutate_float,
+    'mutate_float_min_1': mutate_float_min_1,
+    'mutate_eps_clip': mutate_eps_clip,
+    'mutate_mini_epochs': mutate_mini_epochs,
+    'mutate_discount': mutate_discount,
+}
+
+
+def get_mutation_func(mutation_func_name):
+    if mutation_func_name not in mutation_funcs:
+        raise ValueError(f'Unknown mutation func {mutation_func_name}, expected one of {list(mutation_funcs.keys())}')
+    return mutation_funcs[mutation_func_name]
+
+
+def mutate(params, mutations, mutation_rate, pbt_change_min, pbt_change_max):
+    """
+    params: flat dict of the current values of the mutable params, e.g. {'train.params.config.gamma': 0.99}
+    mutations: mutation func name for every param, as in cfg/pbt/mutation/*.yaml
+    """
+    mutated_params = copy.deepcopy(params)
+
+    for param, param_value in params.items():
+        # toss a coin whether we perturb the parameter at all
+        if random.random() > mutation_rate:
+            continue
+
+        mutation_func = get_mutation_func(mutations[param])
+        mutated_value = mutation_func(param_value, change_min=pbt_change_min, change_max=pbt_change_max)
+        mutated_params[param] = mutated_value
+        print(f'Param {param} mutated to value {mutated_value}')
+
+    return mutated_params
@@ -0,0 +1,272 @@
+import math
+import os
+import random
+import shutil
+import sys
+from collections import deque
+from os.path import join
+
+import numpy as np
+import yaml
+from omegaconf import DictConfig
+
+from isaacgymenvs.pbt.mutation import mutate
+from isaacgymenvs.ppo.algo_observer import AlgoObserver
+from isaacgymenvs.utils.reformat import omegaconf_to_dict
+from isaacgymenvs.utils.utils import flatten_dict
+
+
+# how many of its own checkpoints every policy keeps in the workspace, older ones are deleted
+NUM_CHECKPOINTS_TO_KEEP = 5
+
+
+class PbtParams:
+    def __init__(self, cfg: DictConfig):
+        params = omegaconf_to_dict(cfg)
+        pbt_params = params['pbt']
+
+        self.policy_idx = pbt_params['policy_idx']
+        self.num_policies = pbt_params['num_policies']
+        self.workspace = pbt_params['workspace']
+        self.dbg_mode = pbt_params['dbg_mode']
+
+        self.interval_steps = pbt_params['interval_steps']
+        self.start_after = pbt_params['start_after']
+        self.initial_delay = pbt_params['initial_delay']
+
+        self.replace_fraction_worst = pbt_params['replace_fraction_worst']
+        self.replace_fraction_best = pbt_params['replace_fraction_best']
+        self.replace_threshold_frac_std = pbt_params['replace_threshold_frac_std']
+        self.replace_threshold_frac_absolute = pbt_params['replace_threshold_frac_absolute']
+
+        self.mutation_rate = pbt_params['mutation_rate']
+        self.change_min = pbt_params['change_min']
+        self.change_max = pbt_params['change_max']
+
+        self.train_dir = params['train']['params']['config'].get('train_dir', 'runs')
+
+        # only the params of the mutation config that exist in this experiment and hold a number can be mutated,
+        # e.g. e_clip is in the default mutation config but not in the SAC configs
+        flat_params = flatten_dict(params)
+        self.mutation = {}
+        self.params = {}
+        for param, mutation_func in pbt_params['mutation'].items():
+            value = flat_params.get(param)
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                self.mutation[param] = mutation_func
+                self.params[param] = value
+
+
+def _write_yaml_atomic(data, filename):
+    # other policies read these files at any time, never let them see a half-written one
+    tmp_filename = filename + '.tmp'
+    with open(tmp_filename, 'w') as f:
+        yaml.safe_dump(data, f)
+    os.replace(tmp_filename, filename)
+
+
+class PbtAlgoObserver(AlgoObserver):
+    """
+    Population based training for policies running as separate processes that share a workspace directory.
+
+    Every interval_steps env frames each policy saves a checkpoint and its objective into
+    <train_dir>/<workspace>/<policy_idx>/. It then compares itself to the rest of the population. If it is among the
+    worst replace_fraction_worst, it restarts its own process from the checkpoint of one of the best
+    replace_fraction_best policies, with that policy's hyperparameters mutated.
+    The objective is the mean of infos['true_objective'] over finished episodes if the env reports it,
+    otherwise the mean episode reward.
+    """
+
+    def __init__(self, cfg: DictConfig):
+        super().__init__()
+        self.pbt_params = PbtParams(cfg)
+        self.policy_idx = self.pbt_params.policy_idx
+        self.num_policies = self.pbt_params.num_policies
+
+        self.pbt_workspace_dir = join(self.pbt_params.train_dir, self.pbt_params.workspace)
+        self.curr_policy_workspace_dir = self._policy_workspace_dir(self.policy_idx)
+        os.makedirs(self.curr_policy_workspace_dir, exist_ok=True)
+
+        self.algo = None
+        self.pbt_iteration = -1
+        self.initial_env_frames = -1
+        self.true_objectives = deque(maxlen=100)
+
+    def _policy_workspace_dir(self, policy_idx):
+        return join(self.pbt_workspace_dir, f'{policy_idx:03d}')
+
+    def after_init(self, algo):
+        self.algo = algo
+        self.true_objectives = deque(maxlen=getattr(algo, 'games_to_track', 100))
+
+    def process_infos(self, infos, done_indices):
+        if isinstance(infos, dict) and 'true_objective' in infos and len(done_indices) > 0:
+            done_indices = done_indices.view(-1)
+            self.true_objectives.extend(infos['true_objective'][done_indices].cpu().numpy().tolist())
+
+    def process_infos_mask(self, infos, done_mask):
+        # the done indices are only needed, and waited for, when the task reports a true objective
+        if isinstance(infos, dict) and 'true_objective' in infos:
+            self.process_infos(infos, done_mask.nonzero(as_tuple=False))
+
+    def after_clear_stats(self):
+        pass
+
+    def after_print_stats(self, frame, epoch_num, total_time, phase=''):
+        pass
+
+    def _objective(self):
+        if len(self.true_objectives) > 0:
+            return float(np.mean(self.true_objectives))
+        if self.algo.game_rewards.current_size > 0:
+            return float(np.mean(self.algo.game_rewards.get_mean()))
+        return None
+
+    def after_steps(self):
+        env_frames = self.algo.frame
+        if self.initial_env_frames == -1:
+            self.initial_env_frames = env_frames
+
+        iteration = env_frames // self.pbt_params.interval_steps
+        if self.pbt_iteration == -1:
+            # first call after a (re)start, the next PBT iteration starts at the next interval boundary
+            self.pbt_iteration = iteration
+            print(f'PBT policy {self.policy_idx}: starting at iteration {iteration}, env frames {env_frames}')
+            return
+        if iteration <= self.pbt_iteration:
+            return
+        self.pbt_iteration = iteration
+
+        objective = self._objective()
+        if objective is None:
+            print(f'PBT policy {self.policy_idx}: no finished episodes yet, skipping iteration {iteration}')
+            return
+        self._save_pbt_checkpoint(iteration, objective)
+        self.algo.writer.add_scalar('pbt/objective', objective, env_frames)
+        self.algo.writer.add_scalar('pbt/iteration', iteration, env_frames)
+
+        if env_frames - self.initial_env_frames < self.pbt_params.start_after:
+            return
+        if env_frames < self.pbt_params.initial_delay:
+            return
+
+        population = self._load_population()
+        if len(population) < self.num_policies and not self.pbt_params.dbg_mode:
+            print(f'PBT policy {self.policy_idx}: only {len(population)} of {self.num_policies} policies have checkpoints')
+            return
+        population[self.policy_idx]['true_objective'] = objective
+
+        self._maybe_replace(iteration, population)
+
+    def _save_pbt_checkpoint(self, iteration, objective):
+        checkpoint_file = join(self.curr_policy_workspace_dir, f'{iteration:06d}')
+        self.algo.save(checkpoint_file)
+        # the other policies read the checkpoint as soon as the yaml is there
+        self.algo.checkpoints.flush()
+        _write_yaml_atomic({
+            'iteration': iteration,
+            'frame': int(self.algo.frame),
+            'true_objective': objective,
+            'params': self.pbt_params.params,
+            'checkpoint': os.path.abspath(checkpoint_file + '.pth'),
+            'experiment_name': self.algo.experiment_name,
+        }, checkpoint_file + '.yaml')
+
+        old_checkpoints = sorted(f for f in os.listdir(self.curr_policy_workspace_dir) if f.endswith('.yaml'))
+        for f in old_checkpoints[:-NUM_CHECKPOINTS_TO_KEEP]:
+            name = join(self.curr_policy_workspace_dir, f[:-len('.yaml')])
+            for ext in ['.yaml', '.pth']:
+                if os.path.exists(name + ext):
+                    os.remove(name + ext)
+
+    def _load_population(self):
+        population = {}
+        for policy_idx in range(self.num_policies):
+            policy_dir = self._policy_workspace_dir(policy_idx)
+            if not os.path.isdir(policy_dir):
+                continue
+            checkpoints = sorted(f for f in os.listdir(policy_dir) if f.endswith('.yaml'))
+            if len(checkpoints) == 0:
+                continue
+            with open(join(policy_dir, checkpoints[-1])) as f:
+                population[policy_idx] = yaml.safe_load(f)
+        return population
+
+    def _maybe_replace(self, iteration, population):
+        objectives = {idx: info['true_objective'] for idx, info in population.items()}
+        policies_sorted = sorted(objectives.keys(), key=lambda idx: objectives[idx])
+        num_worst = math.ceil(self.pbt_params.replace_fraction_worst * len(policies_sorted))
+        num_best = math.ceil(self.pbt_params.replace_fraction_best * len(policies_sorted))
+        worst_policies = policies_sorted[:num_worst]
+        best_policies = policies_sorted[-num_best:]
+        print(f'PBT iteration {iteration}: objectives {objectives}, best {best_policies}, worst {worst_policies}')
+
+        if self.policy_idx not in worst_policies or self.policy_idx in best_policies:
+            return
+
+        replacement_idx = random.choice(best_policies)
+        objective_delta = objectives[replacement_idx] - objectives[self.policy_idx]
+        std = np.std(list(objectives.values()))
+        if objective_delta < self.pbt_params.replace_threshold_frac_std * std:
+            print(f'PBT policy {self.policy_idx}: gap to {replacement_idx} is within {self.pbt_params.replace_threshold_frac_std} std, not replacing')
+            return
+        if objective_delta < self.pbt_params.replace_threshold_frac_absolute * abs(objectives[replacement_idx]):
+            print(f'PBT policy {self.policy_idx}: gap to {replacement_idx} is too small in absolute terms, not replacing')
+            return
+
+        replacement = population[replacement_idx]
+        # the replacement keeps rotating its own checkpoints, take a private copy before restarting
+        checkpoint = join(self.curr_policy_workspace_dir, f'{iteration:06d}_from_{replacement_idx:03d}.pth')
+        try:
+            shutil.copyfile(replacement['checkpoint'], checkpoint)
+        except FileNotFoundError:
+            # rotated away since the population was read, the next iteration sees its newer checkpoint
+            print(f'PBT policy {self.policy_idx}: checkpoint of policy {replacement_idx} is gone, skipping this round')
+            return
+        # the copies have no yaml and are rotated apart from the own checkpoints, the new one is the newest and stays
+        old_copies = sorted(f for f in os.listdir(self.curr_policy_workspace_dir) if '_from_' in f and f.endswith('.pth'))
+        for f in old_copies[:-NUM_CHECKPOINTS_TO_KEEP]:
+            os.remove(join(self.curr_policy_workspace_dir, f))
+
+        new_params = mutate(replacement['params'], self.pbt_params.mutation, self.pbt_params.mutation_rate,
+                            self.pbt_params.change_min, self.pbt_params.change_max)
+        print(f'PBT policy {self.policy_idx}: replacing weights with policy {replacement_idx}, new params {new_params}')
+        self._restart_with_new_params(new_params, os.path.abspath(checkpoint))
+
+    def _restart_with_new_params(self, new_params, restart_from_checkpoint):
+        cli_args = sys.argv
+        modified_args = [cli_args[0]]  # initial path to the script
+        for arg in cli_args[1:]:
+            if '=' in arg:
+                arg_name = arg.split('=', 1)[0].lstrip('+')
+                if arg_name in new_params or arg_name in ('checkpoint', 'restart'):
+                    continue
+            modified_args.append(arg)
+
+        modified_args.append(f'checkpoint={restart_from_checkpoint}')
+        for param, value in new_params.items():
+            modified_args.append(f'{param}={value}')
+
+        self.algo.writer.flush()
+        self.algo.writer.close()
+        self.algo.checkpoints.close()
+        env = getattr(self.algo.vec_env, 'env', None)
+        if hasattr(env, 'close'):
+            env.close()
+
+        print(f'PBT policy {self.policy_idx}: restarting with {modified_args}')
+        sys.stdout.flush()
+        os.execv(sys.executable, [sys.executable] + modified_args)
+
+
+def initial_pbt_check(cfg: DictConfig):
+    assert cfg.pbt.enabled
+    if hasattr(cfg, 'multi_gpu') and cfg.multi_gpu:
+        print('Multi GPU (DDP) training is not supported with PBT')
+        sys.exit(1)
+    if not 0 <= cfg.pbt.policy_idx < cfg.pbt.num_policies:
+        print(f'pbt.policy_idx={cfg.pbt.policy_idx} has to be in [0, pbt.num_policies={cfg.pbt.num_policies})')
+        sys.exit(1)
+    if cfg.pbt.num_policies < 2 and not cfg.pbt.dbg_mode:
+        print('PBT needs at least two policies, set pbt.dbg_mode=True to debug with one')
+        sys.exit(1)
@@ -6,13 +6,17 @@ from rl_games.common import vecenv
 from rl_games.algos_torch.moving_mean_std import GeneralizedMovingStats
 from rl_games.algos_torch.self_play_manager import SelfPlayManager
 from rl_games.algos_torch import torch_ext
+from isaacgymenvs.ppo.torch_ext import RollingMeter
 from isaacgymenvs.ppo import schedulers
+from isaacgymenvs.ppo import advantages
 from rl_games.common.experience import ExperienceBuffer
 from rl_games.common.interval_summary_writer import IntervalSummaryWriter
 from isaacgymenvs.ppo.diagnostics import DefaultDiagnostics, PpoDiagnostics
 from isaacgymenvs.ppo import model_builder
 from rl_games.interfaces.base_algorithm import  BaseAlgorithm
 from utils.rlgames_utils import Every
+from isaacgymenvs.utils.evaluator import Evaluator
+from isaacgymenvs.utils.checkpoints import CheckpointManager
 import numpy as np
 import time
 import gym
@@ -75,7 +79,7 @@ def critic_loss(value_preds_batch, values, curr_e_clip, return_batch, clip_value
         clipped_frac = (value_losses < value_losses_clipped).sum() / np.prod(value_losses.shape)
     else:
         c_loss = (return_batch - values)**2
-        clipped_frac = torch.Tensor([0])
+        clipped_frac = torch.zeros(1, device=values.device)
     return c_loss, clipped_frac
 
 
@@ -154,9 +158,23 @@ class A2CBase(BaseAlgorithm):
         self.value_size = self.env_info.get('value_size',1)
         self.observation_space = self.env_info['observation_space']
         self.weight_decay = config.get('weight_decay', 0.0)
+        # EMA of the model weights, kept next to the trained model and saved with the checkpoints
+        self.ema_decay = config.get('ema_decay', None)
+        self.ema_interval = config.get('ema_interval', 1)
+        self.model_ema = None
         self.use_action_masks = config.get('use_action_masks', False)
         self.is_train = config.get('is_train', True)
         self.test_every_episodes = config.get('test_every_episodes', 10)
+        # 'async' runs the test episodes in an Evaluator process on snapshots of the weights, 'inline' stops training for them
+        self.eval_mode = config.get('eval_mode', 'async')
+        # epochs the trainer runs ahead of a pending evaluation before waiting for it, None never waits
+        self.eval_max_staleness = config.get('eval_max_staleness', 2)
+        self.eval_deterministic = config.get('eval_deterministic', False)
+        # one env per FrankaPushing test task
+        self.eval_num_envs = config.get('eval_num_envs', 16)
+        self.eval_env_spec = config.get('eval_env', None)
+        self.model_spec = None
+        self.evaluator = None
 
         self.central_value_config = self.config.get('central_value_config', None)
         self.has_central_value = self.central_value_config is not None
@@ -183,6 +201,9 @@ class A2CBase(BaseAlgorithm):
 
         # TODO: do we still need it?
         self.relabel = config.get('relabel', False)
+        # fraction of the envs whose rollouts are relabeled with hindsight goals, only these are run through the model
+        self.relabel_ratio = config.get('relabel_ratio', 1.0)
+        self.relabel_envs = max(1, int(round(self.relabel_ratio * config['num_actors'])))
         self.ppo = config.get('ppo', True)
         self.max_epochs = self.config.get('max_epochs', -1)
         self.max_frames = self.config.get('max_frames', -1)
@@ -223,6 +244,16 @@ class A2CBase(BaseAlgorithm):
         else:
             self.scheduler = schedulers.IdentityScheduler()
 
+        # stop updating for the rest of the epoch once the mean KL of a mini epoch exceeds max_kl, this reads the KL
+        # back once per mini epoch also with the device lr
+        self.max_kl = config.get('max_kl', None)
+        # host_lr_schedule reads the KL back after every minibatch (legacy) or mini epoch (standard) as before,
+        # otherwise the lr lives in a device tensor that the adaptive schedule updates without syncing
+        self.host_lr_schedule = config.get('host_lr_schedule', False)
+        # capturable Adam is cuda only, on the cpu the readbacks cost nothing anyway
+        self.device_lr = not self.host_lr_schedule and torch.device(self.ppo_device).type == 'cuda' \
+            and self.is_adaptive_lr
+
         self.e_clip = config['e_clip']
         self.clip_value = config['clip_value']
         self.network = config['network']
@@ -256,12 +287,16 @@ class A2CBase(BaseAlgorithm):
         self.grad_norm = config['grad_norm']
         self.gamma = self.config['gamma']
         self.tau = self.config['tau']
+        # 'loop' is the reference implementation, 'jit' and 'scan' produce the same advantages faster
+        self.gae_fn = advantages.get_gae_fn(self.config.get('gae_backend', 'loop'))
 
         self.games_to_track = self.config.get('games_to_track', 100)
         print('current training device:', self.ppo_device)
-        self.game_rewards = torch_ext.AverageMeter(self.value_size, self.games_to_track).to(self.ppo_device)
-        self.game_shaped_rewards = torch_ext.AverageMeter(self.value_size, self.games_to_track).to(self.ppo_device)
-        self.game_lengths = torch_ext.AverageMeter(1, self.games_to_track).to(self.ppo_device)
+        # the last games_to_track episodes, appended on the device every step and read back only for the stats
+        self.game_rewards = RollingMeter(self.value_size, self.games_to_track).to(self.ppo_device)
+        self.game_shaped_rewards = RollingMeter(self.value_size, self.games_to_track).to(self.ppo_device)
+        self.game_lengths = RollingMeter(1, self.games_to_track).to(self.ppo_device)
+        self.reward_quantiles = self.config.get('reward_quantiles', [])
         self.obs = None
 
         self.batch_size = self.horizon_length * self.num_actors * self.num_agents
@@ -280,6 +315,8 @@ class A2CBase(BaseAlgorithm):
 
         self.games_num = self.minibatch_size // self.seq_length # it is used only for current rnn implementation
         self.mini_epochs_num = self.config['mini_epochs']
+        # a fresh permutation of the minibatches every mini epoch
+        self.shuffle_minibatches = self.config.get('shuffle_minibatches', True)
 
         self.mixed_precision = self.config.get('mixed_precision', False)
         self.scaler = torch.cuda.amp.GradScaler(enabled=self.mixed_precision)
@@ -306,6 +343,13 @@ class A2CBase(BaseAlgorithm):
         os.makedirs(self.nn_dir, exist_ok=True)
         os.makedirs(self.summaries_dir, exist_ok=True)
 
+        # checkpoints are written on a background thread, 0 keeps every last_ and best_ checkpoint
+        self.checkpoints = CheckpointManager(self.nn_dir,
+            keep_last=config.get('keep_last_checkpoints', 0),
+            keep_best=config.get('keep_best_checkpoints', 0),
+            compression=config.get('checkpoint_compression', 0),
+            background=config.get('checkpoint_background', True))
+
         self.entropy_coef = self.config['entropy_coef']
 
         if self.global_rank == 0:
@@ -373,6 +417,8 @@ class A2CBase(BaseAlgorithm):
 
         self.scaler.step(self.optimizer)
         self.scaler.update()
+        if self.model_ema is not None:
+            self.model_ema.update()
 
     def load_networks(self, params):
         builder = model_builder.ModelBuilder()
@@ -416,7 +462,33 @@ class A2CBase(BaseAlgorithm):
         if self.normalize_rms_advantage:
             self.advantage_mean_std.train()
 
+    def init_device_lr(self):
+        self.lr_tensor = torch.tensor(float(self.optimizer.param_groups[0]['lr']), device=self.ppo_device)
+        for param_group in self.optimizer.param_groups:
+            param_group['lr'] = self.lr_tensor.clone()
+
+    def apply_device_lr(self):
+        for param_group in self.optimizer.param_groups:
+            param_group['lr'].copy_(self.lr_tensor)
+
+    def update_schedule(self, kl):
+        if self.device_lr and self.is_adaptive_lr:
+            self.lr_tensor.copy_(self.scheduler.update_tensor(self.lr_tensor, kl))
+            self.apply_device_lr()
+            return
+        # the other schedules ignore the kl, so only the adaptive one has to read it back
+        kl_dist = kl.item() if self.is_adaptive_lr or self.host_lr_schedule else kl
+        self.last_lr, self.entropy_coef = self.scheduler.update(self.last_lr, self.entropy_coef, self.epoch_num, 0, kl_dist)
+        self.update_lr(self.last_lr)
+
     def update_lr(self, lr):
+        if self.device_lr:
+            self.lr_tensor.fill_(lr)
+            if self.multi_gpu:
+                dist.broadcast(self.lr_tensor, 0)
+            self.apply_device_lr()
+            return
+
         if self.multi_gpu:
             lr_tensor = torch.tensor([lr], device=self.device)
             dist.broadcast(lr_tensor, 0)
@@ -573,20 +645,7 @@ class A2CBase(BaseAlgorithm):
         return obs
 
     def discount_values(self, fdones, last_values, mb_fdones, mb_values, mb_rewards):
-        lastgaelam = 0
-        mb_advs = torch.zeros_like(mb_rewards)
-
-        for t in reversed(range(self.horizon_length)):
-            if t == self.horizon_length - 1:
-                nextvalues = last_values
-            else:
-                nextvalues = mb_values[t+1]
-            nonterminal = 1.0 - mb_fdones[t]
-            nonterminal = nonterminal.unsqueeze(1)
-
-            delta = (mb_rewards[t] + self.gamma * nextvalues * nonterminal - mb_values[t]) * nonterminal
-            mb_advs[t] = lastgaelam = delta + self.gamma * self.tau * nonterminal * lastgaelam
-        return mb_advs
+        return self.gae_fn(float(self.gamma), float(self.tau), last_values, mb_fdones, mb_values, mb_rewards)
 
     def discount_values_masks(self, fdones, last_extrinsic_values, mb_fdones, mb_extrinsic_values, mb_rewards, mb_masks):
         lastgaelam = 0
@@ -641,6 +700,8 @@ class A2CBase(BaseAlgorithm):
         state['epoch'] = self.epoch_num
         state['frame'] = self.frame
         state['optimizer'] = self.optimizer.state_dict()
+        if self.model_ema is not None:
+            state['model_ema'] = self.model_ema.state_dict()
 
         if self.has_central_value:
             state['assymetric_vf_nets'] = self.central_value_net.state_dict()
@@ -666,6 +727,10 @@ class A2CBase(BaseAlgorithm):
 
         for i in weights['optimizer']['state'].values(): i['step'] = i['step'].to('cpu')
         self.optimizer.load_state_dict(weights['optimizer'])
+        if self.device_lr:
+            self.init_device_lr()
+        if self.model_ema is not None and 'model_ema' in weights:
+            self.model_ema.load_state_dict(weights['model_ema'])
 
         self.last_mean_rewards = weights.get('last_mean_rewards', -1000000000)
 
@@ -768,6 +833,19 @@ class A2CBase(BaseAlgorithm):
                 obs_batch = obs_batch.float() / 255.0
         return obs_batch
 
+    def env_done_mask(self):
+        # one row per env, its first agent, where the done indices used to be subsampled every num_agents
+        done_mask = self.dones.bool()
+        if self.num_agents > 1:
+            done_mask = done_mask & (torch.arange(len(done_mask), device=done_mask.device) % self.num_agents == 0)
+        return done_mask
+
+    def process_infos(self, infos, done_mask):
+        if hasattr(self.algo_observer, 'process_infos_mask'):
+            self.algo_observer.process_infos_mask(infos, done_mask)
+        else:
+            self.algo_observer.process_infos(infos, done_mask.nonzero(as_tuple=False))
+
     def play_steps(self):
         update_list = self.update_list
 
@@ -802,13 +880,12 @@ class A2CBase(BaseAlgorithm):
             self.current_rewards += rewards
             self.current_shaped_rewards += shaped_rewards
             self.current_lengths += 1
-            all_done_indices = self.dones.nonzero(as_tuple=False)
-            env_done_indices = all_done_indices[::self.num_agents]
-     
-            self.game_rewards.update(self.current_rewards[env_done_indices])
-            self.game_shaped_rewards.update(self.current_shaped_rewards[env_done_indices])
-            self.game_lengths.update(self.current_lengths[env_done_indices])
-            self.algo_observer.process_infos(infos, env_done_indices)
+            env_done_mask = self.env_done_mask()
+
+            self.game_rewards.update(self.current_rewards, env_done_mask)
+            self.game_shaped_rewards.update(self.current_shaped_rewards, env_done_mask)
+            self.game_lengths.update(self.current_lengths, env_done_mask)
+            self.process_infos(infos, env_done_mask)
 
             not_dones = 1.0 - self.dones.float()
 
@@ -890,20 +967,22 @@ class A2CBase(BaseAlgorithm):
             self.current_rewards += rewards
             self.current_shaped_rewards += shaped_rewards
             self.current_lengths += 1
-            all_done_indices = self.dones.nonzero(as_tuple=False)
-            env_done_indices = all_done_indices[::self.num_agents]
-
-            if len(all_done_indices) > 0:
-                if self.zero_rnn_on_done:
-                    for s in self.rnn_states:
-                        s[:, all_done_indices, :] = s[:, all_done_indices, :] * 0.0
-                if self.has_central_value:
+            env_done_mask = self.env_done_mask()
+
+            if self.zero_rnn_on_done:
+                all_done_mask = self.dones.bool()[None, :, None]
+                for s in self.rnn_states:
+                    s.masked_fill_(all_done_mask, 0.0)
+            if self.has_central_value:
+                # the central value net takes indices, which waits for the host
+                all_done_indices = self.dones.nonzero(as_tuple=False)
+                if len(all_done_indices) > 0:
                     self.central_value_net.post_step_rnn(all_done_indices)
 
-            self.game_rewards.update(self.current_rewards[env_done_indices])
-            self.game_shaped_rewards.update(self.current_shaped_rewards[env_done_indices])
-            self.game_lengths.update(self.current_lengths[env_done_indices])
-            self.algo_observer.process_infos(infos, env_done_indices)
+            self.game_rewards.update(self.current_rewards, env_done_mask)
+            self.game_shaped_rewards.update(self.current_shaped_rewards, env_done_mask)
+            self.game_lengths.update(self.current_lengths, env_done_mask)
+            self.process_infos(infos, env_done_mask)
 
             not_dones = 1.0 - self.dones.float()
 
@@ -991,6 +1070,8 @@ class DiscreteA2CBase(A2CBase):
 
         for mini_ep in range(0, self.mini_epochs_num):
             ep_kls = []
+            if self.shuffle_minibatches:
+                self.dataset.shuffle()
             for i in range(len(self.dataset)):
                 a_loss, c_loss, entropy, kl, last_lr, lr_mul = self.train_actor_critic(self.dataset[i])
                 a_losses.append(a_loss)
@@ -1135,6 +1216,10 @@ class DiscreteA2CBase(A2CBase):
                     self.writer.add_scalar('episode_lengths/step', mean_lengths, frame)
                     self.writer.add_scalar('episode_lengths/iter', mean_lengths, epoch_num)
                     self.writer.add_scalar('episode_lengths/time', mean_lengths, total_time)
+                    if self.reward_quantiles:
+                        quantiles = self.game_rewards.get_quantiles(self.reward_quantiles)
+                        for q, value in zip(self.reward_quantiles, quantiles[:, 0]):
+                            self.writer.add_scalar(f'rewards_quantiles/q{round(q * 100)}', value, frame)
 
                     if self.has_self_play_config:
                         self.self_play_manager.update(self)
@@ -1144,12 +1229,13 @@ class DiscreteA2CBase(A2CBase):
 
                     if self.save_freq > 0:
                         if epoch_num % self.save_freq == 0:
-                            self.save(os.path.join(self.nn_dir, 'last_' + checkpoint_name))
+                            self.save(os.path.join(self.nn_dir, 'last_' + checkpoint_name), kind='last')
 
                     if mean_rewards[0] > self.last_mean_rewards and epoch_num >= self.save_best_after:
                         print('saving next best rewards: ', mean_rewards)
                         self.last_mean_rewards = mean_rewards[0]
-                        self.save(os.path.join(self.nn_dir, self.config['name']))
+                        self.save(os.path.join(self.nn_dir, 'best_' + checkpoint_name), kind='best', score=float(mean_rewards[0]),
+                                  link=os.path.join(self.nn_dir, self.config['name']))
 
                         if 'score_to_win' in self.config:
                             if self.last_mean_rewards > self.config['score_to_win']:
@@ -1185,6 +1271,7 @@ class DiscreteA2CBase(A2CBase):
                 should_exit = should_exit_t.bool().item()
 
             if should_exit:
+                self.checkpoints.close()
                 return self.last_mean_rewards, epoch_num
 
 
@@ -1220,68 +1307,78 @@ class ContinuousA2CBase(A2CBase):
         A2CBase.init_tensors(self)
         self.update_list = ['actions', 'neglogpacs', 'values', 'mus', 'sigmas']
         self.tensor_list = self.update_list + ['obses', 'states', 'dones']
+        if self.relabel:
+            self.init_relabel_tensors()
+
+    def init_relabel_tensors(self):
+        # the relabeled rollouts are written here in place every epoch, the actions and dones are shared with buffer
+        n = self.relabel_envs
+        tensor_dict = self.experience_buffer.tensor_dict
+        self.relabel_tensors = {k: torch.zeros_like(tensor_dict[k][:, :n]) for k in ['obses', 'rewards', 'values', 'neglogpacs', 'mus', 'sigmas']}
+
+    def _obs_slice(self, env, name):
+        obs_spec = getattr(env, 'obs_spec', None)
+        assert obs_spec is not None and name in obs_spec, f'relabeling needs the task to list {name} in env.obs_spec'
+        return obs_spec[name]
 
     def relabel_batch(self, buffer):
         env = self.vec_env.env
-        relabeled_buffer = copy.deepcopy(buffer)
+        n = self.relabel_envs
+        goal_slice = self._obs_slice(env, 'goal_pos')
+        target_slice = self._obs_slice(env, env.target_name)
+        relabeled = self.relabel_tensors
+        actions = buffer.tensor_dict['actions'][:, :n]
+        dones = buffer.tensor_dict['dones'][:, :n]
 
         # Relabel states
-        obs = relabeled_buffer.tensor_dict['obses']
+        obs = relabeled['obses']
+        obs.copy_(buffer.tensor_dict['obses'][:, :n])
         # compute episode idx
-        idx = relabeled_buffer.tensor_dict['dones']
-        present, first_idx = idx.max(0)
+        present, first_idx = dones.max(0)
         first_idx[present == 0] = self.horizon_length - 1
-        idx = idx.flip(0).cumsum(0).flip(0)
+        idx = dones.flip(0).cumsum(0).flip(0)
         idx = idx[[0]] - idx
         # Compute last frame idx
-        ep_len = env.max_episode_length
-        idx = idx * ep_len + first_idx[None, :]
-        idx = torch.minimum(idx, (obs.shape[0] - 1) * torch.ones([1], dtype=torch.int32, device=idx.device))[:, :, None]
-        goal = obs[:, :, env.target_idx]
-        idx = idx.repeat(1, 1, goal.shape[2])
-        goal = torch.gather(goal, 0, idx)
-        relabeled_buffer.tensor_dict['obses'][:, :, 7:10] = goal
-        target_pos = relabeled_buffer.tensor_dict['obses'][..., env.target_idx]
+        idx = idx * env.max_episode_length + first_idx[None, :]
+        idx = idx.clamp(max=obs.shape[0] - 1)[:, :, None]
+        target_pos = obs[:, :, target_slice]
+        goal = torch.gather(target_pos, 0, idx.expand(-1, -1, target_pos.shape[2]).long())
+        obs[:, :, goal_slice] = goal
 
         # Rewards should be shifted by one
-        last_obs = dict(obs=self.obs['obs'].clone())
-        last_obs['obs'][:, 7:10] = relabeled_buffer.tensor_dict['obses'][-1, :, 7:10]
-        goal = torch.cat([goal[1:], last_obs['obs'][None, :, 7:10]], 0)
-        target_pos = torch.cat([target_pos[1:], last_obs['obs'][None, :, env.target_idx]], 0)
+        last_obs = dict(obs=self.obs['obs'][:n].clone())
+        last_obs['obs'][:, goal_slice] = goal[-1]
+        next_goal = torch.cat([goal[1:], goal[-1:]], 0)
+        next_target_pos = torch.cat([target_pos[1:], last_obs['obs'][None, :, target_slice]], 0)
 
         # Run model - do it in slices to conserve memory
-        n_slices = min(16, obs.shape[0])
-        # res_dict = self.get_action_values(dict(obs=relabeled_buffer.tensor_dict['obses'].flatten(0, 1)))
-        obs = relabeled_buffer.tensor_dict['obses'].reshape([n_slices, -1] + list(obs.shape[1:]))
-        res_dicts = [self.run_model(dict(obs=obs[i].flatten(0, 1))) for i in range(n_slices)]
-        res_dict = {}
-        for k in res_dicts[0]:
-            if k in relabeled_buffer.tensor_dict:
-                res_dict[k] = torch.stack([d[k] for d in res_dicts], 0).reshape(self.horizon_length, self.num_actors, -1)
-        res_dict.pop('actions')
-        res_dict['neglogpacs'] = self.model.neglogp(relabeled_buffer.tensor_dict['actions'], res_dict['mus'], res_dict['sigmas'], torch.log(res_dict['sigmas']))
-        relabeled_buffer.tensor_dict.update(res_dict)
+        slice_len = -(-self.horizon_length // min(16, self.horizon_length))
+        for t in range(0, self.horizon_length, slice_len):
+            res_dict = self.run_model(dict(obs=obs[t:t + slice_len].flatten(0, 1)))
+            for k in ['values', 'mus', 'sigmas']:
+                relabeled[k][t:t + slice_len] = res_dict[k].view(relabeled[k][t:t + slice_len].shape)
+        relabeled['neglogpacs'].copy_(self.model.neglogp(actions, relabeled['mus'], relabeled['sigmas'], torch.log(relabeled['sigmas'])))
 
         # Rewards
-        rewards = env.compute_franka_reward({'goal_pos': goal, env.target_name: target_pos})[:, :, None]
+        rewards = relabeled['rewards']
+        rewards.copy_(env.compute_franka_reward({'goal_pos': next_goal, env.target_name: next_target_pos})[:, :, None])
         # TODO there is something funny about this - why the multiply by gamma?
         if self.value_bootstrap:
-            rewards += self.gamma * relabeled_buffer.tensor_dict['values'] * relabeled_buffer.tensor_dict['dones'].unsqueeze(2).float()
-        relabeled_buffer.tensor_dict['rewards'] = rewards
+            rewards += self.gamma * relabeled['values'] * dones.unsqueeze(2).float()
 
         # Compute returns
         last_values = self.get_values(last_obs)
-        fdones = self.dones.float()
-        mb_fdones = relabeled_buffer.tensor_dict['dones'].float()
-        mb_values = relabeled_buffer.tensor_dict['values']
-        mb_rewards = relabeled_buffer.tensor_dict['rewards']
-        mb_advs = self.discount_values(fdones, last_values, mb_fdones, mb_values, mb_rewards)
+        fdones = self.dones[:n].float()
+        mb_fdones = dones.float()
+        mb_values = relabeled['values']
+        mb_advs = self.discount_values(fdones, last_values, mb_fdones, mb_values, rewards)
         mb_returns = mb_advs + mb_values
-        relabeled_batch = relabeled_buffer.get_transformed_list(swap_and_flatten01, self.tensor_list)
+        tensors = dict(relabeled, actions=actions, dones=dones)
+        relabeled_batch = {k: swap_and_flatten01(tensors[k]) for k in self.tensor_list if k in tensors}
         relabeled_batch['returns'] = swap_and_flatten01(mb_returns)
-        relabeled_batch['played_frames'] = self.batch_size
+        relabeled_batch['played_frames'] = n * self.horizon_length
 
-        return relabeled_buffer, relabeled_batch
+        return relabeled, relabeled_batch
 
     def train_epoch(self):
         super().train_epoch()
@@ -1320,9 +1417,10 @@ class ContinuousA2CBase(A2CBase):
         for mini_ep in range(0, self.mini_epochs_num):
             ep_kls = []
 
-            # self.dataset.shuffle()
-            # if self.relabel:
-            #     self.relabeled_dataset.shuffle()
+            if self.shuffle_minibatches:
+                self.dataset.shuffle()
+                if self.relabel:
+                    self.relabeled_dataset.shuffle()
             for i in range(len(self.dataset)):
                 relabeled_minibatch = self.relabeled_dataset[i] if self.relabel else None
                 losses, kl, last_lr, lr_mul, cmu, csigma = self.train_actor_critic(self.dataset[i], relabeled_minibatch)
@@ -1335,22 +1433,28 @@ class ContinuousA2CBase(A2CBase):
                     if self.multi_gpu:
                         dist.all_reduce(kl, op=dist.ReduceOp.SUM)
                         av_kls /= self.world_size
-                    self.last_lr, self.entropy_coef = self.scheduler.update(self.last_lr, self.entropy_coef, self.epoch_num, 0, av_kls.item())
-                    self.update_lr(self.last_lr)
+                    self.update_schedule(av_kls)
 
             av_kls = torch_ext.mean_list(ep_kls)
             if self.multi_gpu:
                 dist.all_reduce(av_kls, op=dist.ReduceOp.SUM)
                 av_kls /= self.world_size
             if self.schedule_type == 'standard':
-                self.last_lr, self.entropy_coef = self.scheduler.update(self.last_lr, self.entropy_coef, self.epoch_num, 0, av_kls.item())
-                self.update_lr(self.last_lr)
+                self.update_schedule(av_kls)
 
             metrics['info/kl'].append(av_kls)
             self.diagnostics.mini_epoch(self, mini_ep)
             if self.normalize_input:
                 self.model.running_mean_std.eval() # don't need to update statstics more than one miniepoch
 
+            # the remaining mini epochs are skipped on the device path too, so the optimizer and EMA never see them
+            if self.max_kl is not None and av_kls.item() > self.max_kl:
+                break
+
+        if self.device_lr:
+            # the only readback of the epoch
+            self.last_lr = last_lr = self.lr_tensor.item()
+
         update_time_end = time.time()
         play_time = play_time_end - play_time_start
         update_time = update_time_end - update_time_start
@@ -1461,6 +1565,26 @@ class ContinuousA2CBase(A2CBase):
             self.vec_env.env.override_render = False
         self.env_reset()
 
+    def start_evaluator(self):
+        if self.eval_mode != 'async' or self.global_rank != 0:
+            return
+        if self.eval_env_spec is None or self.model_spec is None or self.is_rnn or self.has_central_value:
+            print('Asynchronous evaluation needs the eval_env spec and a feed-forward policy, testing inline')
+            self.eval_mode = 'inline'
+            return
+        env_spec = dict(self.eval_env_spec, num_envs=self.eval_num_envs)
+        self.evaluator = Evaluator(env_spec, self.model_spec, self.eval_max_staleness, self.eval_deterministic,
+                                   self.eval_env_spec['seed'])
+
+    def log_evaluations(self, results, epoch_num):
+        for result in results:
+            self.algo_observer.after_evaluation(result, epoch_num)
+
+    def stop_evaluator(self, epoch_num):
+        if self.evaluator is not None:
+            self.log_evaluations(self.evaluator.close(), epoch_num)
+            self.evaluator = None
+
     def train(self):
         self.init_tensors()
         self.last_mean_rewards = -100500
@@ -1474,6 +1598,7 @@ class ContinuousA2CBase(A2CBase):
         test_render_check = Every(math.ceil(self.vec_env.env.render_every_episodes / self.test_every_episodes))
         test_counter = 0
         self.start_frame = self.frame
+        self.start_evaluator()
 
         if self.multi_gpu:
             print("====================broadcasting parameters")
@@ -1487,7 +1612,7 @@ class ContinuousA2CBase(A2CBase):
             total_time += sum_time
             frame = self.frame // self.num_agents
             if self.global_rank == 0:
-                sigma = self.dataset.values_dict['sigma'][self.dataset.last_range[0]:self.dataset.last_range[1]].mean()
+                sigma = self.dataset.last_batch['sigma'].mean()
                 self.writer.add_scalar('info/sigma', sigma, frame)
 
             # cleaning memory to optimize space
@@ -1533,17 +1658,22 @@ class ContinuousA2CBase(A2CBase):
                     self.writer.add_scalar('episode_lengths/step', mean_lengths, frame)
                     self.writer.add_scalar('episode_lengths/iter', mean_lengths, epoch_num)
                     self.writer.add_scalar('episode_lengths/time', mean_lengths, total_time)
+                    if self.reward_quantiles:
+                        quantiles = self.game_rewards.get_quantiles(self.reward_quantiles)
+                        for q, value in zip(self.reward_quantiles, quantiles[:, 0]):
+                            self.writer.add_scalar(f'rewards_quantiles/q{round(q * 100)}', value, frame)
 
                     checkpoint_name = self.config['name'] + '_ep_' + str(epoch_num) + '_rew_' + str(mean_rewards[0])
 
                     if self.save_freq > 0:
                         if epoch_num % self.save_freq == 0:
-                            self.save(os.path.join(self.nn_dir, 'last_' + checkpoint_name))
+                            self.save(os.path.join(self.nn_dir, 'last_' + checkpoint_name), kind='last')
 
                     if mean_rewards[0] > self.last_mean_rewards and epoch_num >= self.save_best_after:
                         print('saving next best rewards: ', mean_rewards)
                         self.last_mean_rewards = mean_rewards[0]
-                        self.save(os.path.join(self.nn_dir, self.config['name']))
+                        self.save(os.path.join(self.nn_dir, 'best_' + checkpoint_name), kind='best', score=float(mean_rewards[0]),
+                                  link=os.path.join(self.nn_dir, self.config['name']))
 
                         if 'score_to_win' in self.config:
                             if self.last_mean_rewards > self.config['score_to_win']:
@@ -1578,16 +1708,25 @@ class ContinuousA2CBase(A2CBase):
                 dist.broadcast(should_exit_t, 0)
                 should_exit = should_exit_t.float().item()
             if should_exit:
-                return self.last_mean_rewards, epoch_num
-
-            if should_exit:
+                self.stop_evaluator(epoch_num)
+                self.checkpoints.close()
                 return self.last_mean_rewards, epoch_num
             
             # Test
             iteration = (self.frame - self.start_frame) / self.num_actors
             if test_check.check(iteration):
-                print("Testing...")
                 test_counter += 1
-                self.test(render=test_render_check.check(test_counter))
-                self.algo_observer.after_print_stats(frame, epoch_num, total_time, '_test')
-                print("Done Testing.")
+                render = test_render_check.check(test_counter)
+                if self.evaluator is not None:
+                    self.evaluator.submit(self.model, epoch_num, frame, render)
+                elif self.eval_mode == 'inline':
+                    print("Testing...")
+                    self.test(render=render)
+                    self.algo_observer.after_print_stats(frame, epoch_num, total_time, '_test')
+                    print("Done Testing.")
+            if self.evaluator is not None:
+                self.log_evaluations(self.evaluator.poll(epoch_num), epoch_num)
+                if not self.evaluator.alive:
+                    print('The evaluation process is gone, testing inline from now on')
+                    self.evaluator = None
+                    self.eval_mode = 'inline'
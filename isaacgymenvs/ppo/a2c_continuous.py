@@ -24,11 +24,21 @@ class A2CAgent(a2c_common.ContinuousA2CBase):
         
         self.model = self.network.build(build_config)
         self.model.to(self.ppo_device)
+        # what the Evaluator process needs to build the same policy
+        self.model_spec = {
+            'params': {'model': params['model'], 'network': params['network']},
+            'build_config': build_config,
+            'clip_actions': self.clip_actions,
+        }
         self.states = None
         self.init_rnn_from_model(self.model)
         self.last_lr = float(self.last_lr)
         self.bound_loss_type = self.config.get('bound_loss_type', 'bound') # 'regularisation' or 'bound'
-        self.optimizer = optim.Adam(self.model.parameters(), float(self.last_lr), eps=1e-08, weight_decay=self.weight_decay)
+        self.optimizer = optim.Adam(self.model.parameters(), float(self.last_lr), eps=1e-08, weight_decay=self.weight_decay, capturable=self.device_lr)
+        if self.device_lr:
+            self.init_device_lr()
+        if self.ema_decay is not None:
+            self.model_ema = torch_ext.TargetNetwork(self.model, tau=1.0 - self.ema_decay, update_interval=self.ema_interval, copy_buffers=True)
 
         if self.has_central_value:
             cv_config = {
@@ -53,7 +63,11 @@ class A2CAgent(a2c_common.ContinuousA2CBase):
         self.use_experimental_cv = self.config.get('use_experimental_cv', True)
         self.dataset = datasets.PPODataset(self.batch_size, self.minibatch_size, self.is_discrete, self.is_rnn, self.ppo_device, self.seq_length)
         if self.relabel:
-            self.relabeled_dataset = datasets.PPODataset(self.batch_size, self.minibatch_size, self.is_discrete, self.is_rnn, self.ppo_device, self.seq_length)
+            # as many minibatches as the dataset, each with the relabeled share of the envs
+            relabel_batch_size = self.horizon_length * self.relabel_envs
+            relabel_minibatch_size = self.minibatch_size * self.relabel_envs // self.num_actors
+            assert relabel_minibatch_size > 0 and relabel_batch_size % relabel_minibatch_size == 0, 'relabel_ratio has to split the minibatches evenly'
+            self.relabeled_dataset = datasets.PPODataset(relabel_batch_size, relabel_minibatch_size, self.is_discrete, self.is_rnn, self.ppo_device, self.seq_length)
         if self.normalize_value:
             self.value_mean_std = self.central_value_net.model.value_mean_std if self.has_central_value else self.model.value_mean_std
 
@@ -64,9 +78,9 @@ class A2CAgent(a2c_common.ContinuousA2CBase):
         self.epoch_num += 1
         return self.epoch_num
         
-    def save(self, fn):
+    def save(self, fn, kind=None, score=None, link=None):
         state = self.get_full_state_weights()
-        torch_ext.save_checkpoint(fn, state)
+        self.checkpoints.save(fn, state, kind, score, link)
 
     def restore(self, fn, set_epoch=True):
         checkpoint = torch_ext.load_checkpoint(fn, self.device)
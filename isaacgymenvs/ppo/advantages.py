@@ -0,0 +1,77 @@
+import torch
+
+
+def gae_loop(gamma: float, tau: float, last_values, mb_fdones, mb_values, mb_rewards):
+    """
+    Reference GAE implementation, walks the horizon backwards one step at a time.
+    mb_fdones[t] is the done flag stored together with obs t, mb_values/mb_rewards are (horizon, envs, value_size)
+    """
+    horizon_length = mb_rewards.shape[0]
+    lastgaelam = 0
+    mb_advs = torch.zeros_like(mb_rewards)
+
+    for t in reversed(range(horizon_length)):
+        if t == horizon_length - 1:
+            nextvalues = last_values
+        else:
+            nextvalues = mb_values[t+1]
+        nonterminal = 1.0 - mb_fdones[t]
+        nonterminal = nonterminal.unsqueeze(1)
+
+        delta = (mb_rewards[t] + gamma * nextvalues * nonterminal - mb_values[t]) * nonterminal
+        mb_advs[t] = lastgaelam = delta + gamma * tau * nonterminal * lastgaelam
+    return mb_advs
+
+
+@torch.jit.script
+def gae_jit(gamma: float, tau: float, last_values: torch.Tensor, mb_fdones: torch.Tensor,
+            mb_values: torch.Tensor, mb_rewards: torch.Tensor) -> torch.Tensor:
+    horizon_length = mb_rewards.shape[0]
+    nonterminals = (1.0 - mb_fdones).unsqueeze(-1)
+    next_values = torch.cat([mb_values[1:], last_values.unsqueeze(0)], 0)
+    deltas = (mb_rewards + gamma * next_values * nonterminals - mb_values) * nonterminals
+    coefs = gamma * tau * nonterminals
+
+    mb_advs = torch.zeros_like(mb_rewards)
+    lastgaelam = torch.zeros_like(mb_rewards[0])
+    for t in range(horizon_length - 1, -1, -1):
+        lastgaelam = deltas[t] + coefs[t] * lastgaelam
+        mb_advs[t] = lastgaelam
+    return mb_advs
+
+
+def gae_scan(gamma: float, tau: float, last_values, mb_fdones, mb_values, mb_rewards):
+    """
+    GAE as a parallel (Hillis-Steele) scan over the affine recurrence adv[t] = delta[t] + c[t] * adv[t+1].
+    All deltas are computed in one shot, the recurrence then takes log2(horizon) steps of whole-tensor ops.
+    """
+    horizon_length = mb_rewards.shape[0]
+    nonterminals = (1.0 - mb_fdones).unsqueeze(-1)
+    next_values = torch.cat([mb_values[1:], last_values.unsqueeze(0)], 0)
+    deltas = (mb_rewards + gamma * next_values * nonterminals - mb_values) * nonterminals
+
+    # scan runs forward in time, so flip the horizon
+    advs = deltas.flip(0)
+    coefs = (gamma * tau * nonterminals).expand_as(deltas).flip(0)
+    offset = 1
+    while offset < horizon_length:
+        new_advs = advs.clone()
+        new_advs[offset:].addcmul_(coefs[offset:], advs[:-offset])
+        new_coefs = coefs.clone()
+        new_coefs[offset:].mul_(coefs[:-offset])
+        advs, coefs = new_advs, new_coefs
+        offset *= 2
+    return advs.flip(0)
+
+
+gae_backends = {
+    'loop': gae_loop,
+    'jit': gae_jit,
+    'scan': gae_scan,
+}
+
+
+def get_gae_fn(name):
+    if name not in gae_backends:
+        raise ValueError(f'Unknown gae_backend {name}, expected one of {list(gae_backends.keys())}')
+    return gae_backends[name]
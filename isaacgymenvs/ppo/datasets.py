@@ -1,9 +1,17 @@
-import torch
 import copy
+import math
+
+import torch
 from torch.utils.data import Dataset
 
 
 class PPODataset(Dataset):
+    """
+    Minibatches over one epoch of experience. update_values_dict packs the tensors into one staging buffer per dtype,
+    shuffle() permutes it with a single gather per dtype into a second buffer, and minibatches are row slices of the
+    staged buffer, so __getitem__ copies nothing and update_mu_sigma writes straight into the staged rows. The RNN path
+    permutes whole sequences of seq_length steps and gathers their rnn_states to match.
+    """
 
     def __init__(self, batch_size, minibatch_size, is_discrete, is_rnn, device, seq_length):
 
@@ -21,20 +29,90 @@ class PPODataset(Dataset):
         self.flat_indexes = torch.arange(total_games * self.seq_length, dtype=torch.long, device=self.device).reshape(total_games, self.seq_length)
 
         self.special_names = ['rnn_states']
+        # rows are permuted in units of whole sequences on the RNN path
+        self.unit = self.seq_length if self.is_rnn else 1
+        self.num_units = self.batch_size // self.unit
         self.idx = torch.arange(self.batch_size, dtype=torch.long, device=self.device)
-        # self.shuffle()
+        self.order = torch.arange(self.num_units, dtype=torch.long, device=self.device)
+        self.values_dict = None
+        self.layout = None
+        self.staging = {}
+        self.front = 0
+        self.last_range = (0, 0)
+        self.last_batch = None
 
     def shuffle(self):
-        self.idx = torch.randperm(self.batch_size)
+        perm = torch.randperm(self.num_units, device=self.device)
+        back = 1 - self.front
+        for buffers in self.staging.values():
+            # one gather per dtype, with the rows of a sequence kept together as one wide row
+            src = buffers[self.front].view(self.num_units, -1)
+            torch.index_select(src, 0, perm, out=buffers[back].view(self.num_units, -1))
+        self.front = back
+        self.order = self.order[perm]
+        self.idx = (self.order[:, None] * self.unit + torch.arange(self.unit, device=self.device)).view(-1)
+        if self.is_rnn and self.values_dict is not None:
+            self.rnn_states = [s.index_select(1, self.order) for s in self.values_dict['rnn_states']]
 
     def update_values_dict(self, values_dict):
-        self.values_dict = values_dict     
+        self.values_dict = values_dict
+        self.last_batch = None
+        if values_dict is None:
+            # the staging buffers are kept for the next epoch
+            self.rnn_states = None
+            return
+
+        fields = []
+        for k, v in values_dict.items():
+            if k in self.special_names or v is None:
+                continue
+            if isinstance(v, dict):
+                fields += [((k, kd), vd) for kd, vd in v.items()]
+            else:
+                fields.append(((k,), v))
+        layout = tuple((key, v.dtype, tuple(v.shape[1:])) for key, v in fields)
+        if layout != self.layout:
+            self._allocate(layout)
+
+        self.front = 0
+        for key, v in fields:
+            self.columns[key][0].copy_(v.reshape(self.batch_size, -1))
+        self.order = torch.arange(self.num_units, dtype=torch.long, device=self.device)
+        self.idx = torch.arange(self.batch_size, dtype=torch.long, device=self.device)
+        if self.is_rnn:
+            self.rnn_states = values_dict['rnn_states']
+
+    def _allocate(self, layout):
+        widths = {}
+        offsets = {}
+        for key, dtype, shape in layout:
+            offsets[key] = widths.get(dtype, 0)
+            widths[dtype] = offsets[key] + math.prod(shape)
+        self.staging = {dtype: [torch.empty((self.batch_size, width), dtype=dtype, device=self.device) for _ in range(2)]
+                        for dtype, width in widths.items()}
+
+        # column views of each field in both buffers, and their minibatch row slices
+        self.columns = {}
+        self.minibatches = [[{} for _ in range(self.length)] for _ in range(2)]
+        for key, dtype, shape in layout:
+            start = offsets[key]
+            width = math.prod(shape)
+            self.columns[key] = []
+            for b, buffer in enumerate(self.staging[dtype]):
+                column = buffer[:, start:start + width]
+                self.columns[key].append(column)
+                column = column.view((self.batch_size,) + shape)
+                for i in range(self.length):
+                    mb = column[i * self.minibatch_size:(i + 1) * self.minibatch_size]
+                    if len(key) == 2:
+                        self.minibatches[b][i].setdefault(key[0], {})[key[1]] = mb
+                    else:
+                        self.minibatches[b][i][key[0]] = mb
+        self.layout = layout
 
-    def update_mu_sigma(self, mu, sigma):	    
-        start = self.last_range[0]	           
-        end = self.last_range[1]	
-        self.values_dict['mu'][start:end] = mu	
-        self.values_dict['sigma'][start:end] = sigma 
+    def update_mu_sigma(self, mu, sigma):
+        self.last_batch['mu'].copy_(mu)
+        self.last_batch['sigma'].copy_(sigma)
 
     def __len__(self):
         return self.length
@@ -42,40 +120,19 @@ class PPODataset(Dataset):
     def _get_item_rnn(self, idx):
         gstart = idx * self.num_games_batch
         gend = (idx + 1) * self.num_games_batch
-        start = gstart * self.seq_length
-        end = gend * self.seq_length
-        self.last_range = (start, end)
-
-        input_dict = {}
-        for k,v in self.values_dict.items():
-            if k not in self.special_names:
-                if isinstance(v, dict):
-                    v_dict = {kd:vd[start:end] for kd, vd in v.items()}
-                    input_dict[k] = v_dict
-                else:
-                    if v is not None:
-                        input_dict[k] = v[start:end]
-                    else:
-                        input_dict[k] = None
-        
-        rnn_states = self.values_dict['rnn_states']
-        input_dict['rnn_states'] = [s[:, gstart:gend, :].contiguous() for s in rnn_states]
-
+        input_dict = self._get_item(idx)
+        input_dict['rnn_states'] = [s[:, gstart:gend, :].contiguous() for s in self.rnn_states]
         return input_dict
 
     def _get_item(self, idx):
         start = idx * self.minibatch_size
         end = (idx + 1) * self.minibatch_size
         self.last_range = (start, end)
-        input_dict = {}
-        for k,v in self.values_dict.items():
-            if k not in self.special_names and v is not None:
-                if type(v) is dict:
-                    v_dict = { kd:vd[self.idx[start:end]] for kd, vd in v.items() }
-                    input_dict[k] = v_dict
-                else:
-                    input_dict[k] = v[self.idx[start:end]]
-                
+        self.last_batch = self.minibatches[self.front][idx]
+        input_dict = dict(self.last_batch)
+        for k, v in self.values_dict.items():
+            if k not in self.special_names and v is None:
+                input_dict[k] = None
         return input_dict
 
     def __getitem__(self, idx):
@@ -22,7 +22,8 @@ class PpoDiagnostics(DefaultDiagnostics):
         self.clip_fracs = []
         self.exp_vars = []
         self.current_epoch = 0
-        self.dict = defaultdict(list)
+        self.sums = {}
+        self.counts = defaultdict(int)
 
     def send_info(self, writter):
         if writter is None:
@@ -37,14 +38,22 @@ class PpoDiagnostics(DefaultDiagnostics):
     
     def epoch(self, agent, current_epoch):
         self.current_epoch = current_epoch
-        for k, v in self.dict.items():
-            self.diag_dict['diagnostics/{0}'.format(k)] = torch.stack(v, axis=0).mean()
-        self.dict = defaultdict(list)
+        for k, v in self.sums.items():
+            if self.counts[k] > 0:
+                self.diag_dict['diagnostics/{0}'.format(k)] = v / self.counts[k]
+                v.zero_()
+        self.counts = defaultdict(int)
 
     def mini_batch(self, agent, batch):
+        # running sums in device buffers that are kept across epochs, nothing is read back until send_info
         with torch.no_grad():
             for k, v in batch.items():
-                self.dict[k].append(v)
+                v = v.detach().float().mean()
+                if k in self.sums:
+                    self.sums[k] += v
+                else:
+                    self.sums[k] = v.clone()
+                self.counts[k] += 1
             
 
             
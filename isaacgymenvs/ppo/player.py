@@ -11,6 +11,7 @@ from typing import Optional
 from rl_games.common import vecenv
 from rl_games.common import env_configurations
 from rl_games.algos_torch import model_builder
+from isaacgymenvs.ppo import torch_ext
 from utils.rlgames_utils import Every
 
 class BasePlayer(object):
@@ -124,7 +125,7 @@ class BasePlayer(object):
                 # without triggering the retry loop in "safe_filesystem_op()"
                 load_error = False
                 try:
-                    torch.load(self.checkpoint_to_load)
+                    torch_ext.load(self.checkpoint_to_load)
                 except Exception as e:
                     print(f"Evaluation: checkpoint file is likely corrupted {self.checkpoint_to_load}: {e}")
                     load_error = True
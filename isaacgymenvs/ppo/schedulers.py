@@ -1,3 +1,4 @@
+import torch
 
 
 class RLScheduler:
@@ -32,6 +33,13 @@ class AdaptiveScheduler(RLScheduler):
             lr = min(current_lr * self.coef, self.max_lr)
         return lr, entropy_coef         
 
+    def update_tensor(self, lr, kl_dist):
+        # the same rule on device tensors, without reading kl_dist back
+        decreased = torch.clamp(lr / self.coef, min=self.min_lr)
+        increased = torch.clamp(lr * self.coef, max=self.max_lr)
+        lr = torch.where(kl_dist > (2.0 * self.kl_threshold), decreased, lr)
+        return torch.where(kl_dist < (0.5 * self.kl_threshold), increased, lr)
+
 
 class LinearScheduler(RLScheduler):
     def __init__(self, start_lr, min_lr=1e-6, max_steps=1000000, use_epochs=True, apply_to_entropy=False, **kwargs):
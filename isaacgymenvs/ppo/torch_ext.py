@@ -1,3 +1,7 @@
+import copy
+import gzip
+import io
+
 import numpy as np
 import torch
 import torch.nn as nn
@@ -71,8 +75,17 @@ def safe_filesystem_op(func, *args, **kwargs):
 def safe_save(state, filename):
     return safe_filesystem_op(torch.save, state, filename)
 
+def load(filename, map_location=None):
+    # checkpoints written with compression are gzip files, unlike safe_load this fails at once on a broken file
+    with open(filename, 'rb') as f:
+        compressed = f.read(2) == b'\x1f\x8b'
+    if compressed:
+        with gzip.open(filename, 'rb') as f:
+            return torch.load(io.BytesIO(f.read()), map_location)
+    return torch.load(filename, map_location)
+
 def safe_load(filename, map_location=None):
-    return safe_filesystem_op(torch.load, filename, map_location)
+    return safe_filesystem_op(load, filename, map_location)
 
 def save_checkpoint(filename, state):
     print("=> saving checkpoint '{}'".format(filename + '.pth'))
@@ -307,6 +320,141 @@ class AverageMeter(nn.Module):
         return self.mean.squeeze(0).cpu().numpy()
 
 
+class RollingMeter(nn.Module):
+    """
+    Mean of the last max_size values, kept in a ring buffer on the device. update() takes the values of every env and
+    a mask of the ones to append, so a step never has to know on the host how many episodes finished. Only
+    current_size, get_mean() and get_quantiles() read back.
+    """
+    def __init__(self, in_shape, max_size):
+        super(RollingMeter, self).__init__()
+        self.max_size = max_size
+        # the last row takes the writes of the values that are masked out
+        self.register_buffer("values", torch.zeros((max_size + 1, in_shape), dtype=torch.float32))
+        self.register_buffer("count", torch.zeros((), dtype=torch.long))
+        self.register_buffer("slots", torch.arange(max_size))
+
+    def update(self, values, mask=None):
+        if values.shape[0] == 0:
+            return
+        values = values.float().view(values.shape[0], -1)
+        if mask is None:
+            mask = torch.ones(values.shape[0], dtype=torch.bool, device=values.device)
+        mask = mask.view(-1).bool()
+        rank = mask.cumsum(0)
+        total = rank[-1]
+        # of more values than fit, only the last max_size are kept
+        keep = mask & (rank > total - self.max_size)
+        slot = torch.where(keep, (self.count + rank - 1) % self.max_size, self.max_size)
+        self.values.index_copy_(0, slot, values)
+        self.count += total
+
+    def clear(self):
+        self.count.zero_()
+
+    @property
+    def current_size(self):
+        return min(self.count.item(), self.max_size)
+
+    def __len__(self):
+        return self.current_size
+
+    def valid(self):
+        return self.slots < self.count
+
+    def mean(self):
+        """ the rolling mean as a device tensor of in_shape """
+        size = self.count.clamp(max=self.max_size)
+        return (self.valid().float() @ self.values[:-1]) / size.clamp(min=1)
+
+    def get_mean(self):
+        # (in_shape,), what AverageMeter returned for the (n, 1, in_shape) values indexed with nonzero()
+        return self.mean().cpu().numpy()
+
+    def get_quantiles(self, q):
+        """ quantiles q of the values in the window, (len(q), in_shape) """
+        values = torch.where(self.valid()[:, None], self.values[:-1], float('nan'))
+        q = torch.as_tensor(q, dtype=torch.float32, device=values.device)
+        return torch.nanquantile(values, q, dim=0).cpu().numpy()
+
+
+def flatten_parameters(params):
+    """
+    Moves params into one contiguous buffer and makes each of them a view into it, so that elementwise updates of all
+    params are a single op on the buffer. The params keep their identity, optimizers built on them stay valid, but
+    moving the module to another device afterwards breaks the sharing.
+    """
+    # params that are still laid out in an earlier buffer, e.g. the model of a second TargetNetwork, keep it
+    flat = getattr(params[0], '_flat_buffer', None)
+    if flat is not None and flat.numel() == sum(p.numel() for p in params):
+        offset = 0
+        for p in params:
+            if not p.is_contiguous() or p.data_ptr() != flat.data_ptr() + offset * flat.element_size():
+                break
+            offset += p.numel()
+        else:
+            return flat
+
+    flat = torch.cat([p.detach().reshape(-1) for p in params])
+    offset = 0
+    for p in params:
+        p.data = flat[offset:offset + p.numel()].view_as(p)
+        offset += p.numel()
+    params[0]._flat_buffer = flat
+    return flat
+
+
+class TargetNetwork:
+    """
+    Polyak averaged copy of a network, target <- (1 - tau) * target + tau * net every update_interval calls to update().
+
+    Used for the SAC and REDQ target critics, and with target_net=None as an EMA of the weights of any model, e.g. the
+    PPO model with tau = 1 - decay. The parameters of both networks are flattened into contiguous buffers so that the
+    update is one lerp_ instead of a few kernels per parameter; with mixed devices or dtypes it falls back to foreach ops.
+    With copy_buffers the buffers of net (e.g. running mean std) are copied over as they are.
+    """
+
+    def __init__(self, net, target_net=None, tau=0.005, update_interval=1, copy_buffers=False):
+        if target_net is None:
+            target_net = copy.deepcopy(net)
+            target_net.requires_grad_(False)
+        self.net = net
+        self.target_net = target_net
+        self.tau = tau
+        self.update_interval = update_interval
+        self.num_calls = 0
+
+        self.params = list(net.parameters())
+        self.target_params = list(target_net.parameters())
+        assert [p.shape for p in self.params] == [p.shape for p in self.target_params], 'networks do not match'
+        self.buffers = list(zip(net.buffers(), target_net.buffers())) if copy_buffers else []
+
+        self.flat, self.target_flat = None, None
+        if len({(p.device, p.dtype) for p in self.params + self.target_params}) == 1:
+            self.flat = flatten_parameters(self.params)
+            self.target_flat = flatten_parameters(self.target_params)
+
+    @torch.no_grad()
+    def update(self):
+        self.num_calls += 1
+        if self.num_calls % self.update_interval != 0:
+            return
+        if self.flat is not None:
+            self.target_flat.lerp_(self.flat, self.tau)
+        else:
+            torch._foreach_mul_(self.target_params, 1.0 - self.tau)
+            torch._foreach_add_(self.target_params, self.params, alpha=self.tau)
+        for buffer, target_buffer in self.buffers:
+            target_buffer.copy_(buffer)
+
+    def state_dict(self):
+        return self.target_net.state_dict()
+
+    def load_state_dict(self, state_dict):
+        # copies into the existing tensors, so the flat buffers stay shared
+        self.target_net.load_state_dict(state_dict)
+
+
 class IdentityRNN(nn.Module):
     def __init__(self, in_shape, out_shape):
         super(IdentityRNN, self).__init__()
@@ -13,13 +13,14 @@ from isaacgymenvs.ppo import a2c_continuous
 from isaacgymenvs.ppo import gc_a2c_continuous
 from isaacgymenvs.sac import sac_agent
 from isaacgymenvs.redq_original import redq_original_agent
+from isaacgymenvs.utils.checkpoints import resolve_checkpoint
 from rl_games.algos_torch import a2c_discrete
 from rl_games.common.algo_observer import DefaultAlgoObserver
 
 
 def _restore(agent, args):
     if 'checkpoint' in args and args['checkpoint'] is not None and args['checkpoint'] !='':
-        agent.restore(args['checkpoint'])
+        agent.restore(resolve_checkpoint(args['checkpoint']))
 
 def _override_sigma(agent, args):
     if 'sigma' in args and args['sigma'] is not None:
@@ -123,6 +123,80 @@ class Mlp(nn.Module):
         output = self.last_fc_layer(h)
         return output
 
+class EnsembleLinear(nn.Module):
+    """
+    N independent linear layers evaluated with one batched matmul, weights are stored as (N, in, out)
+    """
+    def __init__(self, ensemble_size, in_features, out_features):
+        super().__init__()
+        self.weight = nn.Parameter(torch.empty(ensemble_size, in_features, out_features))
+        self.bias = nn.Parameter(torch.zeros(ensemble_size, 1, out_features))
+        with torch.no_grad():
+            for i in range(ensemble_size):
+                torch.nn.init.xavier_uniform_(self.weight[i], gain=1)
+
+    def forward(self, input, heads=None):
+        """
+        :param input: (B, in) shared by all members, or (n, B, in) with one slice per evaluated member
+        :param heads: optional indices of the members to evaluate
+        """
+        weight, bias = self.weight, self.bias
+        if heads is not None:
+            weight, bias = weight[heads], bias[heads]
+        if input.dim() == 2:
+            input = input.expand(weight.shape[0], *input.shape)
+        return torch.baddbmm(bias, input, weight)
+
+
+class EnsembleMlp(nn.Module):
+    """
+    N Mlps with the same architecture, evaluated together. Returns (N, B, output_size)
+    """
+    def __init__(
+            self,
+            ensemble_size,
+            input_size,
+            output_size,
+            hidden_sizes,
+            hidden_activation=F.relu
+    ):
+        super().__init__()
+
+        self.ensemble_size = ensemble_size
+        self.input_size = input_size
+        self.output_size = output_size
+        self.hidden_activation = hidden_activation
+        self.hidden_layers = nn.ModuleList()
+        in_size = input_size
+        for next_size in hidden_sizes:
+            self.hidden_layers.append(EnsembleLinear(ensemble_size, in_size, next_size))
+            in_size = next_size
+        self.last_fc_layer = EnsembleLinear(ensemble_size, in_size, output_size)
+
+    @classmethod
+    def from_mlps(cls, mlps):
+        """
+        stack the weights of a list of Mlps, the ensemble then computes exactly what the list did
+        """
+        first = mlps[0]
+        hidden_sizes = [layer.out_features for layer in first.hidden_layers]
+        # the init is overwritten anyway, keep it from advancing the global rng so seeded runs stay the same
+        with torch.random.fork_rng(devices=[]):
+            ensemble = cls(len(mlps), first.input_size, first.output_size, hidden_sizes, first.hidden_activation)
+        layers = list(ensemble.hidden_layers) + [ensemble.last_fc_layer]
+        with torch.no_grad():
+            for j, layer in enumerate(layers):
+                linears = [(list(mlp.hidden_layers) + [mlp.last_fc_layer])[j] for mlp in mlps]
+                layer.weight.copy_(torch.stack([linear.weight.t() for linear in linears]))
+                layer.bias.copy_(torch.stack([linear.bias.unsqueeze(0) for linear in linears]))
+        return ensemble.to(first.last_fc_layer.weight.device)
+
+    def forward(self, input, heads=None):
+        h = input
+        for fc_layer in self.hidden_layers:
+            h = self.hidden_activation(fc_layer(h, heads))
+        return self.last_fc_layer(h, heads)
+
 class TanhNormal(Distribution):
     """
     Represent distribution of X where
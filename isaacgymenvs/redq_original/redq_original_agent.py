@@ -21,7 +21,8 @@ import os
 from collections import defaultdict
 
 from torch import Tensor
-from isaacgymenvs.redq_original.core import TanhGaussianPolicy, Mlp, soft_update_model1_with_model2, ReplayBuffer
+from isaacgymenvs.redq_original.core import TanhGaussianPolicy, Mlp, EnsembleMlp, ReplayBuffer
+from isaacgymenvs.ppo.torch_ext import TargetNetwork
 
 def get_probabilistic_num_min(num_mins):
     # allows the number of min to be a float
@@ -70,29 +71,34 @@ class REDQAgent():
         hidden_sizes=params['network']['mlp']['units']
         lr=config["actor_lr"]
         gamma=0.99
-        polyak=0.995
+        polyak=config.get("polyak", 0.995)
         alpha=0.2
         auto_alpha=True
         start_steps=5000
         delay_update_steps='auto'
-        num_Q=2
+        num_Q=config.get('num_Q', 2)
         # utd_ratio=20
         # num_Q=10
-        num_min=2
+        num_min=config.get('num_min', 2)
         # set up networks
         self.policy_net = TanhGaussianPolicy(obs_dim, act_dim, hidden_sizes, action_limit=act_limit).to(device)
-        self.q_net_list, self.q_target_net_list = [], []
+        q_net_list, q_target_net_list = [], []
         for q_i in range(num_Q):
             new_q_net = Mlp(obs_dim + act_dim, 1, hidden_sizes).to(device)
-            self.q_net_list.append(new_q_net)
+            q_net_list.append(new_q_net)
             new_q_target_net = Mlp(obs_dim + act_dim, 1, hidden_sizes).to(device)
             new_q_target_net.load_state_dict(new_q_net.state_dict())
-            self.q_target_net_list.append(new_q_target_net)
+            q_target_net_list.append(new_q_target_net)
+        # the Q-nets are built one by one so the initialization matches the per-net version, then stacked into
+        # ensembles that evaluate all heads in one batched matmul per layer
+        self.q_net = EnsembleMlp.from_mlps(q_net_list)
+        self.q_target_net = EnsembleMlp.from_mlps(q_target_net_list)
+        # target <- polyak * target + (1 - polyak) * q_net, as one op over the flattened weights
+        self.q_target = TargetNetwork(self.q_net, self.q_target_net, 1 - polyak, config.get("target_update_interval", 1))
         # set up optimizers
         self.policy_optimizer = optim.Adam(self.policy_net.parameters(), lr=lr)
-        self.q_optimizer_list = []
-        for q_i in range(num_Q):
-            self.q_optimizer_list.append(optim.Adam(self.q_net_list[q_i].parameters(), lr=lr))
+        # Adam is elementwise, one optimizer over the stacked weights is the same as one per Q-net
+        self.q_optimizer = optim.Adam(self.q_net.parameters(), lr=lr)
         # set up adaptive entropy (SAC adaptive)
         self.auto_alpha = auto_alpha
         if auto_alpha:
@@ -629,11 +635,8 @@ class REDQAgent():
         with torch.no_grad():
             """Q target is min of a subset of Q values"""
             a_tilda_next, _, _, log_prob_a_tilda_next, _, _ = self.policy_net.forward(obs_next_tensor)
-            q_prediction_next_list = []
-            for sample_idx in sample_idxs:
-                q_prediction_next = self.q_target_net_list[sample_idx](torch.cat([obs_next_tensor, a_tilda_next], 1))
-                q_prediction_next_list.append(q_prediction_next)
-            q_prediction_next_cat = torch.cat(q_prediction_next_list, 1)
+            heads = torch.as_tensor(sample_idxs, device=obs_next_tensor.device)
+            q_prediction_next_cat = self.q_target_net(torch.cat([obs_next_tensor, a_tilda_next], 1), heads).squeeze(-1).t()
             min_q, min_indices = torch.min(q_prediction_next_cat, dim=1, keepdim=True)
             next_q_with_log_prob = min_q
             if self.entropy_backup:
@@ -661,34 +664,24 @@ class REDQAgent():
 
             """Q loss"""
             y_q, sample_idxs = self.get_redq_q_target_no_grad(obs_next_tensor, rews_tensor, done_tensor)
-            q_prediction_list = []
-            for q_i in range(self.num_Q):
-                q_prediction = self.q_net_list[q_i](torch.cat([obs_tensor, acts_tensor], 1))
-                q_prediction_list.append(q_prediction)
-            q_prediction_cat = torch.cat(q_prediction_list, dim=1)
+            q_prediction_cat = self.q_net(torch.cat([obs_tensor, acts_tensor], 1)).squeeze(-1).t()
             y_q = y_q.expand((-1, self.num_Q)) if y_q.shape[1] == 1 else y_q
             q_loss_all = self.mse_criterion(q_prediction_cat, y_q) * self.num_Q
 
-            for q_i in range(self.num_Q):
-                self.q_optimizer_list[q_i].zero_grad()
+            self.q_optimizer.zero_grad()
             q_loss_all.backward()
 
             """policy and alpha loss"""
             if ((i_update + 1) % self.policy_update_delay == 0) or i_update == num_update - 1:
                 # get policy loss
                 a_tilda, mean_a_tilda, log_std_a_tilda, log_prob_a_tilda, _, pretanh = self.policy_net.forward(obs_tensor)
-                q_a_tilda_list = []
-                for sample_idx in range(self.num_Q):
-                    self.q_net_list[sample_idx].requires_grad_(False)
-                    q_a_tilda = self.q_net_list[sample_idx](torch.cat([obs_tensor, a_tilda], 1))
-                    q_a_tilda_list.append(q_a_tilda)
-                q_a_tilda_cat = torch.cat(q_a_tilda_list, 1)
+                self.q_net.requires_grad_(False)
+                q_a_tilda_cat = self.q_net(torch.cat([obs_tensor, a_tilda], 1)).squeeze(-1).t()
                 ave_q = torch.mean(q_a_tilda_cat, dim=1, keepdim=True)
                 policy_loss = (self.alpha * log_prob_a_tilda - ave_q).mean()
                 self.policy_optimizer.zero_grad()
                 policy_loss.backward()
-                for sample_idx in range(self.num_Q):
-                    self.q_net_list[sample_idx].requires_grad_(True)
+                self.q_net.requires_grad_(True)
 
                 # get alpha loss
                 if self.auto_alpha:
@@ -704,19 +697,17 @@ class REDQAgent():
                                    'losses/entropy': (-log_prob_a_tilda.mean()).cpu(),
                                    'losses/alpha_loss': alpha_loss.cpu(),
                                    'info/alpha': torch.ones(1) * self.alpha,
-                                   'info/actor_q': q_prediction.mean().detach().cpu(),
+                                   'info/actor_q': q_prediction_cat[:, -1].mean().detach().cpu(),
                                    'info/target_entropy': torch.ones(1) * self.target_entropy,}
 
             """update networks"""
-            for q_i in range(self.num_Q):
-                self.q_optimizer_list[q_i].step()
+            self.q_optimizer.step()
 
             if ((i_update + 1) % self.policy_update_delay == 0) or i_update == num_update - 1:
                 self.policy_optimizer.step()
 
             # polyak averaged Q target networks
-            for q_i in range(self.num_Q):
-                soft_update_model1_with_model2(self.q_target_net_list[q_i], self.q_net_list[q_i], self.polyak)
+            self.q_target.update()
 
             # by default only log for the last update out of <num_update> updates
             # if i_update == num_update - 1:
@@ -1,26 +1,54 @@
+import os
+import queue
+import shutil
+import threading
+
 import numpy as np
 import random
 import gym
 import torch
 from rl_games.common.segment_tree import SumSegmentTree, MinSegmentTree
+from isaacgymenvs.sac.segment_tree import TensorSumSegmentTree, TensorMinSegmentTree
 import torch
 
 from rl_games.algos_torch.torch_ext import numpy_to_torch_dtype_dict
+from isaacgymenvs.ppo.torch_ext import safe_load
+
+
+def _to_cpu(state):
+    if torch.is_tensor(state):
+        return state.cpu()
+    if isinstance(state, dict):
+        return {k: _to_cpu(v) for k, v in state.items()}
+    if isinstance(state, list):
+        return [_to_cpu(v) for v in state]
+    return state
+
 
 class ReplayBuffer(object):
-    def __init__(self, size, ob_space):
+    def __init__(self, size, ob_space, n_step=1, gamma=0.99, action_shape=(), action_dtype=np.int32):
         """Create Replay buffer.
         Parameters
         ----------
         size: int
             Max number of transitions to store in the buffer. When the buffer
             overflows the old memories are dropped.
+        n_step: int
+            Number of consecutive transitions summed into the sampled rewards.
+            Transitions have to be added in the order they happened, from one env.
+        gamma: float
+            Discount of the n-step returns.
         """
-        self._obses = np.zeros((size,) + ob_space.shape, dtype=ob_space.dtype)
-        self._next_obses = np.zeros((size,) + ob_space.shape, dtype=ob_space.dtype)
-        self._rewards = np.zeros(size)
-        self._actions = np.zeros(size, dtype=np.int32)
-        self._dones = np.zeros(size, dtype=np.bool)
+        # one record per transition, sampling gathers each field with a single fancy index
+        self._storage = np.zeros(size, dtype=[
+            ('obs', ob_space.dtype, ob_space.shape),
+            ('action', action_dtype, action_shape),
+            ('reward', np.float64),
+            ('next_obs', ob_space.dtype, ob_space.shape),
+            ('done', np.bool_),
+        ])
+        self._n_step = n_step
+        self._gamma = gamma
 
         self._maxsize = size
         self._next_idx = 0
@@ -33,31 +61,36 @@ class ReplayBuffer(object):
 
         self._curr_size = min(self._curr_size + 1, self._maxsize )
 
-        self._obses[self._next_idx] = obs_t
-        self._next_obses[self._next_idx] = obs_tp1
-        self._rewards[self._next_idx] = reward
-        self._actions[self._next_idx] = action
-        self._dones[self._next_idx] = done
+        self._storage[self._next_idx] = (obs_t, action, reward, obs_tp1, done)
 
         self._next_idx = (self._next_idx + 1) % self._maxsize
 
     def _get(self, idx):
-        return self._obses[idx], self._actions[idx], self._rewards[idx], self._next_obses[idx], self._dones[idx]
+        record = self._storage[idx]
+        return record['obs'], record['action'], record['reward'], record['next_obs'], record['done']
 
     def _encode_sample(self, idxes):
-        batch_size = len(idxes)
-        obses_t, actions, rewards, obses_tp1, dones = [None] * batch_size, [None] * batch_size, [None] * batch_size, [None] * batch_size, [None] * batch_size
-        it = 0
-        for i in idxes:
-            data = self._get(i)
-            obs_t, action, reward, obs_tp1, done = data
-            obses_t[it] = np.array(obs_t, copy=False)
-            actions[it] = np.array(action, copy=False)
-            rewards[it] = reward
-            obses_tp1[it] = np.array(obs_tp1, copy=False)
-            dones[it] = done
-            it = it + 1
-        return np.array(obses_t), np.array(actions), np.array(rewards), np.array(obses_tp1), np.array(dones)
+        idxes = np.asarray(idxes, dtype=np.int64)
+        obses_t = self._storage['obs'][idxes]
+        actions = self._storage['action'][idxes]
+        if self._n_step == 1:
+            return obses_t, actions, self._storage['reward'][idxes], self._storage['next_obs'][idxes], self._storage['done'][idxes]
+
+        # n-step returns stop at the end of the episode and at the newest transition
+        rewards = np.zeros(len(idxes))
+        dones = np.zeros(len(idxes), dtype=np.bool_)
+        active = np.ones(len(idxes), dtype=np.bool_)
+        last = idxes
+        num_later = (self._next_idx - 1 - idxes) % self._maxsize
+        for k in range(self._n_step):
+            j = (idxes + k) % self._maxsize
+            if k > 0:
+                active &= ~dones & (k <= num_later)
+            rewards += np.where(active, self._gamma ** k * self._storage['reward'][j], 0.0)
+            dones |= active & self._storage['done'][j]
+            last = np.where(active, j, last)
+        discounts = self._gamma ** ((last - idxes) % self._maxsize + 1)
+        return obses_t, actions, rewards, self._storage['next_obs'][last], dones, discounts
 
     def sample(self, batch_size):
         """Sample a batch of experiences.
@@ -72,19 +105,36 @@ class ReplayBuffer(object):
         act_batch: np.array
             batch of actions executed given obs_batch
         rew_batch: np.array
-            rewards received as results of executing act_batch
+            rewards received as results of executing act_batch,
+            the discounted n-step returns if n_step > 1
         next_obs_batch: np.array
-            next set of observations seen after executing act_batch
+            next set of observations seen after executing act_batch,
+            after the last of the n steps if n_step > 1
         done_mask: np.array
             done_mask[i] = 1 if executing act_batch[i] resulted in
             the end of an episode and 0 otherwise.
+        discounts: np.array
+            only if n_step > 1, gamma ** (number of summed steps)
+            to bootstrap from next_obs_batch with
         """
-        idxes = [random.randint(0, self._curr_size - 1) for _ in range(batch_size)]
+        idxes = np.random.randint(0, self._curr_size, batch_size)
         return self._encode_sample(idxes)
 
+    def save(self, path):
+        """Write the buffer to the directory path as plain arrays, load() restores it"""
+        os.makedirs(path, exist_ok=True)
+        np.savez(os.path.join(path, 'buffer.npz'), storage=self._storage[:self._curr_size],
+                 next_idx=self._next_idx, curr_size=self._curr_size)
+
+    def load(self, path):
+        with np.load(os.path.join(path, 'buffer.npz'), allow_pickle=False) as state:
+            storage = state['storage']
+            self._storage[:len(storage)] = storage
+            self._next_idx, self._curr_size = int(state['next_idx']), int(state['curr_size'])
+
 
 class PrioritizedReplayBuffer(ReplayBuffer):
-    def __init__(self, size, alpha, ob_space):
+    def __init__(self, size, alpha, ob_space, **kwargs):
         """Create Prioritized Replay buffer.
         Parameters
         ----------
@@ -98,7 +148,7 @@ class PrioritizedReplayBuffer(ReplayBuffer):
         --------
         ReplayBuffer.__init__
         """
-        super(PrioritizedReplayBuffer, self).__init__(size, ob_space)
+        super(PrioritizedReplayBuffer, self).__init__(size, ob_space, **kwargs)
         assert alpha >= 0
         self._alpha = alpha
 
@@ -197,6 +247,18 @@ class PrioritizedReplayBuffer(ReplayBuffer):
 
             self._max_priority = max(self._max_priority, priority)
 
+    def save(self, path):
+        super().save(path)
+        np.savez(os.path.join(path, 'priorities.npz'), it_sum=np.asarray(self._it_sum._value),
+                 it_min=np.asarray(self._it_min._value), max_priority=self._max_priority)
+
+    def load(self, path):
+        super().load(path)
+        with np.load(os.path.join(path, 'priorities.npz'), allow_pickle=False) as state:
+            self._it_sum._value = state['it_sum'].tolist()
+            self._it_min._value = state['it_min'].tolist()
+            self._max_priority = float(state['max_priority'])
+
 
 class VectorizedReplayBuffer:
     def __init__(self, obs_shape, action_shape, capacity, device, precision='float32'):
@@ -286,6 +348,332 @@ class VectorizedReplayBuffer:
 
         return obses, actions, rewards, next_obses, dones
 
+    def checkpoint_files(self, path):
+        """The files save() writes into the directory path, {file: state} with the tensors still on the device"""
+        size = self.size
+        fields = [t[:size] for t in [self.obses, self.actions, self.rewards, self.next_obses, self.dones]]
+        return {os.path.join(path, 'buffer.pt'): {'fields': fields, 'idx': self.idx, 'full': self.full}}
+
+    def save(self, path):
+        os.makedirs(path, exist_ok=True)
+        for fn, state in self.checkpoint_files(path).items():
+            torch.save(_to_cpu(state), fn)
+
+    def load(self, path):
+        state = safe_load(os.path.join(path, 'buffer.pt'))
+        for t, saved in zip([self.obses, self.actions, self.rewards, self.next_obses, self.dones], state['fields']):
+            t[:saved.shape[0]] = saved.to(self.device)
+        self.idx, self.full = state['idx'], state['full']
+
+
+class PrioritizedVectorizedReplayBuffer(VectorizedReplayBuffer):
+    def __init__(self, obs_shape, action_shape, capacity, device, precision='float32', alpha=0.6, eps=1e-6):
+        """VectorizedReplayBuffer with proportional prioritization, the tensor counterpart of PrioritizedReplayBuffer.
+        The priorities are kept in tensor segment trees on the same device as the transitions, so sampling a batch
+        and updating its priorities are a few batched tensor ops and never wait for the host.
+        Parameters
+        ----------
+        alpha: float
+            how much prioritization is used
+            (0 - no prioritization, 1 - full prioritization)
+        eps: float
+            added to the priorities so that every transition can still be sampled
+        See Also
+        --------
+        VectorizedReplayBuffer.__init__
+        """
+        super().__init__(obs_shape, action_shape, capacity, device, precision)
+        assert alpha >= 0
+        self.alpha = alpha
+        self.eps = eps
+
+        it_capacity = 1
+        while it_capacity < capacity:
+            it_capacity *= 2
+
+        self.it_sum = TensorSumSegmentTree(it_capacity, device)
+        self.it_min = TensorMinSegmentTree(it_capacity, device)
+        self.max_priority = torch.ones((), dtype=torch.float64, device=device)
+
+    def add(self, obs, action, reward, next_obs, terminated, done):
+        idxs = torch.arange(self.idx, self.idx + obs.shape[0], device=self.device) % self.capacity
+        super().add(obs, action, reward, next_obs, terminated, done)
+        # new transitions get the highest priority seen so far, so that they are sampled at least once
+        priority = self.max_priority ** self.alpha
+        self.it_sum.update(idxs, priority)
+        self.it_min.update(idxs, priority)
+
+    def sample(self, batch_size, beta=0.4):
+        """Sample a batch of experiences proportionally to their priorities.
+        compared to VectorizedReplayBuffer.sample
+        it also returns importance weights and idxs
+        of sampled experiences.
+        Parameters
+        ----------
+        beta: float
+            To what degree to use importance weights
+            (0 - no corrections, 1 - full correction)
+        Returns
+        -------
+        weights: torch tensor
+            (batch_size, 1) float32 importance weights, normalized to be at most 1
+        idxs: torch tensor
+            indices of the sampled experiences, to pass to update_priorities
+        See Also
+        --------
+        VectorizedReplayBuffer.sample
+        """
+        assert beta > 0
+        size = self.size
+        p_total = self.it_sum.sum()
+        # one sample from each of batch_size equal slices of the total priority
+        mass = (torch.rand(batch_size, dtype=torch.float64, device=self.device)
+                + torch.arange(batch_size, device=self.device)) * (p_total / batch_size)
+        idxs = self.it_sum.find_prefixsum_idx(mass).clamp_(max=size - 1)
+
+        # (p_sample * size) ** -beta normalized by the largest weight, (p_min * size) ** -beta
+        weights = (self.it_sum[idxs] / self.it_min.min()) ** -beta
+
+        obses = self.obses[idxs].to(torch.float32)
+        actions = self.actions[idxs].to(torch.float32)
+        rewards = self.rewards[idxs].to(torch.float32)
+        next_obses = self.next_obses[idxs].to(torch.float32)
+        dones = self.dones[idxs]
+
+        return obses, actions, rewards, next_obses, dones, weights.to(torch.float32).unsqueeze(1), idxs
+
+    def update_priorities(self, idxs, priorities):
+        """Update priorities of sampled transitions.
+        Parameters
+        ----------
+        idxs: torch tensor
+            idxs returned by sample
+        priorities: torch tensor
+            new priorities of these transitions, e.g. their absolute TD errors
+        """
+        priorities = priorities.detach().view(-1).to(torch.float64) + self.eps
+        torch.maximum(self.max_priority, priorities.max(), out=self.max_priority)
+        self.it_sum.update(idxs, priorities ** self.alpha)
+        self.it_min.update(idxs, priorities ** self.alpha)
+
+    def checkpoint_files(self, path):
+        files = super().checkpoint_files(path)
+        files[os.path.join(path, 'priorities.pt')] = {'it_sum': self.it_sum.value, 'it_min': self.it_min.value,
+                                                      'max_priority': self.max_priority}
+        return files
+
+    def load(self, path):
+        super().load(path)
+        state = safe_load(os.path.join(path, 'priorities.pt'))
+        self.it_sum.value.copy_(state['it_sum'])
+        self.it_min.value.copy_(state['it_min'])
+        self.max_priority.copy_(state['max_priority'])
+
+
+class TieredReplayBuffer:
+    _fields = ['obses', 'actions', 'rewards', 'next_obses', 'dones']
+
+    def __init__(self, obs_shape, action_shape, hot_capacity, cold_capacity, cold_dir, device, precision='float32', prefetch=2):
+        """Replay buffer split into a hot ring on the device and a cold ring in memory-mapped files.
+        New transitions go to the hot ring, transitions pushed out of it spill into the cold ring. Together
+        they behave like a VectorizedReplayBuffer of hot_capacity + cold_capacity transitions.
+        Parameters
+        ----------
+        hot_capacity: int
+            Transitions kept on the device, has to hold at least one add() worth of transitions.
+        cold_capacity: int
+            Transitions kept in the files under cold_dir.
+        prefetch: int
+            Number of cold batches gathered ahead of time by a background thread, 0 gathers them in sample().
+        """
+        assert cold_capacity >= hot_capacity, 'the cold tier is meant to be the larger one'
+        self.device = device
+        self.dtype = torch.float32 if precision == 'float32' else torch.float16
+        np_dtype = np.float32 if precision == 'float32' else np.float16
+
+        self.obses = torch.empty((hot_capacity, *obs_shape), dtype=self.dtype, device=self.device)
+        self.next_obses = torch.empty((hot_capacity, *obs_shape), dtype=self.dtype, device=self.device)
+        self.actions = torch.empty((hot_capacity, *action_shape), dtype=self.dtype, device=self.device)
+        self.rewards = torch.empty((hot_capacity, 1), dtype=self.dtype, device=self.device)
+        self.dones = torch.empty((hot_capacity, 1), dtype=torch.bool, device=self.device)
+
+        os.makedirs(cold_dir, exist_ok=True)
+        self.cold_dir = cold_dir
+        shapes = [obs_shape, action_shape, (1,), obs_shape, (1,)]
+        dtypes = [np_dtype] * 4 + [np.bool_]
+        self.cold = [np.memmap(os.path.join(cold_dir, name + '.dat'), dtype=dtype, mode='w+', shape=(cold_capacity, *shape))
+                     for name, shape, dtype in zip(self._fields, shapes, dtypes)]
+
+        self.hot_capacity = hot_capacity
+        self.cold_capacity = cold_capacity
+        self.capacity = hot_capacity + cold_capacity
+        self.idx = 0
+        self.hot_full = False
+        self.cold_idx = 0
+        self.cold_full = False
+
+        # guards the cold files, the prefetch thread reads them while add() writes
+        self._lock = threading.Lock()
+        self._pin = torch.device(device).type == 'cuda'
+        self._rng = np.random.default_rng(np.random.randint(2 ** 31))
+        self.prefetch = prefetch
+        self._queue = None
+        self._thread = None
+        self._stop = threading.Event()
+        self._batch_size = None
+        # host buffers the cold rows are gathered into, reused round robin, see _cold_slot
+        self._pool = []
+        self._pool_events = []
+        self._pool_slot = 0
+
+    @property
+    def full(self):
+        # like VectorizedReplayBuffer.full for the capacity of both tiers, e.g. for fill_buffer_first
+        return self.hot_full and self.cold_full
+
+    @property
+    def hot_size(self):
+        return self.hot_capacity if self.hot_full else self.idx
+
+    @property
+    def cold_size(self):
+        return self.cold_capacity if self.cold_full else self.cold_idx
+
+    @property
+    def size(self):
+        return self.hot_size + self.cold_size
+
+    def _hot_data(self):
+        return [self.obses, self.actions, self.rewards, self.next_obses, self.dones]
+
+    def _spill(self, hot_start, num_observations):
+        # moves the oldest transitions of the hot ring, which are about to be overwritten, into the cold ring
+        idxs = torch.arange(hot_start, hot_start + num_observations, device=self.device) % self.hot_capacity
+        rows = [t[idxs].cpu().numpy() for t in self._hot_data()]
+        start = self.cold_idx
+        first = min(self.cold_capacity - start, num_observations)
+        with self._lock:
+            for field, row in zip(self.cold, rows):
+                field[start:start + first] = row[:first]
+                field[:num_observations - first] = row[first:]
+        self.cold_idx = (start + num_observations) % self.cold_capacity
+        self.cold_full = self.cold_full or start + num_observations >= self.cold_capacity
+
+    def add(self, obs, action, reward, next_obs, terminated, done):
+        num_observations = obs.shape[0]
+        assert num_observations <= self.hot_capacity, 'the hot tier has to hold at least one batch of transitions'
+        if self.hot_full:
+            self._spill(self.idx, num_observations)
+        elif self.idx + num_observations > self.hot_capacity:
+            self._spill(0, self.idx + num_observations - self.hot_capacity)
+
+        data = [obs.to(self.dtype), action.to(self.dtype), reward.to(self.dtype), next_obs.to(self.dtype), terminated]
+        remaining_capacity = min(self.hot_capacity - self.idx, num_observations)
+        overflow = num_observations - remaining_capacity
+        for t, x in zip(self._hot_data(), data):
+            if overflow > 0:
+                t[0: overflow] = x[-overflow:]
+            t[self.idx: self.idx + remaining_capacity] = x[:remaining_capacity]
+        self.hot_full = self.hot_full or overflow > 0
+
+        self.idx = (self.idx + num_observations) % self.hot_capacity
+        self.hot_full = self.hot_full or self.idx == 0
+
+    def _cold_slot(self, batch_size):
+        # the prefetch queue, the batch gathered by the thread and the batch used by sample() each hold a slot
+        num_slots = max(self.prefetch, 0) + 2
+        if not self._pool or self._pool[0][0].shape[0] < batch_size:
+            dtypes = [self.dtype] * 4 + [torch.bool]
+            self._pool = [[torch.empty((batch_size, *field.shape[1:]), dtype=dtype, pin_memory=self._pin)
+                           for field, dtype in zip(self.cold, dtypes)] for _ in range(num_slots)]
+            self._pool_events = [torch.cuda.Event() if self._pin else None for _ in range(num_slots)]
+            self._pool_slot = 0
+        slot = self._pool_slot
+        self._pool_slot = (slot + 1) % num_slots
+        if self._pin:
+            # the copy to the device that sample() started from this slot has to be done before it is overwritten
+            self._pool_events[slot].synchronize()
+        return slot
+
+    def _gather_cold(self, batch_size, rng):
+        hot_size, cold_size = self.hot_size, self.cold_size
+        n_cold = rng.binomial(batch_size, cold_size / (hot_size + cold_size)) if cold_size > 0 else 0
+        # sorted indices read the files front to back
+        idxs = np.sort(rng.integers(0, max(cold_size, 1), n_cold))
+        slot = self._cold_slot(batch_size)
+        rows = [buffer[:n_cold] for buffer in self._pool[slot]]
+        with self._lock:
+            for field, row in zip(self.cold, rows):
+                np.take(field, idxs, axis=0, out=row.numpy())
+        return n_cold, rows, slot
+
+    def _prefetch_loop(self, batch_size):
+        while not self._stop.is_set():
+            batch = self._gather_cold(batch_size, self._rng)
+            while not self._stop.is_set():
+                try:
+                    self._queue.put(batch, timeout=0.1)
+                    break
+                except queue.Full:
+                    pass
+
+    def _next_cold(self, batch_size):
+        if self.prefetch <= 0 or self.cold_size == 0:
+            return self._gather_cold(batch_size, self._rng)
+        if self._batch_size != batch_size:
+            self.close()
+            self._stop.clear()
+            self._batch_size = batch_size
+            self._queue = queue.Queue(maxsize=self.prefetch)
+            self._thread = threading.Thread(target=self._prefetch_loop, args=(batch_size,), daemon=True)
+            self._thread.start()
+        return self._queue.get()
+
+    def sample(self, batch_size):
+        """Sample a batch of experiences uniformly from both tiers, see VectorizedReplayBuffer.sample"""
+        n_cold, cold_rows, slot = self._next_cold(batch_size)
+        idxs = torch.randint(0, self.hot_size, (batch_size - n_cold,), device=self.device)
+        data = [torch.cat([t[idxs], row.to(self.device, non_blocking=True)]) for t, row in zip(self._hot_data(), cold_rows)]
+        if self._pin:
+            self._pool_events[slot].record()
+        obses, actions, rewards, next_obses, dones = data
+        return obses.to(torch.float32), actions.to(torch.float32), rewards.to(torch.float32), next_obses.to(torch.float32), dones
+
+    def close(self):
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+            self._batch_size = None
+
+    def save(self, path):
+        """Write both tiers to the directory path, load() restores the buffer from it"""
+        os.makedirs(path, exist_ok=True)
+        fields = [t[:self.hot_size].cpu() for t in self._hot_data()]
+        torch.save({'fields': fields, 'idx': self.idx, 'hot_full': self.hot_full,
+                    'cold_idx': self.cold_idx, 'cold_full': self.cold_full}, os.path.join(path, 'hot.pt'))
+        with self._lock:
+            for name, field in zip(self._fields, self.cold):
+                field.flush()
+                if os.path.abspath(path) != os.path.abspath(self.cold_dir):
+                    shutil.copyfile(field.filename, os.path.join(path, name + '.dat'))
+
+    def load(self, path):
+        self.close()
+        state = safe_load(os.path.join(path, 'hot.pt'))
+        for t, saved in zip(self._hot_data(), state['fields']):
+            t[:saved.shape[0]] = saved.to(self.device)
+        self.idx, self.hot_full = state['idx'], state['hot_full']
+        with self._lock:
+            if os.path.abspath(path) != os.path.abspath(self.cold_dir):
+                for name, field in zip(self._fields, self.cold):
+                    saved = np.memmap(os.path.join(path, name + '.dat'), dtype=field.dtype, mode='r', shape=field.shape)
+                    # chunked so that restoring does not pull the whole file into memory at once
+                    for start in range(0, field.shape[0], 1 << 20):
+                        field[start:start + (1 << 20)] = saved[start:start + (1 << 20)]
+                    del saved
+        self.cold_idx, self.cold_full = state['cold_idx'], state['cold_full']
+
 
 
 
@@ -349,7 +737,7 @@ class ExperienceBuffer:
         if self.is_discrete or self.is_multi_discrete:
             self.tensor_dict['actions'] = self._create_tensor_from_space(gym.spaces.Box(low=0, high=1,shape=self.actions_shape, dtype=int), obs_base_shape)
         if self.use_action_masks:
-            self.tensor_dict['action_masks'] = self._create_tensor_from_space(gym.spaces.Box(low=0, high=1,shape=self.actions_shape + (np.sum(self.actions_num),), dtype=np.bool), obs_base_shape)
+            self.tensor_dict['action_masks'] = self._create_tensor_from_space(gym.spaces.Box(low=0, high=1,shape=self.actions_shape + (np.sum(self.actions_num),), dtype=np.bool_), obs_base_shape)
         if self.is_continuous:
             self.tensor_dict['actions'] = self._create_tensor_from_space(gym.spaces.Box(low=0, high=1,shape=self.actions_shape, dtype=np.float32), obs_base_shape)
             self.tensor_dict['mus'] = self._create_tensor_from_space(gym.spaces.Box(low=0, high=1,shape=self.actions_shape, dtype=np.float32), obs_base_shape)
@@ -4,11 +4,12 @@ from rl_games.common import vecenv
 from rl_games.common import schedulers
 from isaacgymenvs.ppo.a2c_common import print_statistics
 from isaacgymenvs.ppo import model_builder
-from isaacgymenvs.ppo.torch_ext import explained_variance
+from isaacgymenvs.ppo.torch_ext import explained_variance, load_checkpoint, TargetNetwork
 from isaacgymenvs.sac import her_replay_buffer
 from isaacgymenvs.sac import experience
 from isaacgymenvs.sac import validation_replay_buffer
 from isaacgymenvs.utils.rlgames_utils import Every, get_grad_norm, save_cmd
+from isaacgymenvs.utils.checkpoints import CheckpointManager
 
 from rl_games.interfaces.base_algorithm import  BaseAlgorithm
 from torch.utils.tensorboard import SummaryWriter
@@ -37,6 +38,7 @@ class SACAgent(BaseAlgorithm):
         self.num_warmup_steps = config["num_warmup_steps"]
         self.gamma = config["gamma"]
         self.critic_tau = float(config["critic_tau"])
+        self.target_update_interval = config.get("target_update_interval", 1)
         self.batch_size = config["batch_size"]
         self.init_alpha = config["init_alpha"]
         self.learnable_temperature = config["learnable_temperature"]
@@ -53,6 +55,18 @@ class SACAgent(BaseAlgorithm):
         self.policy_update_fraction = config.get('policy_update_fraction', 1)
         self.mixed_precision = config.get('mixed_precision', False)
         self.rb_precision = config.get('rb_precision', 'float32')
+        # 'memory' keeps the whole replay buffer on the device, 'tiered' only the newest rb_hot_capacity
+        # transitions and spills the rest into memory-mapped files under rb_cold_dir
+        self.rb_storage = config.get('rb_storage', 'memory')
+        self.rb_hot_capacity = config.get('rb_hot_capacity', 1_048_576)
+        self.rb_cold_dir = check_for_none(config.get('rb_cold_dir', None))
+        self.rb_prefetch = config.get('rb_prefetch', 2)
+        self.rb_save = config.get('rb_save', False)
+        # proportional prioritized replay, the priorities are the TD errors of the last update of each transition
+        self.rb_prioritized = config.get('rb_prioritized', False)
+        self.rb_alpha = config.get('rb_alpha', 0.6)
+        self.rb_beta = config.get('rb_beta', 0.4)
+        self.rb_priority_eps = float(config.get('rb_priority_eps', 1e-6))
         self.fill_buffer_first = config.get('fill_buffer_first', False)
 
         # TODO: double-check! To use bootstrap instead?
@@ -76,6 +90,7 @@ class SACAgent(BaseAlgorithm):
         print("Number of Agents", self.num_actors, "Batch Size", self.batch_size)
         self.build_network()
 
+        assert not (self.rb_prioritized and self.relabel_ratio > 0.0), 'prioritized replay does not support relabeling'
         if self.relabel_ratio > 0.0:
             self.replay_buffer = validation_replay_buffer.ValidationHERReplayBuffer(self.env_info['observation_space'].shape,
                                                             self.env_info['action_space'].shape,
@@ -88,6 +103,24 @@ class SACAgent(BaseAlgorithm):
                                                             self.relabel_ratio_random,
                                                             self.validation_ratio,
                                                             self.rb_precision)
+        elif self.rb_prioritized:
+            assert self.rb_storage == 'memory', 'prioritized replay only supports memory storage'
+            self.replay_buffer = experience.PrioritizedVectorizedReplayBuffer(self.env_info['observation_space'].shape,
+                                                                self.env_info['action_space'].shape,
+                                                                self.replay_buffer_size,
+                                                                self._device,
+                                                                self.rb_precision,
+                                                                self.rb_alpha,
+                                                                self.rb_priority_eps)
+        elif self.rb_storage == 'tiered':
+            self.replay_buffer = experience.TieredReplayBuffer(self.env_info['observation_space'].shape,
+                                                                self.env_info['action_space'].shape,
+                                                                self.rb_hot_capacity,
+                                                                self.replay_buffer_size - self.rb_hot_capacity,
+                                                                self.rb_cold_dir or os.path.join(self.experiment_dir, 'replay_buffer'),
+                                                                self._device,
+                                                                self.rb_precision,
+                                                                self.rb_prefetch)
         else:
             self.replay_buffer = experience.VectorizedReplayBuffer(self.env_info['observation_space'].shape,
                                                                 self.env_info['action_space'].shape,
@@ -124,6 +157,9 @@ class SACAgent(BaseAlgorithm):
                                                     lr=float(self.config["alpha_lr"]),
                                                     betas=self.config.get("alphas_betas", [0.9, 0.999]))
 
+        self.critic_target_update = TargetNetwork(self.model.sac_network.critic, self.model.sac_network.critic_target,
+                                                  self.critic_tau, self.target_update_interval)
+
     def load_networks(self, params):
         builder = model_builder.ModelBuilder()
         self.config['network'] = builder.load(params)
@@ -208,6 +244,13 @@ class SACAgent(BaseAlgorithm):
         os.makedirs(self.summaries_dir, exist_ok=True)
         save_cmd(self.experiment_dir)
 
+        # checkpoints are written on a background thread, 0 keeps every last_ and best_ checkpoint
+        self.checkpoints = CheckpointManager(self.nn_dir,
+            keep_last=config.get('keep_last_checkpoints', 0),
+            keep_best=config.get('keep_best_checkpoints', 0),
+            compression=config.get('checkpoint_compression', 0),
+            background=config.get('checkpoint_background', True))
+
         self.algo_observer = config['features']['observer']
         self.algo_observer.before_init(base_name, config, self.experiment_name)
         self.writer = SummaryWriter(self.summaries_dir)
@@ -244,9 +287,16 @@ class SACAgent(BaseAlgorithm):
          'critic_target': self.model.sac_network.critic_target.state_dict()}
         return state
 
-    def save(self, fn):
+    def save(self, fn, kind=None, score=None, link=None):
         state = self.get_full_state_weights()
-        torch_ext.save_checkpoint(fn, state)
+        self.checkpoints.save(fn, state, kind, score, link)
+
+    def save_replay_buffer(self, path):
+        if hasattr(self.replay_buffer, 'checkpoint_files'):
+            self.checkpoints.save_files(self.replay_buffer.checkpoint_files(path))
+        else:
+            # the tiered buffer copies its memory-mapped tier, that has to happen before training moves on
+            self.replay_buffer.save(path)
 
     def set_weights(self, weights):
         self.model.sac_network.actor.load_state_dict(weights['actor'])
@@ -286,9 +336,14 @@ class SACAgent(BaseAlgorithm):
 
     def restore(self, fn, set_epoch=True):
         print("SAC restore")
-        checkpoint = torch_ext.load_checkpoint(fn)
+        checkpoint = load_checkpoint(fn)
         self.set_full_state_weights(checkpoint, set_epoch=set_epoch)
 
+        rb_path = os.path.splitext(fn)[0] + '_replay_buffer'
+        if self.rb_save and os.path.isdir(rb_path):
+            print("Restoring replay buffer from", rb_path)
+            self.replay_buffer.load(rb_path)
+
     def get_param(self, param_name):
         pass
 
@@ -304,7 +359,7 @@ class SACAgent(BaseAlgorithm):
     def set_train(self):
         self.model.train()
 
-    def update_critic(self, obs, action, reward, next_obs, not_done):
+    def update_critic(self, obs, action, reward, next_obs, not_done, weights=None):
         with torch.cuda.amp.autocast(enabled=self.mixed_precision):
             with torch.no_grad():
                 dist = self.model.actor(next_obs)
@@ -322,8 +377,13 @@ class SACAgent(BaseAlgorithm):
             # get current Q estimates
             current_Q1, current_Q2 = self.model.critic(obs, action)
 
-            critic1_loss = nn.MSELoss()(current_Q1, target_Q)
-            critic2_loss = nn.MSELoss()(current_Q2, target_Q)
+            if weights is None:
+                critic1_loss = nn.MSELoss()(current_Q1, target_Q)
+                critic2_loss = nn.MSELoss()(current_Q2, target_Q)
+            else:
+                # importance weighted for prioritized replay
+                critic1_loss = (weights * (current_Q1 - target_Q) ** 2).mean()
+                critic2_loss = (weights * (current_Q2 - target_Q) ** 2).mean()
         critic_loss = critic1_loss + critic2_loss 
 
         info = {'losses/c_loss': critic_loss.detach(),
@@ -338,6 +398,10 @@ class SACAgent(BaseAlgorithm):
             info['losses/c_loss_original'] = nn.MSELoss()(current_Q1[:real], target_Q[:real]).detach()
             info['losses/c_loss_relabeled'] = nn.MSELoss()(current_Q1[real:], target_Q[real:]).detach()
 
+        if weights is not None:
+            # new priorities, popped by update() before the info is logged
+            info['td_error'] = ((current_Q1 - target_Q).abs() + (current_Q2 - target_Q).abs()).detach() / 2
+
         return critic_loss, info
 
     def update_actor_and_alpha(self, obs):
@@ -375,16 +439,17 @@ class SACAgent(BaseAlgorithm):
 
         return actor_loss, info
 
-    def soft_update_params(self, net, target_net, tau):
-        for param, target_param in zip(net.parameters(), target_net.parameters()):
-            target_param.data.copy_(tau * param.data +
-                                    (1.0 - tau) * target_param.data)
-
     def update(self, step):
-        obs, action, reward, next_obs, done = self.replay_buffer.sample(self.batch_size)
+        if self.rb_prioritized:
+            obs, action, reward, next_obs, done, weights, idxs = self.replay_buffer.sample(self.batch_size, self.rb_beta)
+        else:
+            obs, action, reward, next_obs, done = self.replay_buffer.sample(self.batch_size)
+            weights = None
 
         # Critic
-        critic_loss, critic_loss_info = self.update_critic(obs, action, reward, next_obs, ~done)
+        critic_loss, critic_loss_info = self.update_critic(obs, action, reward, next_obs, ~done, weights)
+        if self.rb_prioritized:
+            self.replay_buffer.update_priorities(idxs, critic_loss_info.pop('td_error'))
         self.critic_optimizer.zero_grad(set_to_none=True)
         critic_loss.backward()
         if self.grad_norm is not None:
@@ -413,8 +478,7 @@ class SACAgent(BaseAlgorithm):
             else:
                 alpha_loss = None
 
-        self.soft_update_params(self.model.sac_network.critic, self.model.sac_network.critic_target,
-                                     self.critic_tau)
+        self.critic_target_update.update()
         return actor_loss_info, critic_loss_info
 
     def validate(self):  
@@ -633,6 +697,7 @@ class SACAgent(BaseAlgorithm):
 
             curr_frames = self.num_frames_per_epoch
             self.frame += curr_frames
+            self.algo_observer.after_steps()
 
             fps_step = curr_frames / step_time
             fps_step_inference = curr_frames / play_time
@@ -674,20 +739,23 @@ class SACAgent(BaseAlgorithm):
                     self.writer.add_scalar('rewards/time', mean_rewards, total_time)
                     self.writer.add_scalar('episode_lengths/step', mean_lengths, self.frame)
                     self.writer.add_scalar('episode_lengths/time', mean_lengths, total_time)
-                    checkpoint_name = os.path.join(self.nn_dir, 'last_' + self.config['name'] + '_frame_' + str(self.frame) \
-                            + '_rew_' + str(mean_rewards).replace('[', '_').replace(']', '_'))
+                    run_name = self.config['name'] + '_frame_' + str(self.frame) \
+                            + '_rew_' + str(mean_rewards).replace('[', '_').replace(']', '_')
+                    checkpoint_name = os.path.join(self.nn_dir, 'last_' + run_name)
 
                     should_exit = False
 
                     if self.save_freq > 0:
                         if self.epoch_num % self.save_freq == 0:
-                            self.save(os.path.join(self.nn_dir, 'last_' + self.config['name']))
-                            self.save(checkpoint_name)
+                            self.save(checkpoint_name, kind='last', link=os.path.join(self.nn_dir, 'last_' + self.config['name']))
+                            if self.rb_save:
+                                self.save_replay_buffer(os.path.join(self.nn_dir, 'last_' + self.config['name'] + '_replay_buffer'))
 
                     if mean_rewards > self.last_mean_rewards and self.epoch_num >= self.save_best_after:
                         print('saving next best rewards: ', mean_rewards)
                         self.last_mean_rewards = mean_rewards
-                        self.save(os.path.join(self.nn_dir, self.config['name']))
+                        self.save(os.path.join(self.nn_dir, 'best_' + run_name), kind='best', score=float(mean_rewards),
+                                  link=os.path.join(self.nn_dir, self.config['name']))
                         if self.last_mean_rewards > self.config.get('score_to_win', float('inf')):
                             print('Maximum reward achieved. Network won!')
                             self.save(checkpoint_name)
@@ -714,6 +782,7 @@ class SACAgent(BaseAlgorithm):
                     update_time = 0
 
                     if should_exit:
+                        self.checkpoints.close()
                         return self.last_mean_rewards, self.epoch_num
                 
             # Test
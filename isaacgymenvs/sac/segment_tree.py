@@ -0,0 +1,80 @@
+import torch
+
+
+class TensorSegmentTree:
+    def __init__(self, capacity, operation, neutral_element, device='cpu'):
+        """Segment tree kept in one tensor, like rl_games.common.segment_tree.SegmentTree but updated and queried for
+        a whole batch of indices at once.
+        Node 1 is the root, the children of node i are 2i and 2i + 1 and leaf i is node capacity + i.
+        Values are float64 so that the prefix sums of large buffers do not lose the small priorities.
+        Parameters
+        ----------
+        capacity: int
+            Number of leaves, has to be a power of 2.
+        operation: callable
+            Elementwise torch op combining two tensors of children, e.g. torch.add or torch.minimum.
+        neutral_element: float
+            Value of the empty leaves, e.g. 0 for sum and inf for min.
+        """
+        assert capacity > 0 and capacity & (capacity - 1) == 0, "capacity must be positive and a power of 2."
+        self.capacity = capacity
+        self.depth = capacity.bit_length() - 1
+        self.operation = operation
+        self.neutral_element = neutral_element
+        self.device = device
+        self.value = torch.full((2 * capacity,), neutral_element, dtype=torch.float64, device=device)
+
+    def reduce(self):
+        """operation applied to all leaves, as a 0-dim tensor"""
+        return self.value[1]
+
+    def update(self, idxs, values):
+        """Sets leaves idxs to values and recomputes their ancestors.
+        Like assigning them one at a time, the last value wins for repeated indices.
+        """
+        idxs = torch.as_tensor(idxs, dtype=torch.long, device=self.device).view(-1)
+        values = torch.broadcast_to(torch.as_tensor(values, dtype=torch.float64, device=self.device).view(-1), idxs.shape)
+        # a stable sort keeps repeated indices in batch order, the last of each run is the value that wins
+        sorted_idxs, order = torch.sort(idxs, stable=True)
+        last = torch.ones_like(sorted_idxs, dtype=torch.bool)
+        last[:-1] = sorted_idxs[1:] != sorted_idxs[:-1]
+        nodes = sorted_idxs[last] + self.capacity
+        self.value[nodes] = values[order[last]]
+        for _ in range(self.depth):
+            nodes = nodes // 2
+            self.value[nodes] = self.operation(self.value[2 * nodes], self.value[2 * nodes + 1])
+
+    def __setitem__(self, idxs, values):
+        self.update(idxs, values)
+
+    def __getitem__(self, idxs):
+        return self.value[torch.as_tensor(idxs, dtype=torch.long, device=self.device) + self.capacity]
+
+
+class TensorSumSegmentTree(TensorSegmentTree):
+    def __init__(self, capacity, device='cpu'):
+        super().__init__(capacity, torch.add, 0.0, device)
+
+    def sum(self):
+        return self.reduce()
+
+    def find_prefixsum_idx(self, prefixsum):
+        """For every entry of prefixsum, the highest index i such that sum(arr[:i]) <= prefixsum,
+        the batched rl_games SumSegmentTree.find_prefixsum_idx.
+        """
+        prefixsum = torch.as_tensor(prefixsum, dtype=torch.float64, device=self.device).clone()
+        idx = torch.ones(prefixsum.shape, dtype=torch.long, device=self.device)
+        for _ in range(self.depth):
+            left = self.value[2 * idx]
+            go_right = left <= prefixsum
+            prefixsum -= torch.where(go_right, left, torch.zeros_like(left))
+            idx = 2 * idx + go_right.long()
+        return idx - self.capacity
+
+
+class TensorMinSegmentTree(TensorSegmentTree):
+    def __init__(self, capacity, device='cpu'):
+        super().__init__(capacity, torch.minimum, float('inf'), device)
+
+    def min(self):
+        return self.reduce()
@@ -41,11 +41,14 @@ class ValidationHERReplayBuffer(HERReplayBuffer):
         self.actions = torch.empty((n_steps, n_envs, *action_shape), dtype=self.dtype, device=self.device)
         self.rewards = torch.empty((n_steps, n_envs, 1), dtype=self.dtype, device=self.device)
         self.dones = torch.empty((n_steps, n_envs, 1), dtype=torch.bool, device=self.device)
-        self.steps_to_go = torch.empty((n_steps, n_envs), dtype=torch.int64, device=self.device)
-        self.data = [self.obses, self.actions, self.rewards, self.next_obses, self.dones, self.steps_to_go]
-        # I am going to track episode length as follows. Log current episode start. Every step, increment
-        # steps_to_go starting from current episode start
-        self.current_ep_start = torch.zeros((n_envs,), dtype=torch.long, device=self.device)
+        self.episode_ids = torch.empty((n_steps, n_envs), dtype=torch.int64, device=self.device)
+        self.data = [self.obses, self.actions, self.rewards, self.next_obses, self.dones, self.episode_ids]
+        # Episode boundaries are tracked per env: every transition stores the id of its episode, and
+        # episode_end[env, id % n_steps] holds the index of the last transition of that episode so far.
+        # At most n_steps episodes of an env fit into the buffer, so the table never aliases a live episode.
+        self.episode_count = torch.zeros((n_envs,), dtype=torch.long, device=self.device)
+        self.episode_end = torch.zeros((n_envs, n_steps), dtype=torch.long, device=self.device)
+        self.env_ids = torch.arange(n_envs, device=self.device)
 
         self.idx = 0
         self.full = False
@@ -63,20 +66,13 @@ class ValidationHERReplayBuffer(HERReplayBuffer):
         return [l[:, self.train_envs:] for l in self.data]
 
     def add(self, obs, action, reward, next_obs, terminated, done):
-        steps_to_go = torch.zeros_like(done)[:, 0]
-        for x, y in zip(self.data, [obs, action, reward, next_obs, terminated, steps_to_go]):
+        for x, y in zip(self.data, [obs, action, reward, next_obs, terminated, self.episode_count]):
             if y.dtype == torch.float32: y = y.to(self.dtype)
             x[self.idx] = y
 
-        # Get steps-to-go
-        mask = torch.zeros_like(self.steps_to_go)
-        ids = torch.arange(self.n_steps, device=self.device)[:, None]
-        mask[(ids >= self.current_ep_start[None]) * (ids < self.idx)] = 1
-        # overflow
-        mask[(self.current_ep_start[None] > self.idx) * (ids < self.idx)] = 1
-        mask[(self.current_ep_start[None] > self.idx) * (ids >= self.current_ep_start[None])] = 1
-        self.steps_to_go += mask
-        self.current_ep_start = torch.where(done[:, 0] == 1, (self.idx + 1) % self.n_steps, self.current_ep_start)
+        # The running episode of every env now ends here, envs that are done start a new one
+        self.episode_end[self.env_ids, self.episode_count % self.n_steps] = self.idx
+        self.episode_count += done[:, 0].long()
 
         self.idx = (self.idx + 1) % self.n_steps
         self.full = self.full or self.idx == 0
@@ -113,20 +109,31 @@ class ValidationHERReplayBuffer(HERReplayBuffer):
         virtual_idxs, real_idxs = np.split(idxs, [n_virtual])
 
         real_data = list(l.flatten(0,1)[real_idxs] for l in data)
-        virtual_data = self.sample_virtual(data, virtual_idxs, n_envs)
+        virtual_data = self.sample_virtual(data, virtual_idxs, n_envs, env_offset=0 if not validation else self.train_envs)
         data = [torch.cat([real, virtual], dim=0) for real, virtual in zip(real_data, virtual_data)]
         for i in range(4): data[i] = data[i].to(torch.float32)
 
         return data
     
-    def sample_virtual(self, data, idxs, n_envs):
-        obs, action, reward, next_obs, done, steps_to_go = list(l.flatten(0,1)[idxs] for l in data)
+    def steps_to_go(self, idxs, episode_ids, n_envs, env_offset=0):
+        """
+        Number of transitions that follow idxs (flat indices into a (n_steps, n_envs) slice of the buffer
+        starting at env_offset) in the same episode, looked up from the episode end table.
+        """
+        steps = idxs // n_envs
+        envs = idxs % n_envs + env_offset
+        end = self.episode_end[envs, episode_ids % self.n_steps]
+        return (end - steps) % self.n_steps
+
+    def sample_virtual(self, data, idxs, n_envs, env_offset=0):
+        obs, action, reward, next_obs, done, episode_ids = list(l.flatten(0,1)[idxs] for l in data)
         n_virtual = obs.shape[0]
         n_random = int(n_virtual * self.random_ratio / self.her_ratio)
         n_future = n_virtual - n_random
 
         # Future goals
-        add_steps = randint(steps_to_go[:n_future] + 1)
+        steps_to_go = self.steps_to_go(idxs[:n_future], episode_ids[:n_future], n_envs, env_offset)
+        add_steps = randint(steps_to_go + 1)
         future_idxs = (idxs[:n_future] + add_steps * n_envs) % (self.n_steps * n_envs)
 
         # Random goals
@@ -166,8 +173,10 @@ if __name__ == "__main__":
                     torch.rand(10, 1, dtype=torch.float32), 
                     torch.rand(10, 1, dtype=torch.float32), 
                     torch.rand(10, 3, dtype=torch.float32), 
+                    torch.rand(10, 1, dtype=torch.float32),
                     (((i + 1) % 4) == 0) * torch.ones(10, 1, dtype=torch.float32))
-        print(buffer.steps_to_go[:, 0])
+        idxs = torch.arange(buffer.n_steps) * buffer.n_envs
+        print(buffer.steps_to_go(idxs, buffer.episode_ids[:, 0], buffer.n_envs))
         
     # buffer.sample(10)
 
@@ -26,44 +26,120 @@
 # OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
 # OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 
-from .mujoco import Mujoco
-from .ant import Ant
-from .anymal import Anymal
-from .anymal_terrain import AnymalTerrain
-from .ball_balance import BallBalance
-from .cartpole import Cartpole 
-from .franka_cabinet import FrankaCabinet
-from .franka_cube_stack import FrankaCubeStack
-from .franka_reaching import FrankaReaching
-from .franka_reaching2 import FrankaReaching2
-from .franka_pushing import FrankaPushing
-from .franka_pushing_cabinet import FrankaPushingCabinet
-from .humanoid import Humanoid
-from .ingenuity import Ingenuity
-from .quadcopter import Quadcopter
-from .shadow_hand import ShadowHand
-from .allegro_hand import AllegroHand
-from .trifinger import Trifinger
-
-
-# Mappings from strings to environments
-isaacgym_task_map = {
-    "Mujoco": Mujoco,
-    "AllegroHand": AllegroHand,
-    "Ant": Ant,
-    "Anymal": Anymal,
-    "AnymalTerrain": AnymalTerrain,
-    "BallBalance": BallBalance,
-    "Cartpole": Cartpole,
-    "FrankaCabinet": FrankaCabinet,
-    "FrankaCubeStack": FrankaCubeStack,
-    "FrankaReaching": FrankaReaching,
-    "FrankaReaching2": FrankaReaching2,
-    "FrankaPushing": FrankaPushing,
-    "FrankaPushingCabinet": FrankaPushingCabinet,
-    "Humanoid": Humanoid,
-    "Ingenuity": Ingenuity,
-    "Quadcopter": Quadcopter,
-    "ShadowHand": ShadowHand,
-    "Trifinger": Trifinger,
+from collections.abc import Mapping
+import importlib
+
+
+# Mappings from strings to environments. Entries are "module:Class" strings so that a task module (and isaacgym with
+# it) is only imported when the task is looked up. Out-of-tree tasks can be added with register_task() or through the
+# "isaacgymenvs.tasks" entry point group, e.g. in setup.py:
+#   entry_points={"isaacgymenvs.tasks": ["MyTask = my_package.my_task:MyTask"]}
+_builtin_tasks = {
+    "Mujoco": "isaacgymenvs.tasks.mujoco:Mujoco",
+    "Synthetic": "isaacgymenvs.tasks.synthetic:Synthetic",
+    "AllegroHand": "isaacgymenvs.tasks.allegro_hand:AllegroHand",
+    "Ant": "isaacgymenvs.tasks.ant:Ant",
+    "Anymal": "isaacgymenvs.tasks.anymal:Anymal",
+    "AnymalTerrain": "isaacgymenvs.tasks.anymal_terrain:AnymalTerrain",
+    "BallBalance": "isaacgymenvs.tasks.ball_balance:BallBalance",
+    "Cartpole": "isaacgymenvs.tasks.cartpole:Cartpole",
+    "FrankaCabinet": "isaacgymenvs.tasks.franka_cabinet:FrankaCabinet",
+    "FrankaCubeStack": "isaacgymenvs.tasks.franka_cube_stack:FrankaCubeStack",
+    "FrankaReaching": "isaacgymenvs.tasks.franka_reaching:FrankaReaching",
+    "FrankaReaching2": "isaacgymenvs.tasks.franka_reaching2:FrankaReaching2",
+    "FrankaPushing": "isaacgymenvs.tasks.franka_pushing:FrankaPushing",
+    "FrankaPushingCabinet": "isaacgymenvs.tasks.franka_pushing_cabinet:FrankaPushingCabinet",
+    "Humanoid": "isaacgymenvs.tasks.humanoid:Humanoid",
+    "Ingenuity": "isaacgymenvs.tasks.ingenuity:Ingenuity",
+    "Quadcopter": "isaacgymenvs.tasks.quadcopter:Quadcopter",
+    "ShadowHand": "isaacgymenvs.tasks.shadow_hand:ShadowHand",
+    "Trifinger": "isaacgymenvs.tasks.trifinger:Trifinger",
 }
+
+TASK_ENTRY_POINT_GROUP = "isaacgymenvs.tasks"
+
+
+def _load_spec(spec):
+    module_name, _, attr = spec.partition(":")
+    if not attr:
+        raise ValueError(f'Task spec "{spec}" should have the form "module:Class"')
+    obj = importlib.import_module(module_name)
+    for name in attr.split("."):
+        obj = getattr(obj, name)
+    return obj
+
+
+def _plugin_task_specs():
+    try:
+        from importlib.metadata import entry_points
+    except ImportError:
+        return {}
+    eps = entry_points()
+    if hasattr(eps, "select"):
+        eps = eps.select(group=TASK_ENTRY_POINT_GROUP)
+    else:
+        eps = eps.get(TASK_ENTRY_POINT_GROUP, [])
+    return {ep.name: ep.value for ep in eps}
+
+
+class LazyTaskMap(Mapping):
+    """Task name -> task class, importing each task module on its first lookup."""
+
+    def __init__(self, specs):
+        self._specs = dict(specs)
+        self._classes = {}
+        self._plugins_loaded = False
+
+    def _load_plugins(self):
+        if self._plugins_loaded:
+            return
+        self._plugins_loaded = True
+        for name, spec in _plugin_task_specs().items():
+            # tasks registered in-tree or with register_task() take precedence
+            self._specs.setdefault(name, spec)
+
+    def register(self, name, spec):
+        """spec is either a "module:Class" string or the task class itself."""
+        if isinstance(spec, str):
+            self._specs[name] = spec
+            self._classes.pop(name, None)
+        else:
+            self._specs[name] = f"{spec.__module__}:{spec.__qualname__}"
+            self._classes[name] = spec
+
+    def spec(self, name):
+        if name not in self._specs:
+            self._load_plugins()
+        return self._specs[name]
+
+    def __getitem__(self, name):
+        if name not in self._classes:
+            self._classes[name] = _load_spec(self.spec(name))
+        return self._classes[name]
+
+    def __contains__(self, name):
+        if name not in self._specs:
+            self._load_plugins()
+        return name in self._specs
+
+    def __iter__(self):
+        self._load_plugins()
+        return iter(self._specs)
+
+    def __len__(self):
+        self._load_plugins()
+        return len(self._specs)
+
+
+isaacgym_task_map = LazyTaskMap(_builtin_tasks)
+
+
+def register_task(name, spec):
+    isaacgym_task_map.register(name, spec)
+
+
+def __getattr__(name):
+    # keeps `from isaacgymenvs.tasks import FrankaPushing` working without importing every task up front
+    if name in _builtin_tasks:
+        return isaacgym_task_map[name]
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -38,6 +38,7 @@ from typing import Tuple, Dict
 
 from isaacgymenvs.utils.torch_jit_utils import to_torch, get_axis_params, torch_rand_float, normalize, quat_apply, quat_rotate_inverse
 from isaacgymenvs.tasks.base.vec_task import VecTask
+from isaacgymenvs.tasks.utils.heightfield import HeightField
 
 
 class AnymalTerrain(VecTask):
@@ -145,6 +146,11 @@ class AnymalTerrain(VecTask):
 
         self.height_points = self.init_height_points()
         self.measured_heights = None
+        self.height_field = None
+        if self.height_samples is not None:
+            self.height_field = HeightField(self.height_samples, self.terrain.horizontal_scale, self.terrain.vertical_scale,
+                                            self.terrain.border_size, self.height_points[0],
+                                            mode=self.cfg["env"]["terrain"].get("heightSampling", "min"))
         # joint positions offsets
         self.default_dof_pos = torch.zeros_like(self.dof_pos, dtype=torch.float, device=self.device, requires_grad=False)
         for i in range(self.num_actions):
@@ -512,30 +518,20 @@ class AnymalTerrain(VecTask):
         points[:, :, 1] = grid_y.flatten()
         return points
 
-    def get_heights(self, env_ids=None):
+    def get_heights(self, env_ids=None, normals=False):
+        """ heights under the height points of the envs in env_ids, or of all envs, and their normals if normals """
         if self.cfg["env"]["terrain"]["terrainType"] == 'plane':
-            return torch.zeros(self.num_envs, self.num_height_points, device=self.device, requires_grad=False)
+            num_envs = self.num_envs if env_ids is None else len(env_ids)
+            heights = torch.zeros(num_envs, self.num_height_points, device=self.device, requires_grad=False)
+            if normals:
+                terrain_normals = torch.zeros(num_envs, self.num_height_points, 3, device=self.device)
+                terrain_normals[..., 2] = 1.
+                return heights, terrain_normals
+            return heights
         elif self.cfg["env"]["terrain"]["terrainType"] == 'none':
             raise NameError("Can't measure height with terrain type 'none'")
 
-        if env_ids:
-            points = quat_apply_yaw(self.base_quat[env_ids].repeat(1, self.num_height_points), self.height_points[env_ids]) + (self.root_states[env_ids, :3]).unsqueeze(1)
-        else:
-            points = quat_apply_yaw(self.base_quat.repeat(1, self.num_height_points), self.height_points) + (self.root_states[:, :3]).unsqueeze(1)
- 
-        points += self.terrain.border_size
-        points = (points/self.terrain.horizontal_scale).long()
-        px = points[:, :, 0].view(-1)
-        py = points[:, :, 1].view(-1)
-        px = torch.clip(px, 0, self.height_samples.shape[0]-2)
-        py = torch.clip(py, 0, self.height_samples.shape[1]-2)
-
-        heights1 = self.height_samples[px, py]
-
-        heights2 = self.height_samples[px+1, py+1]
-        heights = torch.min(heights1, heights2)
-
-        return heights.view(self.num_envs, -1) * self.terrain.vertical_scale
+        return self.height_field.query(self.root_states[:, :3], self.base_quat, env_ids=env_ids, normals=normals)
 
 
 # terrain generator
@@ -36,6 +36,11 @@ from isaacgym import gymapi
 
 from isaacgymenvs.utils.torch_jit_utils import quat_mul, to_torch, tensor_clamp  
 from isaacgymenvs.tasks.base.vec_task import VecTask
+from isaacgymenvs.tasks.utils.metrics import DEFAULT_METRICS, StepMetrics
+from isaacgymenvs.tasks.utils.obs_layout import ObsLayout
+from isaacgymenvs.tasks.utils.osc import OSCController
+from isaacgymenvs.tasks.utils.placement import sample_separated_positions
+from isaacgymenvs.utils.episode_metrics import register_episode_metric
 
 
 @torch.jit.script
@@ -107,6 +112,14 @@ class FrankaPushing(VecTask):
 
         self.target_idx = [14,15,16]
         self.target_name = 'cube0_pos'
+        # name -> slice of obs_buf, fixed once the states exist
+        self.obs_spec = None
+        self.obs_layout = None
+        self.debug_obs_stats = self.cfg["env"].get("debugObsStats", False)
+        # log how much the object moved towards the goal after the first 10 steps
+        register_episode_metric("goal_dist", improvement_step=10)
+        self.metrics = StepMetrics(self.cfg["env"].get("episodicMetrics", DEFAULT_METRICS))
+        self.per_env_test_metrics = self.cfg["env"].get("perEnvTestMetrics", True)
 
         # Create dicts to pass to reward function
         self.reward_settings = {}
@@ -153,6 +166,9 @@ class FrankaPushing(VecTask):
         self._franka_effort_limits = None        # Actuator effort limits for franka
         self._global_indices = None         # Unique indices corresponding to all envs in flattened array
         self._goal_state = None
+        self._frozen_cubes = None           # Cubes pinned at their init state  (n_envs, n_cubes)
+        self._frozen_actor_ids = None       # Global indices of the pinned cubes
+        self._reset_actor_ids = None        # Global indices of the last reset_idx(), written with the frozen cubes
 
         self.debug_viz = self.cfg["env"]["enableDebugVis"]
 
@@ -171,6 +187,9 @@ class FrankaPushing(VecTask):
         self.kd = 2 * torch.sqrt(self.kp)
         self.kp_null = to_torch([10.] * 7, device=self.device)
         self.kd_null = 2 * torch.sqrt(self.kp_null)
+        self.osc = OSCController(self.kp, self.kd, self.kp_null, self.kd_null, self.franka_default_dof_pos[:7],
+                                 self._franka_effort_limits[:7], refactor_every=self.cfg["env"].get("oscRefactorEvery", 1),
+                                 backend=self.cfg["env"].get("oscBackend", "eager"))
         #self.cmd_limit = None                   # filled in later
 
         # Set control limits
@@ -182,7 +201,10 @@ class FrankaPushing(VecTask):
 
         # Refresh tensors
         self._refresh()
-                
+        self.obs_layout = ObsLayout(self._observed_states(), self.states, debug=self.debug_obs_stats)
+        self.obs_spec = self.obs_layout.spec
+        assert self.obs_layout.num_obs == self.num_obs, f'{self.obs_layout.num_obs} observations, expected {self.num_obs}'
+
 
     def create_sim(self):
         self.sim_params.up_axis = gymapi.UP_AXIS_Z
@@ -494,6 +516,8 @@ class FrankaPushing(VecTask):
         # Initialize indices
         self._global_indices = torch.arange(self.num_envs * (8 + self.n_cubes_test), dtype=torch.int32,
                                            device=self.device).view(self.num_envs, -1)
+        self._frozen_cubes = torch.zeros(self.num_envs, self.n_cubes_test, dtype=torch.bool, device=self.device)
+        self._frozen_actor_ids = torch.zeros(0, dtype=torch.int32, device=self.device)
 
     def _update_states(self):
         self.states.update({
@@ -528,8 +552,7 @@ class FrankaPushing(VecTask):
         # Refresh states
         self._update_states()
 
-    def compute_observations(self):
-        self._refresh()
+    def _observed_states(self):
         obs = ["eef_pos", "eef_quat", "goal_pos"]
         if self.observe_velocities:
             obs += ["eef_vel"]
@@ -538,9 +561,13 @@ class FrankaPushing(VecTask):
             if self.observe_velocities:
                 obs += [f"cube{j}_angvel"]
         obs += ["q_gripper"] if self.control_type == "osc" else ["q"]
-        self.obs_buf = torch.cat([self.states[ob] for ob in obs], dim=-1)
+        return obs
 
-        maxs = {ob: torch.max(self.states[ob]).item() for ob in obs}
+    def compute_observations(self):
+        self._refresh()
+        stats = self.obs_layout.fill(self.obs_buf, self.states)
+        if stats is not None:
+            self.extras["obs_stats"] = stats
 
         return self.obs_buf
     
@@ -597,8 +624,9 @@ class FrankaPushing(VecTask):
             env_ids = torch.arange(self.num_envs, device=self.device)
         env_ids_int32 = env_ids.to(dtype=torch.int32)
 
+        cube_pos = self._sample_cube_positions(env_ids)
         for j in range(self.n_cubes_test):
-            self._reset_init_cube_state(cube=j, env_ids=env_ids, check_valid=j>0)
+            self._reset_init_cube_state(cube=j, env_ids=env_ids, sampled_pos=cube_pos[:, j] if j < cube_pos.shape[1] else None)
             # Write these new init states to the sim states
             self._cube_states[j][env_ids] = self._init_cube_states[j][env_ids]
         self._reset_goal_state(env_ids=env_ids)
@@ -648,49 +676,84 @@ class FrankaPushing(VecTask):
 
         # Update cube states
         multi_env_ids_cubes_int32 = self._global_indices[env_ids, -(1 + self.n_cubes_test):].flatten()
-        self.gym.set_actor_root_state_tensor_indexed(
-            self.sim, gymtorch.unwrap_tensor(self._root_state),
-            gymtorch.unwrap_tensor(multi_env_ids_cubes_int32), len(multi_env_ids_cubes_int32))
+        if len(self._frozen_actor_ids) > 0:
+            # written together with the frozen cubes by _pin_frozen_cubes() before the next simulation step
+            self._reset_actor_ids = multi_env_ids_cubes_int32
+        else:
+            self.gym.set_actor_root_state_tensor_indexed(
+                self.sim, gymtorch.unwrap_tensor(self._root_state),
+                gymtorch.unwrap_tensor(multi_env_ids_cubes_int32), len(multi_env_ids_cubes_int32))
 
         self.progress_buf[env_ids] = 0
         self.reset_buf[env_ids] = 0
 
     def freeze_cubes(self):
-        # TODO this doesn't work with self.test_task
+        """
+        In test runs, pins every cube but the pushed one of the rigid tasks at its initial state, see _pin_frozen_cubes,
+        and draws them grey. Outside of test runs all cubes are free. Only the cubes whose state changes are recolored.
+        """
+        frozen = torch.zeros(self.num_envs, self.n_cubes_test, dtype=torch.bool)
         if self.test:
-            # Freeze
-            cube_colors = [gymapi.Vec3(0.5, 0.5, 0.5) for _ in range(len(self._cube_ids) - 1)]
-            mass_multiplier = 100
-        else:
-            # Restore
-            cube_colors = self.cube_colors[1:]
-            mass_multiplier = 1
-        
-        for t, task in enumerate(self.tasks):
-            if task.get('rigid', False):
-                for i, id in enumerate(self._cube_ids[1:]):
-                    properties = self.gym.get_actor_rigid_body_properties(self.envs[t], id)[0]
-                    if self.cube_masses[t] is None: self.cube_masses[t] = properties.mass
-                    properties.mass = self.cube_masses[t] * mass_multiplier
-                    self.gym.set_actor_rigid_body_properties(self.envs[t], id, [properties], True)
-
-                    num_bodies = self.gym.get_actor_rigid_body_count(self.envs[t], id)
-                    for n in range(num_bodies):
-                        self.gym.set_rigid_body_color(self.envs[t], id, n, gymapi.MESH_VISUAL, cube_colors[i])
+            rigid = torch.tensor([task.get('rigid', False) for task in self.tasks])
+            if self.test_task >= 0:
+                frozen[:, 1:] = rigid[self.test_task]
+            else:
+                # env t runs task t, see _reset_init_cube_state
+                n = min(len(self.tasks), self.num_envs)
+                frozen[:n, 1:] = rigid[:n, None]
+
+        grey = gymapi.Vec3(0.5, 0.5, 0.5)
+        for env, j in (frozen != self._frozen_cubes.cpu()).nonzero().tolist():
+            id = self._cube_ids[j]
+            color = grey if frozen[env, j] else self.cube_colors[j]
+            for n in range(self.gym.get_actor_rigid_body_count(self.envs[env], id)):
+                self.gym.set_rigid_body_color(self.envs[env], id, n, gymapi.MESH_VISUAL, color)
+
+        self._frozen_cubes = frozen.to(self.device)
+        self._frozen_actor_ids = self._global_indices[:, self._cube_ids][self._frozen_cubes]
+        # reset() follows with a reset_idx() of every env, which writes or defers its cubes for the new frozen set
+        self._reset_actor_ids = None
+
+    def _pin_frozen_cubes(self):
+        # Puts the frozen cubes back at their initial state, at rest. The cubes of the last reset_idx() go into the same
+        # write, so that there is a single indexed root state write before the simulation step
+        frozen = self._frozen_cubes.unsqueeze(-1)
+        for j in range(self.n_cubes_test):
+            self._cube_states[j][:] = torch.where(frozen[:, j], self._init_cube_states[j], self._cube_states[j])
+        actor_ids = self._frozen_actor_ids
+        if self._reset_actor_ids is not None:
+            actor_ids = torch.cat([actor_ids, self._reset_actor_ids])
+            self._reset_actor_ids = None
+        self.gym.set_actor_root_state_tensor_indexed(
+            self.sim, gymtorch.unwrap_tensor(self._root_state), gymtorch.unwrap_tensor(actor_ids), len(actor_ids))
 
+    def _sample_cube_positions(self, env_ids):
+        """
+        Samples collision-free positions for all cubes that are placed on the table, relative to the sampling center.
+        Envs for which no collision-free placement was found are counted in extras['cube_placement_failures'].
 
-    def _reset_init_cube_state(self, cube, env_ids, check_valid=True):
+        Returns:
+            tensor (len(env_ids), n_cubes, 3)
+        """
+        n_cubes = self.n_cubes_test if self.test else min(self.n_cubes_train, self.n_cubes_test)
+        # Minimum cube distance for guarenteed collision-free sampling is the sum of each cube's effective radius
+        # We scale the min dist by 2 so that the cubes aren't too close together
+        min_dist = 2 * max(self.cube_sizes) * np.sqrt(2) / 2.0 * 2.0
+        cube_pos, valid = sample_separated_positions(len(env_ids), n_cubes, [self.start_position_noise] * 3, min_dist,
+                                                     device=self.device)
+        self.extras["cube_placement_failures"] = (~valid).sum()
+        return cube_pos
+
+    def _reset_init_cube_state(self, cube, env_ids, sampled_pos=None):
         """
         Simple method to sample @cube's position based on self.startPositionNoise and self.startRotationNoise, and
         automaticlly reset the pose internally. Populates the appropriate self._init_cubeX_state
 
-        If @check_valid is True, then this will also make sure that the sampled position is not in contact with the
-        other cube.
-
         Args:
-            cube(str): Which cube to sample location for. Either 'A' or 'B'
+            cube(int): Which cube to sample location for
             env_ids (tensor or None): Specific environments to reset cube for
-            check_valid (bool): Whether to make sure sampled position is collision-free with the other cube.
+            sampled_pos (tensor or None): Offsets from the sampling center from _sample_cube_positions(). If None, the
+                position is sampled without checking for collisions with the other cubes.
         """
         # If env_ids is None, we reset all the envs
         if env_ids is None:
@@ -713,37 +776,8 @@ class FrankaPushing(VecTask):
         # Initialize rotation, which is no rotation (quat w = 1)
         sampled_cube_state[:, 6] = 1.0
 
-        # If we're verifying valid sampling, we need to check and re-sample if any are not collision-free
-        # We use a simple heuristic of checking based on cubes' radius to determine if a collision would occur
-        if check_valid: 
-            # Minimum cube distance for guarenteed collision-free sampling is the sum of each cube's effective radius
-            min_dists = (self.states[f"cube0_size"] + self.states[f"cube1_size"])[env_ids] * np.sqrt(2) / 2.0
-
-            # We scale the min dist by 2 so that the cubes aren't too close together
-            min_dists = min_dists * 2.0
-
-            success = False
-            previous_cube_states = torch.stack(self._init_cube_states[:cube], 0)[:, env_ids, :]
-            # Indexes corresponding to envs we're still actively sampling for
-            active_idx = torch.arange(num_resets, device=self.device)
-            num_active_idx = len(active_idx)
-            for i in range(100):
-                # Sample x y values
-                sampled_cube_state[active_idx, :3] = table_center + \
-                                                     2.0 * self.start_position_noise * (
-                                                             torch.rand_like(sampled_cube_state[active_idx, :3]) - 0.5)
-                # Check if sampled values are valid
-
-                cube_dist = torch.linalg.norm(sampled_cube_state[None, :, :3] - previous_cube_states[:, :, :3], dim=-1)
-                active_idx = torch.nonzero((cube_dist < min_dists).sum(0), as_tuple=True)[0]
-                num_active_idx = len(active_idx)
-                # If active idx is empty, then all sampling is valid :D
-                if num_active_idx == 0:
-                    success = True
-                    break
-            # Make sure we succeeded at sampling
-            # assert success, "Sampling cube locations was unsuccessful! ):"
-            
+        if sampled_pos is not None:
+            sampled_cube_state[:, :3] = table_center.unsqueeze(0) + sampled_pos
         else:
             # We just directly sample
             sampled_cube_state[:, :3] = table_center.unsqueeze(0) + \
@@ -815,8 +849,6 @@ class FrankaPushing(VecTask):
         tolerance = 0.01; 
         tasks[15] = dict(cubes=[center, [.07 + tolerance, -.11, height], [-.07 - tolerance, -.11, height], off, off, off], 
                          goal=[.0, -.11, 0], rigid=True, name='tolerance')
-        
-        self.cube_masses = [None] * n_tasks
 
 
     def _reset_goal_state(self, env_ids):
@@ -871,32 +903,8 @@ class FrankaPushing(VecTask):
 
 
     def _compute_osc_torques(self, dpose):
-        # Solve for Operational Space Control # Paper: khatib.stanford.edu/publications/pdfs/Khatib_1987_RA.pdf
-        # Helpful resource: studywolf.wordpress.com/2013/09/17/robot-control-4-operation-space-control/
-        q, qd = self._q[:, :7], self._qd[:, :7]
-        mm_inv = torch.inverse(self._mm)
-        m_eef_inv = self._j_eef @ mm_inv @ torch.transpose(self._j_eef, 1, 2)
-        m_eef = torch.inverse(m_eef_inv)
-
-        # Transform our cartesian action `dpose` into joint torques `u`
-        u = torch.transpose(self._j_eef, 1, 2) @ m_eef @ (
-                self.kp * dpose - self.kd * self.states["eef_vel"]).unsqueeze(-1)
-
-        # Nullspace control torques `u_null` prevents large changes in joint configuration
-        # They are added into the nullspace of OSC so that the end effector orientation remains constant
-        # roboticsproceedings.org/rss07/p31.pdf
-        j_eef_inv = m_eef @ self._j_eef @ mm_inv
-        u_null = self.kd_null * -qd + self.kp_null * (
-                (self.franka_default_dof_pos[:7] - q + np.pi) % (2 * np.pi) - np.pi)
-        u_null[:, 7:] *= 0
-        u_null = self._mm @ u_null.unsqueeze(-1)
-        u += (torch.eye(7, device=self.device).unsqueeze(0) - torch.transpose(self._j_eef, 1, 2) @ j_eef_inv) @ u_null
-
-        # Clip the values to be within valid effort range
-        u = tensor_clamp(u.squeeze(-1),
-                         -self._franka_effort_limits[:7].unsqueeze(0), self._franka_effort_limits[:7].unsqueeze(0))
-
-        return u
+        # Solve for Operational Space Control, see OSCController
+        return self.osc(self._mm, self._j_eef, dpose, self.states["eef_vel"], self._q[:, :7], self._qd[:, :7])
 
     def pre_physics_step(self, actions):
         self.actions = actions.clone().to(self.device)
@@ -914,14 +922,15 @@ class FrankaPushing(VecTask):
         self._arm_control[:, :] = u_arm
 
         # Control gripper
-        u_fingers = torch.zeros_like(self._gripper_control)
-        u_fingers[:, 0] = torch.where(u_gripper >= 0.0, self.franka_dof_upper_limits[-2].item(),
-                                      self.franka_dof_lower_limits[-2].item())
-        u_fingers[:, 1] = torch.where(u_gripper >= 0.0, self.franka_dof_upper_limits[-1].item(),
-                                      self.franka_dof_lower_limits[-1].item())
+        u_fingers = torch.where(u_gripper.unsqueeze(-1) >= 0.0, self.franka_dof_upper_limits[-2:],
+                                self.franka_dof_lower_limits[-2:])
         # Write gripper command to appropriate tensor buffer
         self._gripper_control[:, :] = u_fingers
 
+        # Hold the frozen cubes of the rigid test tasks in place
+        if len(self._frozen_actor_ids) > 0:
+            self._pin_frozen_cubes()
+
         # Deploy actions
         self.gym.set_dof_position_target_tensor(self.sim, gymtorch.unwrap_tensor(self._pos_control))
         self.gym.set_dof_actuation_force_tensor(self.sim, gymtorch.unwrap_tensor(self._effort_control))
@@ -935,6 +944,7 @@ class FrankaPushing(VecTask):
         # Produce observation
         self.compute_observations()
         self.rew_buf[:] = self.compute_franka_reward(self.states)
+        self.metrics.start_step(self.states, self.target_name)
 
         # Extra logging
         if 'images' in self.extras:
@@ -947,24 +957,16 @@ class FrankaPushing(VecTask):
 
             # Add success marker
             marker_size = self.im_size // 32
-            success = (torch.norm(self.states["goal_pos"] - self.states[self.target_name], dim=-1) < 0.02)[:self.max_pix]
+            success = (self.metrics.distance("goal_dist") < 0.02)[:self.max_pix]
             self.extras["images"][:,:,:marker_size,:marker_size] = torch.tensor([0., 0., 0.], device=self.device)[None, :, None,None]
             self.extras["images"][success,:,:marker_size,:marker_size] = torch.tensor([0., 0.75, 0.], device=self.device)[None, :, None,None]
             # import imageio
             # imageio.imwrite("render.png", (self.extras["images"].cpu().numpy().transpose(0, 2, 3, 1).reshape(4, 4, self.im_size, self.im_size, 3).transpose(0, 2, 1, 3, 4).reshape(4*self.im_size, 4*self.im_size, 3) * 255).astype(np.uint8))
 
-        metrics = dict()
-        metrics["goal_dist"] = torch.norm(self.states["goal_pos"] - self.states[self.target_name], dim=-1)
-        metrics["success_4"] = torch.norm(self.states["goal_pos"] - self.states[self.target_name], dim=-1) < 0.04
-        metrics["success_2"] = torch.norm(self.states["goal_pos"] - self.states[self.target_name], dim=-1) < 0.02
-        metrics["failure_2"] = torch.norm(self.states["goal_pos"] - self.states[self.target_name], dim=-1) > 0.02
-        if self.test:
-            for i in range(min(self.max_pix, self.states['goal_pos'].shape[0])):
-                metrics[f"goal_dist_{i}"] = torch.norm(self.states["goal_pos"] - self.states[self.target_name], dim=-1)[i]
-                metrics[f"success_4_{i}"] = torch.norm(self.states["goal_pos"] - self.states[self.target_name], dim=-1)[i] < 0.04
-                metrics[f"success_2_{i}"] = torch.norm(self.states["goal_pos"] - self.states[self.target_name], dim=-1)[i] < 0.02
-                metrics[f"failure_2_{i}"] = torch.norm(self.states["goal_pos"] - self.states[self.target_name], dim=-1)[i] > 0.02
-        self.extras["episodic"] = metrics
+        num_per_env = min(self.max_pix, self.num_envs) if self.test and self.per_env_test_metrics else 0
+        metrics = self.metrics.compute(num_per_env)
+        if metrics:
+            self.extras["episodic"] = metrics
         # self.extras["episode_cumulative"]["cubeA_vel"] = torch.norm(self.states["cubeA_vel"], dim=-1)
         # self.extras["episode_cumulative"]["cubeA_vel"] = torch.norm(self.states["cubeA_vel"], dim=-1)
         # self.extras["episode_cumulative"]["cubeB_vel"] = torch.norm(self.states["cubeB_vel"], dim=-1)
@@ -36,6 +36,8 @@ from isaacgym import gymapi
 
 from isaacgymenvs.utils.torch_jit_utils import quat_mul, to_torch, tensor_clamp  
 from isaacgymenvs.tasks.base.vec_task import VecTask
+from isaacgymenvs.tasks.utils.obs_layout import ObsLayout
+from isaacgymenvs.tasks.utils.osc import OSCController
 
 
 @torch.jit.script
@@ -158,6 +160,9 @@ class FrankaPushingCabinet(VecTask):
         self.kd = 2 * torch.sqrt(self.kp)
         self.kp_null = to_torch([10.] * 7, device=self.device)
         self.kd_null = 2 * torch.sqrt(self.kp_null)
+        self.osc = OSCController(self.kp, self.kd, self.kp_null, self.kd_null, self.franka_default_dof_pos[:7],
+                                 self._franka_effort_limits[:7], refactor_every=self.cfg["env"].get("oscRefactorEvery", 1),
+                                 backend=self.cfg["env"].get("oscBackend", "eager"))
         #self.cmd_limit = None                   # filled in later
 
         # Set control limits
@@ -169,6 +174,9 @@ class FrankaPushingCabinet(VecTask):
 
         # Refresh tensors
         self._refresh()
+        self.obs_layout = ObsLayout(self._observed_states(), self.states,
+                                    debug=self.cfg["env"].get("debugObsStats", False))
+        assert self.obs_layout.num_obs == self.num_obs, f'{self.obs_layout.num_obs} observations, expected {self.num_obs}'
 
     def create_sim(self):
         self.sim_params.up_axis = gymapi.UP_AXIS_Z
@@ -530,15 +538,18 @@ class FrankaPushingCabinet(VecTask):
             self.reset_buf, self.progress_buf, self.actions, self.states, self.reward_settings, self.max_episode_length
         )
 
-    def compute_observations(self):
-        self._refresh()
+    def _observed_states(self):
         obs = ["eef_pos", "eef_quat", "goal_pos"]
         for j in range(self.n_cubes):
             obs = obs + [f"cube{j}_quat", f"cube{j}_pos", f"cube{j}_vel"]
         obs += ["q_gripper"] if self.control_type == "osc" else ["q"]
-        self.obs_buf = torch.cat([self.states[ob] for ob in obs], dim=-1)
+        return obs
 
-        maxs = {ob: torch.max(self.states[ob]).item() for ob in obs}
+    def compute_observations(self):
+        self._refresh()
+        stats = self.obs_layout.fill(self.obs_buf, self.states)
+        if stats is not None:
+            self.extras["obs_stats"] = stats
 
         return self.obs_buf
 
@@ -734,32 +745,8 @@ class FrankaPushingCabinet(VecTask):
 
 
     def _compute_osc_torques(self, dpose):
-        # Solve for Operational Space Control # Paper: khatib.stanford.edu/publications/pdfs/Khatib_1987_RA.pdf
-        # Helpful resource: studywolf.wordpress.com/2013/09/17/robot-control-4-operation-space-control/
-        q, qd = self._q[:, :7], self._qd[:, :7]
-        mm_inv = torch.inverse(self._mm)
-        m_eef_inv = self._j_eef @ mm_inv @ torch.transpose(self._j_eef, 1, 2)
-        m_eef = torch.inverse(m_eef_inv)
-
-        # Transform our cartesian action `dpose` into joint torques `u`
-        u = torch.transpose(self._j_eef, 1, 2) @ m_eef @ (
-                self.kp * dpose - self.kd * self.states["eef_vel"]).unsqueeze(-1)
-
-        # Nullspace control torques `u_null` prevents large changes in joint configuration
-        # They are added into the nullspace of OSC so that the end effector orientation remains constant
-        # roboticsproceedings.org/rss07/p31.pdf
-        j_eef_inv = m_eef @ self._j_eef @ mm_inv
-        u_null = self.kd_null * -qd + self.kp_null * (
-                (self.franka_default_dof_pos[:7] - q + np.pi) % (2 * np.pi) - np.pi)
-        u_null[:, 7:] *= 0
-        u_null = self._mm @ u_null.unsqueeze(-1)
-        u += (torch.eye(7, device=self.device).unsqueeze(0) - torch.transpose(self._j_eef, 1, 2) @ j_eef_inv) @ u_null
-
-        # Clip the values to be within valid effort range
-        u = tensor_clamp(u.squeeze(-1),
-                         -self._franka_effort_limits[:7].unsqueeze(0), self._franka_effort_limits[:7].unsqueeze(0))
-
-        return u
+        # Solve for Operational Space Control, see OSCController
+        return self.osc(self._mm, self._j_eef, dpose, self.states["eef_vel"], self._q[:, :7], self._qd[:, :7])
 
     def pre_physics_step(self, actions):
         self.actions = actions.clone().to(self.device)
@@ -777,11 +764,8 @@ class FrankaPushingCabinet(VecTask):
         self._arm_control[:, :] = u_arm
 
         # Control gripper
-        u_fingers = torch.zeros_like(self._gripper_control)
-        u_fingers[:, 0] = torch.where(u_gripper >= 0.0, self.franka_dof_upper_limits[-2].item(),
-                                      self.franka_dof_lower_limits[-2].item())
-        u_fingers[:, 1] = torch.where(u_gripper >= 0.0, self.franka_dof_upper_limits[-1].item(),
-                                      self.franka_dof_lower_limits[-1].item())
+        u_fingers = torch.where(u_gripper.unsqueeze(-1) >= 0.0, self.franka_dof_upper_limits[-2:],
+                                self.franka_dof_lower_limits[-2:])
         # Write gripper command to appropriate tensor buffer
         self._gripper_control[:, :] = u_fingers
 
@@ -26,31 +26,210 @@
 # OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
 # OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 
+import multiprocessing as mp
+
 import numpy as np
+import torch
+
+
+class _EnvGroup:
+    """
+    A contiguous slice of the gymnasium envs, stepped sequentially. Reads actions from and writes results to the
+    shared buffers, envs that finish an episode are restarted right away.
+    """
+
+    def __init__(self, env_name, env_ids, seed, buffers):
+        import gymnasium
+        self.env_ids = env_ids
+        self.seed = seed
+        self.envs = [gymnasium.make(env_name) for _ in env_ids]
+        self.obs, self.reset_obs, self.actions, self.rewards, self.terminated, self.truncated = buffers
+        self.seeded = False
+
+    def step(self):
+        for env, i in zip(self.envs, self.env_ids):
+            obs, r, terminated, truncated, _ = env.step(self.actions[i])
+            self.obs[i] = obs
+            self.rewards[i] = r
+            self.terminated[i] = terminated
+            self.truncated[i] = truncated
+            if terminated or truncated:
+                obs = env.reset()[0]
+            self.reset_obs[i] = obs
+
+    def reset(self, env_ids):
+        for env, i in zip(self.envs, self.env_ids):
+            if env_ids is not None and i not in env_ids:
+                continue
+            # every env gets its own seed on the first reset, later resets continue from the env's rng
+            obs = env.reset(seed=None if self.seeded else self.seed + int(i))[0]
+            self.obs[i] = obs
+            self.reset_obs[i] = obs
+            self.terminated[i] = False
+            self.truncated[i] = False
+        self.seeded = True
+
+    def close(self):
+        for env in self.envs:
+            env.close()
+
+
+def _as_arrays(shared, num_envs, num_obs, num_actions):
+    obs, reset_obs, actions, rewards, terminated, truncated = shared
+    return (np.frombuffer(obs, dtype=np.float32).reshape(num_envs, num_obs),
+            np.frombuffer(reset_obs, dtype=np.float32).reshape(num_envs, num_obs),
+            np.frombuffer(actions, dtype=np.float32).reshape(num_envs, num_actions),
+            np.frombuffer(rewards, dtype=np.float32),
+            np.frombuffer(terminated, dtype=np.bool_),
+            np.frombuffer(truncated, dtype=np.bool_))
+
+
+def _worker(remote, parent_remote, env_name, env_ids, seed, shared, num_envs, num_obs, num_actions):
+    parent_remote.close()
+    group = _EnvGroup(env_name, env_ids, seed, _as_arrays(shared, num_envs, num_obs, num_actions))
+    try:
+        while True:
+            cmd, data = remote.recv()
+            if cmd == 'step':
+                group.step()
+            elif cmd == 'reset':
+                group.reset(data)
+            elif cmd == 'close':
+                break
+            remote.send(None)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        group.close()
+        remote.close()
 
 
 class Mujoco:
+    """
+    Batched gymnasium Mujoco envs behind the VecTask interface.
+
+    The envs are split between env.numWorkers processes (0 steps them in the main process). Observations, actions,
+    rewards and dones live in shared memory, so a step only sends one message per worker.
+    As in VecTask, step() returns the terminal observation of finished episodes while the env has already been
+    reset underneath; reset() then hands out the observation each env is currently at.
+    """
 
     def __init__(self, cfg, rl_device, sim_device, graphics_device_id, headless, virtual_screen_capture, force_render):
+        import gymnasium
         self.cfg = cfg
+        self.rl_device = rl_device
         self.max_episode_length = 1000
         # self.max_episode_length = 50 # Reacher
-        import gymnasium
-        self.env = gymnasium.make(cfg['task_name'])
-        # self.env = gymnasium.make('Humanoid-v2')
-        self.action_space = self.env.action_space
-        self.observation_space = self.env.observation_space
+        self.num_envs = cfg['env']['numEnvs']
+        self.num_workers = min(cfg['env'].get('numWorkers', 0), self.num_envs)
+        # seeded from numpy so that train.py's set_seed makes the envs reproducible
+        self.seed = cfg['env'].get('seed', int(np.random.randint(2 ** 31 - self.num_envs)))
+
+        env = gymnasium.make(cfg['task_name'])
+        self.action_space = env.action_space
+        self.observation_space = env.observation_space
+        env.close()
+        self.num_obs = int(np.prod(self.observation_space.shape))
+        self.num_actions = int(np.prod(self.action_space.shape))
         self.num_states = 0
         self.render_every_episodes = 10000000
+        self.test = False
+        self.override_render = False
+
+        ctx = mp.get_context(cfg['env'].get('mpContext', 'spawn'))
+        self._shared = (ctx.RawArray('f', self.num_envs * self.num_obs),
+                        ctx.RawArray('f', self.num_envs * self.num_obs),
+                        ctx.RawArray('f', self.num_envs * self.num_actions),
+                        ctx.RawArray('f', self.num_envs),
+                        ctx.RawArray('b', self.num_envs),
+                        ctx.RawArray('b', self.num_envs))
+        self._obs, self._reset_obs, self._actions, self._rewards, self._terminated, self._truncated = \
+            _as_arrays(self._shared, self.num_envs, self.num_obs, self.num_actions)
+
+        self._local = None
+        self._remotes = []
+        self._processes = []
+        if self.num_workers == 0:
+            self._local = _EnvGroup(cfg['task_name'], np.arange(self.num_envs), self.seed,
+                                    (self._obs, self._reset_obs, self._actions, self._rewards, self._terminated, self._truncated))
+        else:
+            for env_ids in np.array_split(np.arange(self.num_envs), self.num_workers):
+                remote, worker_remote = ctx.Pipe()
+                process = ctx.Process(target=_worker, daemon=True,
+                                      args=(worker_remote, remote, cfg['task_name'], env_ids, self.seed, self._shared,
+                                            self.num_envs, self.num_obs, self.num_actions))
+                process.start()
+                worker_remote.close()
+                self._remotes.append(remote)
+                self._processes.append(process)
+
+        self.timeout_buf = torch.zeros(self.num_envs, dtype=torch.bool, device=rl_device)
+        self.extras = {}
+        self.obs_dict = {}
+        self._reset_test = None
+
+    def _call(self, cmd, data=None):
+        if self._local is not None:
+            if cmd == 'step':
+                self._local.step()
+            else:
+                self._local.reset(data)
+            return
+        for remote in self._remotes:
+            remote.send((cmd, data))
+        for remote in self._remotes:
+            remote.recv()
+
+    def _to_tensor(self, array):
+        # always copies, the shared buffers are overwritten on the next step
+        return torch.tensor(array, device=self.rl_device)
+
+    def reset_idx(self, env_ids=None):
+        if env_ids is not None:
+            env_ids = set(int(i) for i in env_ids)
+        self._call('reset', env_ids)
+        self.obs_dict['obs'] = self._to_tensor(self._obs)
+        return self.obs_dict
 
     def reset(self):
-        return self.env.reset()[0][None]
-    
-    def reset_idx(self):
-        return self.reset()
+        # envs restart on their own, a hard reset is only done initially and when switching between train and test
+        if self._reset_test != self.test:
+            self._reset_test = self.test
+            return self.reset_idx()
+        self.obs_dict['obs'] = self._to_tensor(self._reset_obs)
+        return self.obs_dict
 
     def step(self, actions):
-        obs, r, terminated, truncated, info = self.env.step(actions[0])
-        if truncated or terminated:
-            self.reset()
-        return obs[None], r[None], np.array(terminated)[None], np.array(truncated)[None], {}
\ No newline at end of file
+        if isinstance(actions, torch.Tensor):
+            actions = actions.detach().cpu().numpy()
+        self._actions[:] = actions.reshape(self.num_envs, self.num_actions)
+        self._call('step')
+
+        self.obs_dict['obs'] = self._to_tensor(self._obs)
+        rew_buf = self._to_tensor(self._rewards)
+        terminated = self._to_tensor(self._terminated)
+        truncated = self._to_tensor(self._truncated)
+
+        # time-outs are reported one step late, same as in VecTask
+        self.extras['time_outs'] = self.timeout_buf
+        self.timeout_buf = truncated
+        return self.obs_dict, rew_buf, terminated, truncated, self.extras
+
+    def close(self):
+        if getattr(self, '_local', None) is not None:
+            self._local.close()
+            self._local = None
+        for remote in getattr(self, '_remotes', []):
+            try:
+                remote.send(('close', None))
+            except (BrokenPipeError, EOFError):
+                pass
+        for process in getattr(self, '_processes', []):
+            process.join(timeout=5)
+            if process.is_alive():
+                process.terminate()
+        self._remotes = []
+        self._processes = []
+
+    def __del__(self):
+        self.close()
@@ -0,0 +1,181 @@
+from typing import Any, Dict, Tuple
+
+import numpy as np
+import torch
+from gym import spaces
+
+from isaacgymenvs.utils.episode_metrics import register_episode_metric
+
+
+class Synthetic:
+    """
+    Pure torch stand-in for a VecTask, to profile the agents on machines without isaacgym.
+
+    The "physics" is env.stepCost random linear maps of the state followed by tanh, the observation is the state.
+    The layout follows FrankaPushing where the agents depend on it: the goal is at obs[7:10], the pushed object at
+    obs[14:17] (see obs_spec and target_idx) and the reward is the FrankaPushing distance reward between the two.
+    As in VecTask, step() returns the last observation of finished episodes while they are already reset underneath,
+    and the time-outs in extras are the dones of the previous step.
+
+    env.resetPattern decides when episodes end:
+        synchronized: every episode lasts episodeLength steps and all envs reset at the same step
+        staggered: same length, but the envs start at random points of their first episode
+        random: staggered, and every step additionally terminates with probability terminationProb
+    """
+
+    def __init__(self, cfg, rl_device, sim_device, graphics_device_id, headless, virtual_screen_capture: bool = False, force_render: bool = False):
+        self.cfg = cfg
+        self.device = rl_device
+        self.rl_device = rl_device
+
+        self.num_envs = cfg["env"]["numEnvs"]
+        self.num_obs = cfg["env"].get("numObservations", 32)
+        self.num_actions = cfg["env"].get("numActions", 8)
+        self.num_states = 0
+        self.max_episode_length = cfg["env"].get("episodeLength", 100)
+        self.reset_pattern = cfg["env"].get("resetPattern", "staggered")
+        self.termination_prob = cfg["env"].get("terminationProb", 0.01)
+        self.step_cost = cfg["env"].get("stepCost", 1)
+        self.num_amp_obs = cfg["env"].get("numAMPObs", 0)
+        self.clip_obs = cfg["env"].get("clipObservations", np.Inf)
+        self.clip_actions = cfg["env"].get("clipActions", 1.0)
+        assert self.reset_pattern in ["synchronized", "staggered", "random"], f"Unknown reset pattern {self.reset_pattern}"
+        assert self.num_obs >= 17, "numObservations has to fit the goal at 7:10 and the target at 14:17"
+
+        self.target_idx = [14, 15, 16]
+        self.target_name = "cube0_pos"
+        self.obs_spec = {"goal_pos": slice(7, 10), "cube0_pos": slice(14, 17)}
+        register_episode_metric("goal_dist", improvement_step=10)
+        self.dist_reward_scale = cfg["env"].get("distRewardScale", 1.0)
+        self.dist_reward_dropoff = cfg["env"].get("distRewardDropoff", 30.0)
+
+        self.obs_space = spaces.Box(np.ones(self.num_obs) * -np.Inf, np.ones(self.num_obs) * np.Inf)
+        self.act_space = spaces.Box(np.ones(self.num_actions) * -1., np.ones(self.num_actions) * 1.)
+        if self.num_amp_obs > 0:
+            # only defined for AMP, RLGPUEnv passes it on to the agent if it exists
+            self.amp_observation_space = spaces.Box(np.ones(self.num_amp_obs) * -np.Inf, np.ones(self.num_amp_obs) * np.Inf)
+
+        # attributes the agents read from VecTask
+        self.max_pix = 16
+        self.render_every_episodes = cfg["env"].get("renderEveryEpisodes", 1000000)
+        self.test = False
+        self.override_render = False
+        self.viewer = None
+        self.control_steps = 0
+
+        self.state_maps = torch.randn(self.step_cost, self.num_obs, self.num_obs, device=self.device) / np.sqrt(self.num_obs)
+        self.action_map = torch.randn(self.num_actions, self.num_obs, device=self.device) / np.sqrt(self.num_actions)
+
+        self.obs_buf = torch.zeros((self.num_envs, self.num_obs), device=self.device, dtype=torch.float)
+        self.rew_buf = torch.zeros(self.num_envs, device=self.device, dtype=torch.float)
+        self.reset_buf = torch.zeros(self.num_envs, device=self.device, dtype=torch.long)
+        self.timeout_buf = torch.zeros(self.num_envs, device=self.device, dtype=torch.long)
+        self.progress_buf = torch.zeros(self.num_envs, device=self.device, dtype=torch.long)
+        self.goal_pos = torch.zeros((self.num_envs, 3), device=self.device, dtype=torch.float)
+        self.done = self.reset_buf.clone()
+        self.extras = {}
+        self.obs_dict = {}
+
+        self.reset_idx()
+        if self.reset_pattern != "synchronized":
+            self.progress_buf[:] = torch.randint(0, self.max_episode_length, (self.num_envs,), device=self.device)
+
+    @property
+    def observation_space(self):
+        return self.obs_space
+
+    @property
+    def action_space(self):
+        return self.act_space
+
+    def compute_franka_reward(self, states):
+        d = torch.norm(states["goal_pos"] - states["cube0_pos"], dim=-1)
+        return self.dist_reward_scale * (1 - torch.tanh(self.dist_reward_dropoff * d))
+
+    def _sample_states(self, n):
+        obs = torch.rand((n, self.num_obs), device=self.device) - 0.5
+        goal_pos = torch.rand((n, 3), device=self.device) - 0.5
+        obs[:, self.obs_spec["goal_pos"]] = goal_pos
+        return obs, goal_pos
+
+    def reset_idx(self, env_ids=None):
+        if env_ids is None:
+            env_ids = torch.arange(self.num_envs, device=self.device)
+        self.obs_buf[env_ids], self.goal_pos[env_ids] = self._sample_states(len(env_ids))
+        self.progress_buf[env_ids] = 0
+        self.reset_buf[env_ids] = 0
+
+    def _reset_done(self):
+        # same as reset_idx(reset_buf.nonzero()) without waiting for the number of resets on the host
+        done = self.reset_buf.bool()
+        obs, goal_pos = self._sample_states(self.num_envs)
+        self.obs_buf[:] = torch.where(done[:, None], obs, self.obs_buf)
+        self.goal_pos[:] = torch.where(done[:, None], goal_pos, self.goal_pos)
+        self.progress_buf.masked_fill_(done, 0)
+        self.reset_buf.zero_()
+
+    def fetch_amp_obs_demo(self, num_samples):
+        return torch.tanh(torch.randn((num_samples, self.num_amp_obs), device=self.device))
+
+    def _amp_obs(self):
+        repeats = -(-self.num_amp_obs // self.num_obs)
+        return self.obs_buf.repeat(1, repeats)[:, :self.num_amp_obs]
+
+    def step(self, actions: torch.Tensor) -> Tuple[Dict[str, torch.Tensor], torch.Tensor, torch.Tensor, torch.Tensor, Dict[str, Any]]:
+        actions = torch.as_tensor(actions, device=self.device).clamp(-self.clip_actions, self.clip_actions)
+        self.extras["info"] = {"action_magnitude": actions.abs().mean()}
+
+        action_effect = actions @ self.action_map
+        state = self.obs_buf
+        for state_map in self.state_maps:
+            state = torch.tanh(state @ state_map + action_effect)
+        self.obs_buf[:] = state
+        self.obs_buf[:, self.obs_spec["goal_pos"]] = self.goal_pos
+
+        self.progress_buf += 1
+        self.rew_buf[:] = self.compute_franka_reward({"goal_pos": self.goal_pos, "cube0_pos": self.obs_buf[:, self.target_idx]})
+        truncated = (self.progress_buf >= self.max_episode_length).long()
+        if self.reset_pattern == "random":
+            terminated = (torch.rand(self.num_envs, device=self.device) < self.termination_prob).long()
+        else:
+            terminated = torch.zeros_like(truncated)
+        self.reset_buf[:] = terminated | truncated
+        self.done = self.reset_buf.clone()
+        self.control_steps += 1
+
+        self.extras["episodic"] = {"goal_dist": torch.norm(self.goal_pos - self.obs_buf[:, self.target_idx], dim=-1)}
+        if self.num_amp_obs > 0:
+            self.extras["amp_obs"] = self._amp_obs()
+            self.extras["terminate"] = terminated
+
+        # The timeout buffers are returned for the previous step
+        self.extras["time_outs"] = self.timeout_buf.to(self.rl_device).clone()
+        self.timeout_buf = self.done
+
+        self.obs_dict["obs"] = torch.clamp(self.obs_buf, -self.clip_obs, self.clip_obs).to(self.rl_device)
+        self._reset_done()
+        return self.obs_dict, self.rew_buf.to(self.rl_device), terminated.to(self.rl_device), truncated.to(self.rl_device), self.extras
+
+    def zero_actions(self) -> torch.Tensor:
+        return torch.zeros([self.num_envs, self.num_actions], dtype=torch.float32, device=self.rl_device)
+
+    def reset(self):
+        self.obs_dict["obs"] = torch.clamp(self.obs_buf, -self.clip_obs, self.clip_obs).to(self.rl_device)
+        return self.obs_dict
+
+    def reset_done(self):
+        # finished envs are already reset in step()
+        self.obs_dict["obs"] = torch.clamp(self.obs_buf, -self.clip_obs, self.clip_obs).to(self.rl_device)
+        return self.obs_dict, torch.zeros(0, dtype=torch.long, device=self.device)
+
+    def render(self, mode="rgb_array"):
+        return None
+
+    def set_train_info(self, env_frames, *args, **kwargs):
+        self.total_train_env_frames = env_frames
+
+    def get_env_state(self):
+        return None
+
+    def set_env_state(self, env_state):
+        pass
@@ -0,0 +1,98 @@
+from typing import Tuple
+
+import torch
+
+SAMPLING_MODES = ("min", "nearest", "bilinear")
+
+
+@torch.jit.script
+def grid_coordinates(pattern, base_pos, base_quat, border_size: float,
+                     horizontal_scale: float) -> Tuple[torch.Tensor, torch.Tensor]:
+    """ the pattern turned with the yaw of each base and moved to it, in continuous height map cells (n, num_points) """
+    # cos and sin of the yaw, the rotation quat_apply_yaw does with the normalized (0, 0, z, w)
+    z = base_quat[:, 2:3]
+    w = base_quat[:, 3:4]
+    norm = (z * z + w * w).clamp(min=1e-12)
+    c = (w * w - z * z) / norm
+    s = 2 * w * z / norm
+    x = (c * pattern[:, 0] - s * pattern[:, 1] + base_pos[:, 0:1] + border_size) / horizontal_scale
+    y = (s * pattern[:, 0] + c * pattern[:, 1] + base_pos[:, 1:2] + border_size) / horizontal_scale
+    return x, y
+
+
+@torch.jit.script
+def sample_cells(samples, num_cols: int, corner_offsets, x, y, mode: str, horizontal_scale: float,
+                 with_normals: bool) -> Tuple[torch.Tensor, torch.Tensor]:
+    """
+    heights at the continuous cell coordinates x, y from one gather of the four corners of their cells, and the normals
+    of the bilinear surface if with_normals, otherwise an empty tensor
+    """
+    num_rows = samples.shape[0] // num_cols
+    i = x.floor().clamp(0, num_rows - 2)
+    j = y.floor().clamp(0, num_cols - 2)
+    fx = (x - i).clamp(0, 1)
+    fy = (y - j).clamp(0, 1)
+    # h00, h01, h10, h11
+    corners = samples[(i.long() * num_cols + j.long()).unsqueeze(-1) + corner_offsets]
+    h00 = corners[..., 0]
+    h01 = corners[..., 1]
+    h10 = corners[..., 2]
+    h11 = corners[..., 3]
+    if mode == "min":
+        heights = torch.min(h00, h11)
+    elif mode == "nearest":
+        heights = torch.where(fx < 0.5, torch.where(fy < 0.5, h00, h01), torch.where(fy < 0.5, h10, h11))
+    else:
+        heights = (1 - fx) * ((1 - fy) * h00 + fy * h01) + fx * ((1 - fy) * h10 + fy * h11)
+    normals = torch.empty(0, device=samples.device)
+    if with_normals:
+        dx = ((1 - fy) * (h10 - h00) + fy * (h11 - h01)) / horizontal_scale
+        dy = ((1 - fx) * (h01 - h00) + fx * (h11 - h10)) / horizontal_scale
+        normals = torch.stack([-dx, -dy, torch.ones_like(dx)], -1)
+        normals = normals / normals.norm(dim=-1, keepdim=True)
+    return heights, normals
+
+
+class HeightField:
+    """
+    Heights of a terrain height map at a pattern of points around each robot, turned with the robot's yaw.
+
+    The samples are kept on the device as one flat float tensor in meters. A query turns and moves the pattern and
+    gathers the four corners of every cell at once. mode 'min' is the lower of the two diagonal corners, as
+    AnymalTerrain measured the heights before. 'nearest' is the closest corner, 'bilinear' interpolates the cell.
+    Normals are those of the bilinear surface in every mode. Points off the map take the height of its edge.
+    """
+
+    def __init__(self, height_samples, horizontal_scale, vertical_scale, border_size, pattern, mode="min"):
+        assert mode in SAMPLING_MODES, f"Unknown height sampling {mode}, options are {SAMPLING_MODES}"
+        self.num_rows, self.num_cols = height_samples.shape
+        self.samples = (height_samples.float() * vertical_scale).flatten()
+        self.horizontal_scale = float(horizontal_scale)
+        self.border_size = float(border_size)
+        self.pattern = pattern[..., :2].reshape(-1, 2).to(self.samples.device)
+        self.mode = mode
+        self.corner_offsets = torch.tensor([0, 1, self.num_cols, self.num_cols + 1], device=self.samples.device)
+
+    @property
+    def num_points(self):
+        return self.pattern.shape[0]
+
+    def points(self, base_pos, base_quat):
+        """ world x, y of the pattern for every base (n, num_points, 2) """
+        x, y = grid_coordinates(self.pattern, base_pos, base_quat, self.border_size, self.horizontal_scale)
+        return torch.stack([x, y], -1) * self.horizontal_scale - self.border_size
+
+    def query(self, base_pos, base_quat, env_ids=None, normals=False):
+        """
+        Heights (n, num_points) under the pattern of the bases, and with normals True also the terrain normals
+        (n, num_points, 3). env_ids selects a subset of the bases, n is then len(env_ids).
+        """
+        if env_ids is not None:
+            base_pos = base_pos[env_ids]
+            base_quat = base_quat[env_ids]
+        x, y = grid_coordinates(self.pattern, base_pos, base_quat, self.border_size, self.horizontal_scale)
+        heights, terrain_normals = sample_cells(self.samples, self.num_cols, self.corner_offsets, x, y, self.mode,
+                                                self.horizontal_scale, normals)
+        if normals:
+            return heights, terrain_normals
+        return heights
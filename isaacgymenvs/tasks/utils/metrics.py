@@ -0,0 +1,60 @@
+import torch
+
+from isaacgymenvs.utils.episode_metrics import per_env_key
+
+# distance -> the state whose distance to the target object it is
+METRIC_DISTANCES = {
+    "goal_dist": "goal_pos",
+    "eef_dist": "eef_pos",
+}
+
+# metric -> (distance it is derived from, function of the distance)
+EPISODIC_METRICS = {
+    "goal_dist": ("goal_dist", lambda d: d),
+    "success_4": ("goal_dist", lambda d: d < 0.04),
+    "success_2": ("goal_dist", lambda d: d < 0.02),
+    "failure_2": ("goal_dist", lambda d: d > 0.02),
+    "eef_dist": ("eef_dist", lambda d: d),
+}
+
+DEFAULT_METRICS = ["goal_dist", "success_4", "success_2", "failure_2"]
+
+
+class StepMetrics:
+    """
+    Per step metrics of a task that moves a target object to a goal, reported in extras['episodic'].
+
+    Every metric is derived from a distance to the target object. Each distance is computed at most once per step,
+    after start_step(), and shared between the metrics and the task, e.g. for the success marker of rendered frames.
+    names selects the metrics. compute() with num_per_env > 0 also reports the metrics of the first num_per_env envs,
+    the rendered ones in test runs, as one (num_per_env,) tensor per metric under <name>_per_env. EpisodeMetrics reports
+    them as <name>_<env>.
+    """
+
+    def __init__(self, names):
+        unknown = set(names) - set(EPISODIC_METRICS)
+        assert not unknown, f'Unknown metrics {sorted(unknown)}, options are {list(EPISODIC_METRICS)}'
+        self.names = list(names)
+        self.target_name = None
+        self.states = None
+        self.distances = {}
+
+    def start_step(self, states, target_name):
+        self.states = states
+        self.target_name = target_name
+        self.distances = {}
+
+    def distance(self, name):
+        if name not in self.distances:
+            self.distances[name] = torch.norm(self.states[METRIC_DISTANCES[name]] - self.states[self.target_name], dim=-1)
+        return self.distances[name]
+
+    def compute(self, num_per_env=0):
+        metrics = {}
+        for name in self.names:
+            distance, fn = EPISODIC_METRICS[name]
+            metrics[name] = fn(self.distance(distance))
+        if num_per_env > 0:
+            for name in self.names:
+                metrics[per_env_key(name)] = metrics[name][:num_per_env]
+        return metrics
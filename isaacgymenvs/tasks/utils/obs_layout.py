@@ -0,0 +1,31 @@
+import torch
+
+STATS = ("min", "max", "mean")
+
+
+class ObsLayout:
+    """
+    Static layout of a task's observation vector: the observed states in order and the slice of obs_buf each of them
+    fills, fixed once the states exist. fill() concatenates the states straight into the persistent obs_buf, so a step
+    neither allocates a new buffer nor reads anything back to the host. With debug True fill() also returns the
+    min, max and mean of every observed state, which costs one host sync per step.
+    """
+
+    def __init__(self, names, states, debug=False):
+        self.names = list(names)
+        self.spec, start = {}, 0
+        for name in self.names:
+            width = states[name].shape[-1]
+            self.spec[name] = slice(start, start + width)
+            start += width
+        self.num_obs = start
+        self.debug = debug
+
+    def fill(self, obs_buf, states):
+        """ writes the states into obs_buf, returns the per state stats in debug mode and None otherwise """
+        torch.cat([states[name] for name in self.names], dim=-1, out=obs_buf)
+        if not self.debug:
+            return None
+        stats = torch.stack([torch.stack([obs_buf[:, s].min(), obs_buf[:, s].max(), obs_buf[:, s].mean()])
+                             for s in self.spec.values()]).tolist()
+        return {name: dict(zip(STATS, values)) for name, values in zip(self.names, stats)}
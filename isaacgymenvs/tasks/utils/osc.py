@@ -0,0 +1,74 @@
+import math
+
+import torch
+
+
+def osc_torques_inverse(mm, j_eef, dpose, eef_vel, q, qd, default_q, kp, kd, kp_null, kd_null, effort_limit):
+    """ the franka tasks' OSC with explicit inverses, the reference for the equivalence check """
+    mm_inv = torch.inverse(mm)
+    m_eef_inv = j_eef @ mm_inv @ torch.transpose(j_eef, 1, 2)
+    m_eef = torch.inverse(m_eef_inv)
+    u = torch.transpose(j_eef, 1, 2) @ m_eef @ (kp * dpose - kd * eef_vel).unsqueeze(-1)
+    j_eef_inv = m_eef @ j_eef @ mm_inv
+    u_null = kd_null * -qd + kp_null * ((default_q - q + math.pi) % (2 * math.pi) - math.pi)
+    u_null = mm @ u_null.unsqueeze(-1)
+    u += (torch.eye(mm.shape[-1], device=mm.device).unsqueeze(0) - torch.transpose(j_eef, 1, 2) @ j_eef_inv) @ u_null
+    return torch.maximum(torch.minimum(u.squeeze(-1), effort_limit), -effort_limit)
+
+
+def task_inertia_factor(mm, j_eef):
+    """ Cholesky factor of the inverse task space inertia J M^-1 J^T, with M^-1 J^T solved from the factor of M """
+    mm_chol, _ = torch.linalg.cholesky_ex(mm)
+    mm_inv_jt = torch.cholesky_solve(j_eef.transpose(1, 2), mm_chol)
+    lambda_chol, _ = torch.linalg.cholesky_ex(j_eef @ mm_inv_jt)
+    return lambda_chol
+
+
+def osc_torques_factored(mm, j_eef, lambda_chol, dpose, eef_vel, q, qd, default_q, kp, kd, kp_null, kd_null,
+                         effort_limit):
+    # J^T L (kp dpose - kd v) + (I - J^T L J M^-1) M u_null = J^T L (kp dpose - kd v - J u_null) + M u_null,
+    # with L the task space inertia, so it is only ever applied to one vector
+    u_null = kd_null * -qd + kp_null * ((default_q - q + math.pi) % (2 * math.pi) - math.pi)
+    f = kp * dpose - kd * eef_vel - (j_eef @ u_null.unsqueeze(-1)).squeeze(-1)
+    u = j_eef.transpose(1, 2) @ torch.cholesky_solve(f.unsqueeze(-1), lambda_chol) + mm @ u_null.unsqueeze(-1)
+    return torch.maximum(torch.minimum(u.squeeze(-1), effort_limit), -effort_limit)
+
+
+def osc_torques(mm, j_eef, dpose, eef_vel, q, qd, default_q, kp, kd, kp_null, kd_null, effort_limit):
+    lambda_chol = task_inertia_factor(mm, j_eef)
+    return osc_torques_factored(mm, j_eef, lambda_chol, dpose, eef_vel, q, qd, default_q, kp, kd, kp_null, kd_null,
+                                effort_limit)
+
+
+class OSCController:
+    """
+    Operational space control of the franka arm with a nullspace term that holds the default joint configuration.
+    Paper: khatib.stanford.edu/publications/pdfs/Khatib_1987_RA.pdf, nullspace: roboticsproceedings.org/rss07/p31.pdf
+
+    The torques are found with batched Cholesky solves instead of inverting the mass matrix and the task space
+    inertia. The factorization only depends on the mass matrix and the Jacobian. With refactor_every > 1 it is reused
+    for that many control steps, which trades accuracy for time as the arm moves. backend 'jit' scripts the torque
+    computation into one graph, 'compile' uses torch.compile.
+    """
+
+    def __init__(self, kp, kd, kp_null, kd_null, default_q, effort_limit, refactor_every=1, backend='eager'):
+        assert backend in ['eager', 'jit', 'compile'], f'Unknown OSC backend {backend}'
+        self.gains = (default_q, kp, kd, kp_null, kd_null, effort_limit)
+        self.refactor_every = refactor_every
+        self.backend = backend
+        fns = [task_inertia_factor, osc_torques_factored, osc_torques]
+        if backend == 'jit':
+            fns = [torch.jit.script(fn) for fn in fns]
+        elif backend == 'compile':
+            fns = [torch.compile(fn, dynamic=False) for fn in fns]
+        self._factor, self._torques_factored, self._torques = fns
+        self.lambda_chol = None
+        self.steps = 0
+
+    def __call__(self, mm, j_eef, dpose, eef_vel, q, qd):
+        if self.refactor_every <= 1:
+            return self._torques(mm, j_eef, dpose, eef_vel, q, qd, *self.gains)
+        if self.steps % self.refactor_every == 0 or self.lambda_chol is None or self.lambda_chol.shape[0] != mm.shape[0]:
+            self.lambda_chol = self._factor(mm, j_eef)
+        self.steps += 1
+        return self._torques_factored(mm, j_eef, self.lambda_chol, dpose, eef_vel, q, qd, *self.gains)
@@ -0,0 +1,65 @@
+import math
+
+import torch
+
+
+def grid_capacity(half_extents, min_dist):
+    """ number of cells of the jittered grid, i.e. how many objects sample_separated_positions can always place """
+    return math.prod(max(int(2 * h // min_dist), 1) for h in half_extents)
+
+
+def _grid_positions(num_envs, num_objects, half_extents, min_dist, device):
+    # cells are at least min_dist wide and the jitter keeps points min_dist away from the neighbouring cells, so any
+    # two points in different cells are at least min_dist apart along one axis
+    cells_per_axis = [max(int(2 * h // min_dist), 1) for h in half_extents]
+    num_cells = math.prod(cells_per_axis)
+    cells = torch.rand(num_envs, num_cells, device=device).argsort(1)[:, :num_objects]
+    if num_cells < num_objects:
+        cells = torch.cat([cells, cells[:, :1].expand(-1, num_objects - num_cells)], 1)
+
+    positions = torch.empty(num_envs, num_objects, len(half_extents), device=device)
+    for d, (h, m) in enumerate(zip(half_extents, cells_per_axis)):
+        cell_size = 2 * h / m
+        jitter = max(cell_size - min_dist, 0.0)
+        idx = cells % m
+        cells = cells // m
+        positions[..., d] = -h + (idx + 0.5) * cell_size + jitter * (torch.rand(num_envs, num_objects, device=device) - 0.5)
+    return positions
+
+
+def sample_separated_positions(num_envs, num_objects, half_extents, min_dist, num_candidates=100, device='cpu'):
+    """
+    Samples num_objects positions per env, uniformly in the box [-half_extents, half_extents] and at least min_dist
+    apart, without a data dependent number of iterations.
+
+    Object j takes the first of num_candidates uniform candidates that is far enough from objects 0..j-1, which is the
+    distribution of rejection sampling with num_candidates tries. If some object of an env has no valid candidate, the
+    whole env is placed on a jittered grid instead, which is valid whenever grid_capacity() >= num_objects. Otherwise
+    each object of that env keeps its candidate furthest from the others.
+
+    Returns:
+        positions (num_envs, num_objects, len(half_extents)) and a boolean mask of the envs with a valid placement
+    """
+    half_extents = [float(h) for h in half_extents]
+    scale = torch.tensor(half_extents, device=device)
+    env_range = torch.arange(num_envs, device=device)
+
+    positions = torch.zeros(num_envs, num_objects, len(half_extents), device=device)
+    valid = torch.ones(num_envs, dtype=torch.bool, device=device)
+    for j in range(num_objects):
+        candidates = (2 * torch.rand(num_envs, num_candidates, len(half_extents), device=device) - 1) * scale
+        if j == 0:
+            positions[:, 0] = candidates[:, 0]
+            continue
+        clearance = torch.cdist(candidates, positions[:, :j]).amin(-1)
+        ok = clearance >= min_dist
+        # first valid candidate if there is one, the one with the most clearance otherwise
+        choice = torch.where(ok.any(1), ok.float().argmax(1), clearance.argmax(1))
+        valid &= ok.any(1)
+        positions[:, j] = candidates[env_range, choice]
+
+    if num_objects > 1 and grid_capacity(half_extents, min_dist) >= num_objects:
+        grid = _grid_positions(num_envs, num_objects, half_extents, min_dist, device)
+        positions = torch.where(valid[:, None, None], positions, grid)
+        valid = torch.ones_like(valid)
+    return positions, valid
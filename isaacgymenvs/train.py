@@ -33,11 +33,16 @@ import os
 from datetime import datetime
 
 # noinspection PyUnresolvedReferences
-import isaacgym
+try:
+    import isaacgym
+except ImportError:
+    # CPU-only machines can still train the gymnasium / stand-in tasks
+    isaacgym = None
 
 import hydra
 
 from isaacgymenvs.utils.rlgames_utils import multi_gpu_get_rank
+from isaacgymenvs.pbt.pbt import PbtAlgoObserver, initial_pbt_check
 
 from omegaconf import DictConfig, OmegaConf
 from hydra.utils import to_absolute_path
@@ -69,6 +74,15 @@ def preprocess_train_config(cfg, config_dict):
     print(f'Using sim_device: {cfg.sim_device}')
     print(train_cfg)
 
+    # what the evaluation worker needs to build its own copy of the task
+    train_cfg['eval_env'] = {
+        'task_config': omegaconf_to_dict(cfg.task),
+        'seed': cfg.seed,
+        'sim_device': cfg.sim_device,
+        'rl_device': cfg.rl_device,
+        'graphics_device_id': cfg.graphics_device_id,
+    }
+
     try:
         model_size_multiplier = config_dict['params']['network']['mlp']['model_size_multiplier']
         if model_size_multiplier != 1:
@@ -179,7 +193,9 @@ def launch_rlg_hydra(cfg: DictConfig):
     rlg_config_dict = omegaconf_to_dict(cfg.train)
     rlg_config_dict = preprocess_train_config(cfg, rlg_config_dict)
 
-    observers = [RLGPUAlgoObserver(rlg_config_dict["params"]["config"]["full_experiment_name"])]
+    observers = [RLGPUAlgoObserver(rlg_config_dict["params"]["config"]["full_experiment_name"],
+                                   media_queue_size=cfg.get('media_queue_size', 2),
+                                   media_backpressure=cfg.get('media_backpressure', 'drop'))]
 
     if cfg.pbt.enabled:
         pbt_observer = PbtAlgoObserver(cfg)
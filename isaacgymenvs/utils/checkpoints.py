@@ -0,0 +1,271 @@
+import atexit
+import collections
+import copy
+import gzip
+import json
+import os
+import queue
+import shutil
+import threading
+import time
+
+import torch
+
+from isaacgymenvs.ppo.torch_ext import safe_filesystem_op
+
+INDEX_FILE = 'checkpoints.json'
+
+
+class _Host:
+    """ a host tensor of a snapshot, copied by the writer thread """
+
+    def __init__(self, tensor):
+        self.tensor = tensor
+
+
+def _buffer(pool, key, t, pinned):
+    """ the host buffer of pool for the tensor at key, allocated again only when its shape or dtype change """
+    buf = pool.get(key)
+    if buf is None or buf.shape != t.shape or buf.dtype != t.dtype:
+        buf = torch.empty(t.shape, dtype=t.dtype, pin_memory=pinned)
+        pool[key] = buf
+    return buf
+
+
+def _snapshot(obj, pool, pinned, key=()):
+    """ copies the device tensors of a nested state into the host buffers of pool, the copies are only started """
+    if torch.is_tensor(obj):
+        obj = obj.detach()
+        if obj.device.type == 'cpu':
+            return _Host(obj)
+        out = _buffer(pool, key, obj, pinned)
+        out.copy_(obj, non_blocking=pinned)
+        return out
+    if isinstance(obj, collections.OrderedDict):
+        return collections.OrderedDict((k, _snapshot(v, pool, pinned, key + (k,))) for k, v in obj.items())
+    if isinstance(obj, dict):
+        return {k: _snapshot(v, pool, pinned, key + (k,)) for k, v in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return type(obj)(_snapshot(v, pool, pinned, key + (i,)) for i, v in enumerate(obj))
+    return copy.deepcopy(obj)
+
+
+def _copy_host(obj, pool, key=()):
+    """ replaces the host tensors of a snapshot with copies in the buffers of pool """
+    if isinstance(obj, _Host):
+        return _buffer(pool, key, obj.tensor, False).copy_(obj.tensor)
+    if isinstance(obj, collections.OrderedDict):
+        return collections.OrderedDict((k, _copy_host(v, pool, key + (k,))) for k, v in obj.items())
+    if isinstance(obj, dict):
+        return {k: _copy_host(v, pool, key + (k,)) for k, v in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return type(obj)(_copy_host(v, pool, key + (i,)) for i, v in enumerate(obj))
+    return obj
+
+
+def _write(fn, state, compression):
+    """ writes next to fn and renames, so fn is either the previous file or the complete new one """
+    os.makedirs(os.path.dirname(fn) or '.', exist_ok=True)
+    tmp = fn + '.tmp'
+    if compression > 0:
+        with gzip.open(tmp, 'wb', compresslevel=compression) as f:
+            torch.save(state, f)
+    else:
+        torch.save(state, tmp)
+    os.replace(tmp, fn)
+
+
+def _link(src, dst):
+    tmp = dst + '.tmp'
+    if os.path.exists(tmp):
+        os.remove(tmp)
+    try:
+        os.link(src, tmp)
+    except OSError:
+        shutil.copyfile(src, tmp)
+    os.replace(tmp, dst)
+
+
+def load_index(directory):
+    path = os.path.join(directory, INDEX_FILE)
+    if not os.path.isfile(path):
+        return []
+    with open(path) as f:
+        return json.load(f)
+
+
+def latest_checkpoint(directory):
+    """ the newest checkpoint written into directory, or a run directory with an nn folder, None if there is none """
+    if os.path.isdir(os.path.join(directory, 'nn')):
+        directory = os.path.join(directory, 'nn')
+    entries = [e for e in load_index(directory) if os.path.isfile(os.path.join(directory, e['file']))]
+    if entries:
+        return os.path.join(directory, entries[-1]['file'])
+    # runs saved before the index, take the newest file
+    files = [os.path.join(directory, f) for f in os.listdir(directory) if f.endswith('.pth')] if os.path.isdir(directory) else []
+    return max(files, key=os.path.getmtime) if files else None
+
+
+def resolve_checkpoint(path):
+    """ checkpoint files are returned as they are, directories resolve to their newest checkpoint """
+    if os.path.isdir(path):
+        checkpoint = latest_checkpoint(path)
+        if checkpoint is None:
+            raise FileNotFoundError(f'No checkpoints in {path}')
+        print(f'=> resuming from {checkpoint}')
+        return checkpoint
+    return path
+
+
+class CheckpointManager:
+    """
+    Writes the checkpoints of an agent on a background thread.
+
+    save() snapshots the state into pinned host memory and returns once the device copies are queued, so training only
+    waits for the copies and not for serialization and disk. The host buffers are reused: every file, and all the
+    checkpoints of save() together, keep a pool of up to max_pending snapshots, allocated again only when the shape of
+    a tensor changes, e.g. while the replay buffer fills up. Tensors already on the host are copied by the writer thread
+    when it takes the snapshot, in place changes to them before that end up in the file. Every file is written under a temporary name and renamed
+    when complete, a crash never leaves a truncated checkpoint behind. The checkpoints written are listed in
+    checkpoints.json of the directory, which drives the retention and latest_checkpoint():
+    kind 'last' keeps the newest keep_last of them and kind 'best' the keep_best with the highest score, 0 keeps all.
+    compression is a gzip level, 0 writes plain torch files. At most max_pending snapshots wait for the writer,
+    save() blocks beyond that. With background False every save is written before it returns.
+    """
+
+    def __init__(self, directory, keep_last=0, keep_best=0, compression=0, background=True, max_pending=2):
+        self.directory = directory
+        self.keep_last = keep_last
+        self.keep_best = keep_best
+        self.compression = compression
+        self.background = background
+        self.pinned = torch.cuda.is_available()
+        self.max_pending = max_pending
+        # pool name -> free host buffers {key: tensor} of earlier snapshots
+        self.pools = collections.defaultdict(list)
+        self.pools_lock = threading.Lock()
+        self.index = load_index(directory)
+        self.error = None
+        self.thread = None
+        if background:
+            self.jobs = queue.Queue(maxsize=max_pending)
+            self.thread = threading.Thread(target=self._worker, daemon=True)
+            self.thread.start()
+            atexit.register(self.close)
+
+    def save(self, fn, state, kind=None, score=None, link=None):
+        """
+        Saves state to fn + '.pth', like torch_ext.save_checkpoint. link names a second file, typically a fixed name,
+        that is pointed at the same checkpoint. For kind 'best' without keep_best only link is written.
+        """
+        if kind == 'best' and self.keep_best == 0 and link is not None:
+            fn, link = link, None
+        entry = None
+        # only checkpoints inside the directory are indexed, e.g. PBT saves into its own workspace
+        if os.path.abspath(os.path.dirname(fn)) == os.path.abspath(self.directory):
+            entry = {'file': os.path.basename(fn) + '.pth', 'kind': kind, 'score': score,
+                     'epoch': state.get('epoch'), 'frame': state.get('frame')}
+        print("=> saving checkpoint '{}'".format(fn + '.pth'))
+        self._submit({fn + '.pth': state}, entry, link + '.pth' if link is not None else None, pool='checkpoint')
+
+    def save_files(self, files):
+        """ writes {path: state} with torch.save, for files that belong to a checkpoint such as the replay buffer """
+        self._submit(files, None, None)
+
+    def _take_pool(self, name):
+        with self.pools_lock:
+            return self.pools[name].pop() if self.pools[name] else {}
+
+    def _return_pool(self, name, pool):
+        with self.pools_lock:
+            if len(self.pools[name]) < self.max_pending:
+                self.pools[name].append(pool)
+
+    def _submit(self, files, entry, link, pool=None):
+        if self.error is not None:
+            error, self.error = self.error, None
+            print(f'Checkpoint writer failed: {error}')
+        # fn -> (name of its pool, buffers, snapshot)
+        snapshots = {}
+        for fn, state in files.items():
+            name = pool or fn
+            buffers = self._take_pool(name)
+            snapshots[fn] = (name, buffers, _snapshot(state, buffers, self.pinned))
+        event = None
+        if self.pinned:
+            event = torch.cuda.Event()
+            event.record()
+        job = (snapshots, entry, link, event)
+        if self.thread is None:
+            self._run(job)
+        else:
+            self.jobs.put(job)
+
+    def _worker(self):
+        while True:
+            job = self.jobs.get()
+            try:
+                if job is None:
+                    break
+                self._run(job)
+            except Exception as e:
+                self.error = repr(e)
+            finally:
+                self.jobs.task_done()
+
+    def _run(self, job):
+        snapshots, entry, link, event = job
+        start = time.time()
+        try:
+            files = {fn: _copy_host(state, buffers) for fn, (_, buffers, state) in snapshots.items()}
+            if event is not None:
+                event.synchronize()
+            for fn, state in files.items():
+                safe_filesystem_op(_write, fn, state, self.compression)
+        finally:
+            for name, buffers, _ in snapshots.values():
+                self._return_pool(name, buffers)
+        if link is not None:
+            safe_filesystem_op(_link, next(iter(snapshots)), link)
+        if entry is not None:
+            entry['time'] = time.time()
+            entry['write_time'] = entry['time'] - start
+            self._update_index(entry, link)
+
+    def _update_index(self, entry, link):
+        names = {entry['file']} | ({os.path.basename(link)} if link is not None else set())
+        self.index = [e for e in self.index if e['file'] not in names]
+        self.index.append(entry)
+        if link is not None:
+            self.index.append(dict(entry, file=os.path.basename(link), kind=None))
+        removed = []
+        if self.keep_last > 0:
+            removed += [e for e in self.index if e['kind'] == 'last'][:-self.keep_last]
+        if self.keep_best > 0:
+            best = sorted((e for e in self.index if e['kind'] == 'best'), key=lambda e: e['score'], reverse=True)
+            removed += best[self.keep_best:]
+        for e in removed:
+            self.index.remove(e)
+            path = os.path.join(self.directory, e['file'])
+            if os.path.isfile(path):
+                os.remove(path)
+        tmp = os.path.join(self.directory, INDEX_FILE + '.tmp')
+        with open(tmp, 'w') as f:
+            json.dump(self.index, f, indent=1)
+        os.replace(tmp, os.path.join(self.directory, INDEX_FILE))
+
+    def flush(self):
+        """ waits until everything saved so far is on disk """
+        if self.thread is not None:
+            self.jobs.join()
+        if self.error is not None:
+            error, self.error = self.error, None
+            print(f'Checkpoint writer failed: {error}')
+
+    def close(self):
+        if self.thread is None:
+            return
+        self.jobs.put(None)
+        self.thread.join()
+        self.thread = None
+        self.flush()
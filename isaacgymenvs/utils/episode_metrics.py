@@ -0,0 +1,136 @@
+import torch
+
+
+# metric name -> options, filled by tasks through register_episode_metric()
+_registered_metrics = {}
+
+# metrics under <name>_per_env hold one value for each of the first envs, e.g. the rendered ones, and are reported as
+# <name>_<env> as if every env were its own metric
+PER_ENV_SUFFIX = '_per_env'
+
+
+def per_env_key(name):
+    return name + PER_ENV_SUFFIX
+
+
+def register_episode_metric(name, improvement_step=None):
+    """
+    Tasks register the metrics they report in infos['episodic'] that need more than the default statistics.
+    Unregistered metrics are picked up automatically with the defaults.
+
+    Args:
+        name: key in infos['episodic']
+        improvement_step: also log <name>_improvement, the value at this step of the episode minus the last value,
+            and <name>_displacement, its absolute value
+    """
+    _registered_metrics[name] = dict(improvement_step=improvement_step)
+
+
+class EpisodeMetrics:
+    """
+    Per episode statistics of per step metrics, kept on the device so that no step has to wait for the host.
+
+    update() adds one step of every metric to the running statistics of each env. For the envs in done_mask, the
+    episode statistics are then added to the totals and the envs start over. All metrics are updated together as one
+    (num_metrics, num_envs) tensor. summary() copies the totals to the host once and starts a new interval.
+    widths gives the number of envs of the <name>_per_env keys, they are expanded to their <name>_<env> metrics only
+    in that tensor and in summary().
+    """
+
+    def __init__(self, keys, num_envs, device, widths=None):
+        self.keys = list(keys)
+        self.num_envs = num_envs
+        self.device = device
+        self.widths = {k: widths[k] for k in self.keys if k.endswith(PER_ENV_SUFFIX)} if widths else {}
+        # the names of the rows of the statistics
+        self.names = []
+        for k in self.keys:
+            if k in self.widths:
+                self.names += [f'{k[:-len(PER_ENV_SUFFIX)]}_{i}' for i in range(self.widths[k])]
+            else:
+                self.names.append(k)
+        steps = [_registered_metrics.get(k, {}).get('improvement_step') for k in self.names]
+        self.has_improvement = [s is not None for s in steps]
+        self.improvement_step = torch.tensor([-1 if s is None else s for s in steps], device=device)
+
+        shape = (len(self.names), num_envs)
+        self.ep_sum = torch.zeros(shape, device=device)
+        self.ep_min = torch.full(shape, float('inf'), device=device)
+        self.ep_max = torch.full(shape, float('-inf'), device=device)
+        self.ep_last = torch.zeros(shape, device=device)
+        self.ep_at_step = torch.zeros(shape, device=device)
+        self.ep_len = torch.zeros(num_envs, device=device)
+        self.reset()
+
+    @classmethod
+    def for_values(cls, values, device):
+        """ the EpisodeMetrics of the metrics of one step, sized from their values """
+        num_envs = max((v.numel() for k, v in values.items() if not k.endswith(PER_ENV_SUFFIX)), default=1)
+        widths = {k: v.numel() for k, v in values.items() if k.endswith(PER_ENV_SUFFIX)}
+        return cls(values.keys(), num_envs, device, widths)
+
+    def reset(self):
+        num_keys = len(self.names)
+        self.count = torch.zeros((), device=self.device)
+        self.totals = torch.zeros(8, num_keys, device=self.device)
+        self.sum_min = torch.full((num_keys,), float('inf'), device=self.device)
+        self.sum_max = torch.full((num_keys,), float('-inf'), device=self.device)
+
+    def update(self, values, done_mask):
+        values = torch.cat([values[k].float().view(-1, 1).expand(-1, self.num_envs) if k in self.widths
+                            else torch.broadcast_to(values[k].float(), (self.num_envs,))[None] for k in self.keys])
+        self.ep_len += 1
+        self.ep_sum += values
+        torch.minimum(self.ep_min, values, out=self.ep_min)
+        torch.maximum(self.ep_max, values, out=self.ep_max)
+        self.ep_last.copy_(values)
+        at_step = self.ep_len[None] == (self.improvement_step[:, None] + 1)
+        self.ep_at_step = torch.where(at_step, values, self.ep_at_step)
+
+        if done_mask is None:
+            return
+        done = done_mask.float()
+        has_step = (self.ep_len[None] > self.improvement_step[:, None]).float() * done
+        ep_mean = self.ep_sum / self.ep_len.clamp(min=1)
+        self.count += done.sum()
+        self.totals += torch.stack([
+            ep_mean @ done,
+            self.ep_min @ done,
+            self.ep_max @ done,
+            self.ep_last @ done,
+            self.ep_sum @ done,
+            ((self.ep_at_step - self.ep_last) * has_step).sum(1),
+            ((self.ep_last - self.ep_at_step).abs() * has_step).sum(1),
+            has_step.sum(1),
+        ])
+        done_mask = done_mask.bool()
+        torch.minimum(self.sum_min, torch.where(done_mask, self.ep_sum, float('inf')).amin(1), out=self.sum_min)
+        torch.maximum(self.sum_max, torch.where(done_mask, self.ep_sum, float('-inf')).amax(1), out=self.sum_max)
+
+        self.ep_sum.masked_fill_(done_mask, 0)
+        self.ep_min.masked_fill_(done_mask, float('inf'))
+        self.ep_max.masked_fill_(done_mask, float('-inf'))
+        self.ep_len.masked_fill_(done_mask, 0)
+
+    def summary(self):
+        """ key -> statistic -> float over the episodes finished since the last call, empty if there were none """
+        count, totals, sum_min, sum_max = [x.cpu() for x in [self.count, self.totals, self.sum_min, self.sum_max]]
+        self.reset()
+        count = count.item()
+        if count == 0:
+            return {}
+        stats = {}
+        for i, key in enumerate(self.names):
+            stats[key] = {
+                'avg': totals[0, i].item() / count,
+                'min': totals[1, i].item() / count,
+                'max': totals[2, i].item() / count,
+                'last': totals[3, i].item() / count,
+                'sum': totals[4, i].item() / count,
+                'sum_min': sum_min[i].item(),
+                'sum_max': sum_max[i].item(),
+            }
+            if self.has_improvement[i] and totals[7, i] > 0:
+                stats[key]['improvement'] = totals[5, i].item() / totals[7, i].item()
+                stats[key]['displacement'] = totals[6, i].item() / totals[7, i].item()
+        return stats
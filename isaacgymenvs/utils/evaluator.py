@@ -0,0 +1,207 @@
+import atexit
+import queue
+import random
+import time
+
+import numpy as np
+import torch
+import torch.multiprocessing as mp
+
+
+def _make_env(env_spec):
+    from isaacgymenvs.utils.rlgames_utils import get_rlgames_env_creator
+
+    task_config = dict(env_spec['task_config'])
+    task_config['env'] = dict(task_config['env'], numEnvs=env_spec['num_envs'])
+    create_env = get_rlgames_env_creator(
+        seed=env_spec['seed'],
+        task_config=task_config,
+        task_name=task_config['name'],
+        sim_device=env_spec['sim_device'],
+        rl_device=env_spec['rl_device'],
+        graphics_device_id=env_spec['graphics_device_id'],
+        headless=True,
+    )
+    return create_env()
+
+
+def _make_model(model_spec, device):
+    from isaacgymenvs.ppo import model_builder
+
+    network = model_builder.ModelBuilder().load(model_spec['params'])
+    model = network.build(model_spec['build_config']).to(device)
+    model.eval()
+    return model
+
+
+def _run_episodes(env, model, job, device, clip_actions):
+    """ the test episodes of A2CBase.test, aggregated with EpisodeMetrics in the worker """
+    from isaacgymenvs.ppo.a2c_common import rescale_actions
+    from isaacgymenvs.utils.episode_metrics import EpisodeMetrics
+
+    if job['seed'] is not None:
+        random.seed(job['seed'])
+        np.random.seed(job['seed'])
+        torch.manual_seed(job['seed'])
+    low = torch.as_tensor(env.action_space.low, dtype=torch.float32, device=device)
+    high = torch.as_tensor(env.action_space.high, dtype=torch.float32, device=device)
+
+    env.test = True
+    env.override_render = job['render']
+    obs = env.reset()
+    metrics, frames, finished = {}, [], False
+    for _ in range(env.max_episode_length - 1):
+        obs_batch = obs['obs']
+        if obs_batch.dtype == torch.uint8:
+            obs_batch = obs_batch.float() / 255.0
+        with torch.no_grad():
+            res_dict = model({'is_train': False, 'prev_actions': None, 'obs': obs_batch, 'rnn_states': None})
+        actions = res_dict['mus'] if job['deterministic'] else res_dict['actions']
+        if clip_actions:
+            actions = rescale_actions(low, high, torch.clamp(actions, -1.0, 1.0))
+        obs, rewards, terminated, truncated, infos = env.step(actions)
+        done_indices = (terminated + truncated).nonzero(as_tuple=False).view(-1)
+
+        if 'images' in infos and not finished:
+            frames.append((infos['images'].clamp(0, 1) * 255).to(torch.uint8).cpu())
+        for info_key in ['episode_cumulative', 'episodic']:
+            if info_key not in infos:
+                continue
+            values = infos[info_key]
+            if info_key not in metrics:
+                metrics[info_key] = EpisodeMetrics.for_values(values, device)
+            done_mask = None
+            if len(done_indices) > 0:
+                done_mask = torch.zeros(metrics[info_key].num_envs, dtype=torch.bool, device=device)
+                done_mask[done_indices] = True
+                finished = True
+            metrics[info_key].update(values, done_mask)
+    env.test = False
+    env.override_render = False
+
+    summaries = {info_key: m.summary() for info_key, m in metrics.items()}
+    video = torch.stack(frames, 1) if frames else None
+    return summaries, video
+
+
+def _eval_worker(env_spec, model_spec, jobs, results):
+    try:
+        import isaacgym
+    except ImportError:
+        pass
+    device = env_spec['rl_device']
+    try:
+        env = _make_env(env_spec)
+        model = _make_model(model_spec, device)
+    except Exception as e:
+        results.put({'epoch_num': None, 'frame': None, 'metrics': {}, 'video': None, 'error': repr(e), 'eval_time': 0.0})
+        return
+    while True:
+        job = jobs.get()
+        if job is None:
+            break
+        start = time.time()
+        try:
+            model.load_state_dict(job['weights'])
+            summaries, video = _run_episodes(env, model, job, device, model_spec['clip_actions'])
+            error = None
+        except Exception as e:
+            summaries, video, error = {}, None, repr(e)
+        results.put({'epoch_num': job['epoch_num'], 'frame': job['frame'], 'metrics': summaries, 'video': video,
+                     'error': error, 'eval_time': time.time() - start})
+
+
+class Evaluator:
+    """
+    Runs the test episodes in a separate process with its own copy of the task, so training does not stop for them.
+
+    submit() sends a CPU snapshot of the policy weights, at most one evaluation is queued or running at a time and
+    the ones submitted meanwhile are skipped. Finished evaluations are returned by poll(), which waits for the
+    running one when it was submitted more than max_staleness epochs ago. With deterministic the worker acts with
+    the mean action and reseeds before every evaluation, so the same weights always give the same numbers.
+    While waiting, the worker is checked every check_interval seconds. A worker that is gone without reporting,
+    e.g. after a segfault in the sim or killed for memory, is reported as a failed evaluation and alive turns False.
+    """
+
+    def __init__(self, env_spec, model_spec, max_staleness=2, deterministic=False, seed=0, check_interval=5.0):
+        self.max_staleness = max_staleness
+        self.deterministic = deterministic
+        self.seed = seed
+        self.check_interval = check_interval
+        ctx = mp.get_context('spawn')
+        self.jobs = ctx.Queue(maxsize=1)
+        self.results = ctx.Queue()
+        self.process = ctx.Process(target=_eval_worker, args=(env_spec, model_spec, self.jobs, self.results), daemon=True)
+        self.process.start()
+        self.pending_epoch = None
+        self.skipped = 0
+        atexit.register(self.close)
+
+    @property
+    def alive(self):
+        return self.process is not None
+
+    def submit(self, model, epoch_num, frame, render=False):
+        if self.process is None:
+            return False
+        if self.pending_epoch is not None:
+            self.skipped += 1
+            return False
+        weights = {k: v.detach().to('cpu', copy=True) for k, v in model.state_dict().items()}
+        self.jobs.put({'weights': weights, 'epoch_num': epoch_num, 'frame': frame, 'render': render,
+                       'deterministic': self.deterministic, 'seed': self.seed if self.deterministic else None})
+        self.pending_epoch = epoch_num
+        return True
+
+    def staleness(self, epoch_num):
+        return 0 if self.pending_epoch is None else epoch_num - self.pending_epoch
+
+    def _get(self, block):
+        """ the next result, None if there is none yet. A dead worker gives a result without an epoch """
+        while True:
+            try:
+                return self.results.get(block=block, timeout=self.check_interval if block else None)
+            except queue.Empty:
+                pass
+            if self.process.is_alive():
+                if not block:
+                    return None
+                continue
+            try:
+                # what it put just before exiting
+                return self.results.get(timeout=1.0)
+            except queue.Empty:
+                error = f'evaluation worker exited with code {self.process.exitcode}'
+                return {'epoch_num': None, 'frame': None, 'metrics': {}, 'video': None, 'error': error, 'eval_time': 0.0}
+
+    def poll(self, epoch_num, block=None):
+        if block is None:
+            block = self.max_staleness is not None and self.staleness(epoch_num) > self.max_staleness
+        done = []
+        while self.pending_epoch is not None and self.process is not None:
+            result = self._get(block)
+            if result is None:
+                break
+            # a failed start or a dead worker is reported without an epoch and ends the worker
+            if result['epoch_num'] is None:
+                self.process = None
+            self.pending_epoch = None
+            done.append(result)
+        return done
+
+    def close(self):
+        """ waits for the running evaluation and returns its result """
+        if self.process is None:
+            return []
+        try:
+            self.jobs.put(None, timeout=self.check_interval)
+        except queue.Full:
+            # the worker is gone with a job still queued, poll() finds out
+            pass
+        process = self.process
+        done = self.poll(self.pending_epoch or 0, block=True)
+        process.join(timeout=self.check_interval)
+        if process.is_alive():
+            process.terminate()
+        self.process = None
+        return done
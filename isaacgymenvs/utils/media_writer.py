@@ -0,0 +1,153 @@
+import atexit
+import os
+import os.path as osp
+import queue
+import time
+
+import numpy as np
+import torch
+import torch.multiprocessing as mp
+
+
+def _encode(save_dir, phase, epoch_num, video):
+    """
+    video: uint8 tensor (num_envs, T, C, H, W). Writes the same files the observer used to write inline.
+    """
+    from tensorboardX.utils import _prepare_video
+    import imageio
+    import torchvision
+
+    os.makedirs(save_dir, exist_ok=True)
+    video = video.numpy()
+    get_frame = lambda idx: (torchvision.utils.make_grid(torch.from_numpy(video[:, idx]).float() / 255, 4) * 255).numpy().astype(np.uint8).transpose([1, 2, 0])
+    grid_video = (_prepare_video(video) * 255).astype(np.uint8)
+
+    files = {
+        'execution': osp.join(save_dir, f'eval{phase}_{epoch_num}.mp4'),
+        'start': osp.join(save_dir, f'eval_start{phase}_{epoch_num}.png'),
+        'end': osp.join(save_dir, f'eval_end{phase}_{epoch_num}.png'),
+    }
+    imageio.mimwrite(files['execution'], grid_video)
+    imageio.mimwrite(osp.join(save_dir, f'eval{phase}_{epoch_num}.gif'), grid_video)
+    imageio.imwrite(files['start'], get_frame(min(10, video.shape[1] - 1)))
+    imageio.imwrite(files['end'], get_frame(-1))
+    return files
+
+
+def _media_worker(jobs, results):
+    torch.set_num_threads(1)
+    while True:
+        job = jobs.get()
+        if job is None:
+            break
+        save_dir, phase, epoch_num, video = job
+        start = time.time()
+        try:
+            files = _encode(save_dir, phase, epoch_num, video)
+            error = None
+        except Exception as e:
+            files, error = {}, repr(e)
+        results.put({'phase': phase, 'epoch_num': epoch_num, 'files': files, 'error': error,
+                     'encode_time': time.time() - start})
+
+
+class MediaWriter:
+    """
+    Encodes evaluation videos in a separate process so the trainer does not wait for imageio.
+
+    Videos are passed as uint8 CPU tensors through a queue of at most max_queue entries. When the queue is full,
+    backpressure='drop' discards the new video and backpressure='block' waits for the worker.
+    Finished jobs are returned by poll(), close() waits for everything that is queued.
+    While waiting, the worker is checked every check_interval seconds. A worker that is gone, e.g. killed for memory,
+    is reported once as a failed job without an epoch, the videos still queued are lost and alive turns False.
+    """
+
+    def __init__(self, max_queue=2, backpressure='drop', check_interval=5.0):
+        assert backpressure in ['drop', 'block'], f'Unknown backpressure policy {backpressure}'
+        self.backpressure = backpressure
+        self.check_interval = check_interval
+        ctx = mp.get_context('spawn')
+        self.jobs = ctx.Queue(maxsize=max_queue)
+        self.results = ctx.Queue()
+        self.process = ctx.Process(target=_media_worker, args=(self.jobs, self.results), daemon=True)
+        self.process.start()
+        self.pending = 0
+        self.dropped = 0
+        atexit.register(self.close)
+
+    @property
+    def alive(self):
+        return self.process is not None
+
+    def submit(self, save_dir, phase, epoch_num, video):
+        if self.process is None:
+            return False
+        job = (save_dir, phase, epoch_num, video)
+        while True:
+            try:
+                if self.backpressure == 'drop':
+                    self.jobs.put_nowait(job)
+                else:
+                    self.jobs.put(job, timeout=self.check_interval)
+                break
+            except queue.Full:
+                # a dead worker never frees a slot, poll() reports it
+                if self.backpressure == 'drop' or not self.process.is_alive():
+                    self.dropped += 1
+                    return False
+        self.pending += 1
+        return True
+
+    def queue_depth(self):
+        return self.pending
+
+    def _get(self, block):
+        """ the next result, None if there is none yet. A dead worker gives a result without an epoch """
+        while True:
+            try:
+                return self.results.get(block=block, timeout=self.check_interval if block else None)
+            except queue.Empty:
+                pass
+            if self.process.is_alive():
+                if not block:
+                    return None
+                continue
+            try:
+                # what it put just before exiting
+                return self.results.get(timeout=1.0)
+            except queue.Empty:
+                error = f'media worker exited with code {self.process.exitcode}, {self.pending} videos lost'
+                return {'phase': None, 'epoch_num': None, 'files': {}, 'error': error, 'encode_time': 0.0}
+
+    def poll(self, block=False):
+        done = []
+        while self.pending > 0 and self.process is not None:
+            result = self._get(block)
+            if result is None:
+                break
+            done.append(result)
+            # a dead worker ends the writer, what it still had queued is never encoded
+            if result['epoch_num'] is None:
+                self.process = None
+                self.pending = 0
+                break
+            self.pending -= 1
+        return done
+
+    def close(self):
+        """ waits for all queued videos and returns their results """
+        if self.process is None:
+            return []
+        process = self.process
+        # the queue may be full of videos, the sentinel goes in once they are all encoded
+        done = self.poll(block=True)
+        try:
+            self.jobs.put(None, timeout=self.check_interval)
+        except queue.Full:
+            # the worker is gone with videos still queued
+            pass
+        process.join(timeout=self.check_interval)
+        if process.is_alive():
+            process.terminate()
+        self.process = None
+        return done
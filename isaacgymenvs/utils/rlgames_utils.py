@@ -26,9 +26,9 @@
 # OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
 # OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 
+import atexit
 import os
 import os.path as osp
-from collections import deque
 from typing import Callable, Dict, Tuple, Any
 
 import gym
@@ -42,6 +42,8 @@ import wandb
 from isaacgymenvs.ppo.algo_observer import AlgoObserver
 
 from isaacgymenvs.tasks import isaacgym_task_map
+from isaacgymenvs.utils.episode_metrics import EpisodeMetrics
+from isaacgymenvs.utils.media_writer import MediaWriter
 from isaacgymenvs.utils.utils import set_seed, flatten_dict
 
 
@@ -134,7 +136,7 @@ def get_rlgames_env_creator(
 class RLGPUAlgoObserver(AlgoObserver):
     """Allows us to log stats from the env along with the algorithm running stats. """
 
-    def __init__(self, experiment_name):
+    def __init__(self, experiment_name, media_queue_size=2, media_backpressure='drop'):
         super().__init__()
         self.algo = None
         self.writer = None
@@ -142,14 +144,21 @@ class RLGPUAlgoObserver(AlgoObserver):
         self.ep_infos = []
         self.direct_info = {}
 
-        self.episode_cumulative = dict()
-        self.episode_cumulative_avg = dict()
-        self.episodic = dict()
-        self.episodic_stats = dict()
+        # (info key, test phase, metric names) -> EpisodeMetrics, read back only in after_print_stats
+        self.episode_metrics = dict()
         self.videos = []
+        self.videos_copied = None
+        # pinned host buffers of the frames, one per step of an episode, reused across videos
+        self.frame_buffers = []
         self.new_finished_episodes = False
+        self.masked_updates = False
         self.experiment_name = experiment_name
 
+        # the encoder process is only started once there is a video to encode
+        self.media_queue_size = media_queue_size
+        self.media_backpressure = media_backpressure
+        self.media_writer = None
+
     def after_init(self, algo):
         self.algo = algo
         self.writer = self.algo.writer
@@ -163,52 +172,40 @@ class RLGPUAlgoObserver(AlgoObserver):
             self.ep_infos.append(infos['episode'])
 
         if 'images' in infos and not self.new_finished_episodes:
-            self.videos.append(infos['images'].cpu().numpy())
-
-        if 'episode_cumulative' in infos:
-            for key, value in infos['episode_cumulative'].items():
-                if key not in self.episode_cumulative:
-                    self.episode_cumulative[key] = torch.zeros_like(value)
-                self.episode_cumulative[key] += value
-
-            for done_idx in done_indices:
-                self.new_finished_episodes = True
-                done_idx = done_idx.item()
+            self.videos.append(self._copy_frames(infos['images']))
 
-                for key, value in infos['episode_cumulative'].items():
-                    if key not in self.episode_cumulative_avg:
-                        self.episode_cumulative_avg[key] = deque([], maxlen=self.algo.games_to_track)
+        for info_key in ['episode_cumulative', 'episodic']:
+            if info_key in infos:
+                self._update_episode_metrics(info_key, infos[info_key], done_indices)
+                if len(done_indices) > 0:
+                    self.new_finished_episodes = True
 
-                    self.episode_cumulative_avg[key].append(self.episode_cumulative[key][done_idx].item())
-                    self.episode_cumulative[key][done_idx] = 0
+        self._update_direct_info(infos)
 
-        if 'episodic' in infos:
-            for key, value in infos['episodic'].items():
-                if key not in self.episodic:
-                    self.episodic[key] = []
-                self.episodic[key].append(value.cpu().numpy())
-
-            if len(done_indices) > 0:
-                self.new_finished_episodes = True
+    def process_infos_mask(self, infos, done_mask):
+        """
+        process_infos with the finished envs as a bool mask, so the step does not wait for the host to find them.
+        Only while frames are recorded the mask is read back, to end the video at the first finished episode.
+        """
+        assert isinstance(infos, dict), 'RLGPUAlgoObserver expects dict info'
 
-                for key, value in infos['episodic'].items():
-                    if key not in self.episodic_stats:
-                        self.episodic_stats[key] = dict()
+        if 'episode' in infos:
+            self.ep_infos.append(infos['episode'])
 
-                    data = np.stack(self.episodic[key])
-                    self.episodic_stats[key]['avg'] = data.mean(0)
-                    self.episodic_stats[key]['min'] = data.min(0)
-                    self.episodic_stats[key]['max'] = data.max(0)
-                    self.episodic_stats[key]['last'] = data[-1]
+        recording = 'images' in infos and not self.new_finished_episodes
+        if recording:
+            self.videos.append(self._copy_frames(infos['images']))
 
-                    if key == 'goal_dist' and data.shape[0] > 10:
-                        self.episodic_stats[key]['improvement'] = data[10] - data[-1]
-                        self.episodic_stats[key]['displacement'] = np.abs(data[-1] - data[10])
+        for info_key in ['episode_cumulative', 'episodic']:
+            if info_key in infos:
+                self._get_episode_metrics(info_key, infos[info_key]).update(infos[info_key], done_mask)
+                self.masked_updates = True
+                if recording and done_mask.any():
+                    self.new_finished_episodes = True
 
-                    self.episodic[key] = []
-                
-                # assert len(done_indices) == data.shape[1]
+        self._update_direct_info(infos)
 
+    def _update_direct_info(self, infos):
         # turn nested infos into summary keys (i.e. infos['scalars']['lr'] -> infos['scalars/lr']
         if len(infos) > 0 and isinstance(infos, dict):  # allow direct logging from env
             infos_flat = flatten_dict(infos, prefix='', separator='/')
@@ -234,46 +231,128 @@ class RLGPUAlgoObserver(AlgoObserver):
                 self.writer.add_scalar('Episode' + phase + '/' + key, value, epoch_num)
             self.ep_infos.clear()
         
-        # log these if and only if we have new finished episodes
-        if self.new_finished_episodes:
-            for key in self.episode_cumulative_avg:
-                self.writer.add_scalar(f'episode_cumulative{phase}/{key}', np.mean(self.episode_cumulative_avg[key]), frame)
-                self.writer.add_scalar(f'episode_cumulative_min{phase}/{key}_min', np.min(self.episode_cumulative_avg[key]), frame)
-                self.writer.add_scalar(f'episode_cumulative_max{phase}/{key}_max', np.max(self.episode_cumulative_avg[key]), frame)
-            for metric, value in self.episodic_stats.items():
-                for stat, scalar in value.items():
-                    self.writer.add_scalar(f'episodic_stats{phase}/{metric}_{stat}', np.mean(scalar), frame)
-            self.episodic_stats = dict()
+        # log these if and only if we have new finished episodes, after masked updates the summaries tell
+        if self.new_finished_episodes or self.masked_updates:
+            self._log_episode_metrics(frame, phase)
+            self.masked_updates = False
 
+        if self.new_finished_episodes:
             self.new_finished_episodes = False
 
             if self.videos:
-                # self.writer.add_video('execution' + phase, np.stack(self.videos, 1))
-                # self.writer.add_images('start' + phase, self.videos[1])
-                # self.writer.add_images('end' + phase, self.videos[-1])
-                from tensorboardX.utils import _prepare_video
-                import imageio
-                import torchvision
-                save_dir = osp.join("runs", self.experiment_name, "viz")
-                if not osp.exists(save_dir):
-                    os.makedirs(save_dir)
-                video = (_prepare_video(np.stack(self.videos, 1)) * 255).astype(np.uint8)
-                get_frame = lambda idx: (torchvision.utils.make_grid(torch.tensor(self.videos[idx]), 4) * 255).numpy().astype(np.uint8).transpose([1, 2, 0])
-
-                imageio.mimwrite(osp.join(save_dir, f'eval{phase}_{epoch_num}.mp4'), video)
-                imageio.mimwrite(osp.join(save_dir, f'eval{phase}_{epoch_num}.gif'), video)
-                imageio.imwrite(osp.join(save_dir, f'eval_start{phase}_{epoch_num}.png'), get_frame(10))
-                imageio.imwrite(osp.join(save_dir, f'eval_end{phase}_{epoch_num}.png'), get_frame(-1))
-
-                if wandb.run is not None:
-                    wandb.log({'execution' + phase: [wandb.Video(np.stack(self.videos, 1) * 255, fps=10, format="mp4")]})
-                    wandb.log({'start' + phase: [wandb.Image(get_frame(10))]})
-                    wandb.log({'end' + phase: [wandb.Image(get_frame(-1))]})
-                self.videos = []
+                self._submit_video(frame, epoch_num, phase)
+
+        if self.media_writer is not None:
+            self._log_media(self.media_writer.poll(), frame)
 
         for k, v in self.direct_info.items():
             self.writer.add_scalar(f'{k}{phase}', v, frame)
 
+    def _get_episode_metrics(self, info_key, values):
+        test = getattr(getattr(getattr(self.algo, 'vec_env', None), 'env', None), 'test', False)
+        metrics_key = (info_key, test, tuple(values.keys()))
+        if metrics_key not in self.episode_metrics:
+            device = next(iter(values.values())).device
+            self.episode_metrics[metrics_key] = EpisodeMetrics.for_values(values, device)
+        return self.episode_metrics[metrics_key]
+
+    def _update_episode_metrics(self, info_key, values, done_indices):
+        metrics = self._get_episode_metrics(info_key, values)
+        done_mask = None
+        if len(done_indices) > 0:
+            # done_indices come from nonzero(), which has already synchronized, so this is the only check on the host
+            done_mask = torch.zeros(metrics.num_envs, dtype=torch.bool, device=metrics.device)
+            done_mask[done_indices.view(-1)] = True
+        metrics.update(values, done_mask)
+
+    def after_evaluation(self, result, epoch_num):
+        """ logs an evaluation of the Evaluator process as the test phase, at the frame of the evaluated weights """
+        if result['error'] is not None:
+            print(f'Evaluation of epoch {result["epoch_num"]} failed: {result["error"]}')
+            return
+        frame = result['frame']
+        for info_key, summary in result['metrics'].items():
+            self._write_episode_summary(info_key, summary, frame, '_test')
+        if result['video'] is not None:
+            self._submit_video(frame, result['epoch_num'], '_test', result['video'])
+        self.writer.add_scalar('eval/time', result['eval_time'], frame)
+        self.writer.add_scalar('eval/staleness', epoch_num - result['epoch_num'], frame)
+
+    def _log_episode_metrics(self, frame, phase):
+        for (info_key, test, _), metrics in self.episode_metrics.items():
+            if test != (phase == '_test'):
+                continue
+            self._write_episode_summary(info_key, metrics.summary(), frame, phase)
+
+    def _write_episode_summary(self, info_key, summary, frame, phase):
+        for key, stats in summary.items():
+            if info_key == 'episode_cumulative':
+                self.writer.add_scalar(f'episode_cumulative{phase}/{key}', stats['sum'], frame)
+                self.writer.add_scalar(f'episode_cumulative_min{phase}/{key}_min', stats['sum_min'], frame)
+                self.writer.add_scalar(f'episode_cumulative_max{phase}/{key}_max', stats['sum_max'], frame)
+                continue
+            for stat in ['avg', 'min', 'max', 'last', 'improvement', 'displacement']:
+                if stat in stats:
+                    self.writer.add_scalar(f'episodic_stats{phase}/{key}_{stat}', stats[stat], frame)
+
+    def _copy_frames(self, images):
+        # the env reuses its image buffer, so the frames are copied. Converting to uint8 on the device makes the copy
+        # 4x smaller and copying into pinned memory lets it overlap with the next env steps
+        frames = (images.clamp(0, 1) * 255).to(torch.uint8)
+        if not frames.is_cuda:
+            return frames.clone()
+        host_frames = self._frame_buffer(len(self.videos), frames.shape)
+        host_frames.copy_(frames, non_blocking=True)
+        if self.videos_copied is None:
+            self.videos_copied = torch.cuda.Event()
+        self.videos_copied.record()
+        return host_frames
+
+    def _frame_buffer(self, idx, shape):
+        # the buffers are free again once _submit_video has stacked the frames of the previous video
+        if self.frame_buffers and self.frame_buffers[0].shape != shape:
+            self.frame_buffers = []
+        if not self.frame_buffers:
+            env = getattr(getattr(self.algo, 'vec_env', None), 'env', None)
+            num_frames = getattr(env, 'max_episode_length', 1)
+            self.frame_buffers = list(torch.empty((num_frames, *shape), dtype=torch.uint8, pin_memory=True))
+        while idx >= len(self.frame_buffers):
+            self.frame_buffers.append(torch.empty(shape, dtype=torch.uint8, pin_memory=True))
+        return self.frame_buffers[idx]
+
+    def _submit_video(self, frame, epoch_num, phase, video=None):
+        if self.media_writer is None:
+            self.media_writer = MediaWriter(self.media_queue_size, self.media_backpressure)
+            atexit.register(self.close)
+        if video is None:
+            if self.videos_copied is not None:
+                self.videos_copied.synchronize()
+            video = torch.stack(self.videos, 1)
+            self.videos = []
+
+        save_dir = osp.join("runs", self.experiment_name, "viz")
+        self.media_writer.submit(save_dir, phase, epoch_num, video)
+        self.writer.add_scalar('media/queue_depth', self.media_writer.queue_depth(), frame)
+        self.writer.add_scalar('media/dropped', self.media_writer.dropped, frame)
+
+    def _log_media(self, results, frame):
+        for result in results:
+            if result['error'] is not None:
+                print(f'Failed to write video for epoch {result["epoch_num"]}: {result["error"]}')
+                continue
+            if self.writer is not None:
+                self.writer.add_scalar('media/encode_time', result['encode_time'], frame)
+            if wandb.run is not None:
+                phase, files = result['phase'], result['files']
+                wandb.log({'execution' + phase: [wandb.Video(files['execution'], fps=10, format="mp4")]})
+                wandb.log({'start' + phase: [wandb.Image(files['start'])]})
+                wandb.log({'end' + phase: [wandb.Image(files['end'])]})
+
+    def close(self):
+        """ waits for the videos that are still being encoded """
+        if self.media_writer is not None:
+            self._log_media(self.media_writer.close(), self.algo.frame if self.algo is not None else 0)
+
 
 class MultiObserver(AlgoObserver):
     """Meta-observer that allows the user to add several observers."""
@@ -295,6 +374,17 @@ class MultiObserver(AlgoObserver):
     def process_infos(self, infos, done_indices):
         self._call_multi('process_infos', infos, done_indices)
 
+    def process_infos_mask(self, infos, done_mask):
+        # observers without the mask interface get the indices, found once for all of them
+        done_indices = None
+        for o in self.observers:
+            if hasattr(o, 'process_infos_mask'):
+                o.process_infos_mask(infos, done_mask)
+            else:
+                if done_indices is None:
+                    done_indices = done_mask.nonzero(as_tuple=False)
+                o.process_infos(infos, done_indices)
+
     def after_steps(self):
         self._call_multi('after_steps')
 
@@ -304,6 +394,12 @@ class MultiObserver(AlgoObserver):
     def after_print_stats(self, frame, epoch_num, total_time, phase=''):
         self._call_multi('after_print_stats', frame, epoch_num, total_time, phase=phase)
 
+    def after_evaluation(self, result, epoch_num):
+        # not part of the rl_games AlgoObserver interface
+        for o in self.observers:
+            if hasattr(o, 'after_evaluation'):
+                o.after_evaluation(result, epoch_num)
+
 
 class RLGPUEnv(vecenv.IVecEnv):
     def __init__(self, config_name, num_actors, **kwargs):
@@ -541,4 +637,4 @@ def save_cmd(base_dir):
   print('Training command:\n' + train_cmd)
   print('*' * 80 + '\n')
   with open(base_dir / "cmd.txt", "w") as f:
-    f.write(train_cmd)
\ No newline at end of file
+    f.write(train_cmd)